@@ -1,13 +1,23 @@
 from nicegui import ui, app
 from datetime import datetime, timedelta
+import os
 import uuid
 import secrets
 import random
 from utilities.utils import initialize_users
-from utilities.database import UserDB
+from utilities.slots import user_slots
+from utilities.pool_log import user_pool_log
+from utilities.shared_pool import shared_pool
+from utilities.admission import admission_queue
+from nicegui import background_tasks
+from utilities import metrics
+from utilities.async_database import async_user_db
+from utilities.persistence import conversation_writer
+from utilities.analytics import analytics
 from pages.admin import admin_page
+from pages.search import search_page
 from pages.home1 import home1
-from pages.langflow_chat import chat_page
+from pages.langflow_chat import chat_page, langflow_client
 
 
 @ui.page('/')
@@ -37,28 +47,74 @@ def home():
         ui.html('<strong>Aviso de Privacidad</strong>: Las conversaciones en este sitio son almacenadas de manera anónima con el propósito exclusivo de analizar los intereses de los participantes y mejorar el desarrollo de experiencias de conocimiento. Toda la información recopilada es para uso interno y no será compartida con terceros.').classes('text-body2 q-mb-md text-justify')
 
       
+# p95 LangFlow latency above which the user pool stops growing
+LANGFLOW_TARGET_LATENCY = float(os.environ.get("LANGFLOW_TARGET_LATENCY", "30"))
+
+
+@app.get('/metrics')
+def metrics_snapshot():
+    # Counters, gauges and latency summaries of the chat, LangFlow and database subsystems
+    return metrics.snapshot()
+
+
 @app.on_shutdown
-def shutdown():
+async def shutdown():
     # This code runs when the app is shutting down
     print("Application is shutting down...")
-    # Clean up resources, close connections, etc.
-    # Cleanup code here
-    pass
+    # Flush conversations that are still waiting to be saved
+    await conversation_writer.stop()
+    if shared_pool is not None:
+        await shared_pool.release_all()
+    await async_user_db.close()
+    # Close the pooled LangFlow connections
+    await langflow_client.close()
+    # Save the last pool changes
+    if shared_pool is None:
+        user_slots.persist(user_pool_log)
+        user_pool_log.close()
 
 
 @app.on_startup
-def on_startup():
+async def on_startup():
     print("Starting up...")
 
-    app.storage.general['user_list'] = initialize_users()
+    app.storage.general.pop('user_list', None)
+    if shared_pool is None:
+        # Keep the usernames of the previous run: from the pool's change log, or a snapshot in the old general storage
+        legacy_snapshot = app.storage.general.pop('user_pool', None)
+        snapshot = user_pool_log.load() or legacy_snapshot
+        if snapshot:
+            user_slots.restore(snapshot)
+        else:
+            user_slots.rebuild(initialize_users(admission_queue.min_size))
+        background_tasks.create(user_slots.persist_periodically(user_pool_log))
+    background_tasks.create(user_slots.reap_periodically())
+    # Size the pool to demand, but only grow it while LangFlow keeps up
+    admission_queue.has_headroom = lambda: langflow_client.has_headroom(LANGFLOW_TARGET_LATENCY)
+    if shared_pool is None:
+        background_tasks.create(admission_queue.run())
+    # With several LangFlow nodes, take failing ones out of rotation (a single node has nowhere to fail over)
+    if len(langflow_client.backends) > 1:
+        background_tasks.create(langflow_client.check_health_periodically())
     print("Initializing users...")
 
-    # Initialize database
-    print("Initializing database...")
-    user_db = UserDB()
-    user_db._init_db()
-    print("Database initialized")
+    # Connect and migrate the schema in the background: pages are served meanwhile, and an unreachable
+    # database is retried instead of stopping the rest of the startup
+    background_tasks.create(async_user_db.warm_up())
+
+    conversation_writer.start()
+    # Keep the admin activity rollups current
+    background_tasks.create(analytics.refresh_periodically())
+    if shared_pool is not None:
+        # Several processes share the user slots: this one claims its share from Postgres
+        background_tasks.create(shared_pool.run())
 
 
-secret_key = secrets.token_hex(32)
-ui.run(title='SV Exploration', port=8080, favicon='static/favicon.svg', storage_secret=secret_key) 
+# Every process behind the load balancer must sign browser storage with the same secret, and keep it across restarts
+secret_key = os.environ.get("STORAGE_SECRET")
+if not secret_key:
+    print("STORAGE_SECRET is not set: browser sessions will not survive a restart or work across several processes")
+    secret_key = secrets.token_hex(32)
+# Run one process per PORT (each with its own NICEGUI_STORAGE_PATH) behind a sticky load balancer, see the README
+ui.run(title='SV Exploration', host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", "8080")),
+       reload=os.environ.get("RELOAD", "true").lower() == "true", favicon='static/favicon.svg', storage_secret=secret_key) 
@@ -1,53 +1,68 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
 from nicegui import ui, app
 from utilities.utils import initialize_users, update_user_status
+from utilities.slots import user_slots
+from utilities.admission import admission_queue
+from utilities.shared_pool import shared_pool
+from utilities.response_cache import response_cache
+from utilities.slot_table import SlotTable
+from utilities.analytics import analytics
+from utilities.async_database import async_user_db
+from utilities.export import conversation_records, gzip_jsonl
+from utilities.admin_auth import is_admin, require_admin
 
 @ui.page('/admin')
-def admin_page():
+def admin_page(request: Request, token: str = ''):
     with ui.column().classes('w-full items-center'):
         ui.label('Welcome to SV Exploration Admin Page!').classes('text-h4 q-mb-md')
 
         with ui.column().classes('w-full items-center'):
             ui.label('List of Users').classes('text-h5 q-my-md text-center')
+            if shared_pool is not None:
+                ui.label(f'Slots of worker {shared_pool.worker_id}; the other workers own the rest of the shared pool') \
+                    .classes('text-md')
 
         # Create table reference
         table = None
 
         def refresh_table():
-            nonlocal table
             if table:
-                table.rows = list(app.storage.general.get('user_list', {}).values())
-                table.update()
+                table.load()
+            reclaimed_label.text = f'Expired leases reclaimed: {int(user_slots.reclaimed.value)}'
 
         def rebuild_users():
-            app.storage.general['user_list'] = initialize_users()
+            user_slots.rebuild(initialize_users(admission_queue.min_size))
             ui.notify('User list has been rebuilt')
             refresh_table()
-            ui.run_javascript('window.dispatchEvent(new Event("admin-page-update"))')
 
         def reset_users():
-            for user in app.storage.general['user_list'].values():
-                user['logged'] = False
-                user['time_logged'] = None
+            user_slots.reset()
             ui.notify('All users have been reset')
             refresh_table()
-            ui.run_javascript('window.dispatchEvent(new Event("admin-page-update"))')
 
+        async def flush_cache():
+            await response_cache.clear()
+            ui.notify('Response cache has been flushed')
+
+        with ui.row().classes('w-full justify-center gap-4 q-mb-md'):
+            reclaimed_label = ui.label(f'Expired leases reclaimed: {int(user_slots.reclaimed.value)}').classes('text-md')
         with ui.row().classes('w-full justify-center gap-4 q-mb-md'):
-            ui.button('Rebuild User List', on_click=rebuild_users).classes('bg-green-500 text-white')
+            ui.button('Refresh', on_click=lambda: refresh_table()).classes('bg-blue-500 text-white')
+            if shared_pool is None:
+                # A shared pool's usernames come from Postgres
+                ui.button('Rebuild User List', on_click=rebuild_users).classes('bg-green-500 text-white')
             ui.button('Reset All Users', on_click=reset_users).classes('bg-red-500 text-white')
+            ui.button('Flush Response Cache', on_click=flush_cache).classes('bg-orange-500 text-white')
+            ui.button('Search Conversations', on_click=lambda: ui.navigate.to('/admin/search')).classes('bg-blue-500 text-white')
 
         with ui.card().classes('w-full max-w-3xl mx-auto shadow-lg'):
-            columns = [
-                {'name': 'username', 'label': 'User Name', 'field': 'username'},
-                {'name': 'time_logged', 'label': 'Date & Time', 'field': 'time_logged'},
-                {'name': 'logged', 'label': 'Logged', 'field': 'logged'}
-            ]
-            
-            # Store table reference
-            table = ui.table(
-                columns=columns,
-                rows=list(app.storage.general.get('user_list', {}).values()),
-            )
+            # Paged on the server, changed rows are pushed live
+            table = SlotTable(user_slots)
 
         # # Add event listener for updates from other pages
         # ui.add_body_html('''
@@ -58,9 +73,109 @@ def admin_page():
         #     </script>
         # ''')
 
+        ui.separator().classes('w-full q-my-md')
+        analytics_section()
+
+        ui.separator().classes('w-full q-my-md')
+        export_section(is_admin(request, token))
+
         ui.separator().classes('w-full q-my-md')
         ui.button('Return to Home', on_click=lambda: ui.navigate.to('/')).classes('bg-blue-500 text-white')
 
+
+def analytics_section():
+    """Activity charts read from the analytics rollups."""
+    ui.label('Activity').classes('text-h5 q-my-md text-center')
+    summary_label = ui.label('Loading...').classes('text-md')
+    with ui.row().classes('w-full justify-center'):
+        hourly_chart = ui.echart({
+            'title': {'text': 'Last 48 hours'},
+            'tooltip': {'trigger': 'axis'},
+            'legend': {'bottom': 0},
+            'xAxis': {'type': 'category', 'data': []},
+            'yAxis': {'type': 'value'},
+            'series': [
+                {'name': 'Sessions started', 'type': 'bar', 'data': []},
+                {'name': 'Active users', 'type': 'line', 'data': []},
+                {'name': 'Avg user message (chars)', 'type': 'line', 'data': []},
+            ],
+        }).classes('w-full max-w-3xl h-80')
+        turns_chart = ui.echart({
+            'title': {'text': 'Turns per session, last 7 days'},
+            'tooltip': {'trigger': 'axis'},
+            'xAxis': {'type': 'category', 'data': []},
+            'yAxis': {'type': 'value'},
+            'series': [{'name': 'Sessions', 'type': 'bar', 'data': []}],
+        }).classes('w-full max-w-3xl h-80')
+
+    async def load():
+        try:
+            summary = await analytics.summary()
+            hourly = await analytics.hourly()
+            turns = await analytics.turns_per_session()
+        except Exception as e:
+            summary_label.text = f'Analytics are not available: {e}'
+            return
+        summary_label.text = (f"Last 7 days: {summary['sessions']} sessions, {summary['users']} users, "
+                              f"{summary['avg_turns']:.1f} turns per session, "
+                              f"{summary['avg_message_chars']} characters per message")
+        hourly_chart.options['xAxis']['data'] = [row['hour'].strftime('%d %H:00') for row in hourly]
+        hourly_chart.options['series'][0]['data'] = [row['sessions_started'] for row in hourly]
+        hourly_chart.options['series'][1]['data'] = [row['active_users'] for row in hourly]
+        hourly_chart.options['series'][2]['data'] = [row['avg_user_chars'] or 0 for row in hourly]
+        hourly_chart.update()
+        turns_chart.options['xAxis']['data'] = [row['turns'] for row in turns]
+        turns_chart.options['series'][0]['data'] = [row['sessions'] for row in turns]
+        turns_chart.update()
+
+    ui.button('Refresh Activity', on_click=load).classes('bg-blue-500 text-white')
+    ui.timer(0.1, load, once=True)
+
+def export_section(admin: bool):
+    """Download all conversations, or those saved in a date range, as gzip-compressed JSON lines."""
+    ui.label('Export Conversations').classes('text-h5 q-my-md text-center')
+    if not admin:
+        # The download reuses the token this browser remembered from an /admin?token=... visit
+        ui.label('Open this page as /admin?token=<ADMIN_TOKEN> to export conversations').classes('text-md')
+        return
+    with ui.row().classes('w-full justify-center items-center gap-4'):
+        start_input = ui.input('From (YYYY-MM-DD)').props('type=date')
+        end_input = ui.input('To (YYYY-MM-DD)').props('type=date')
+
+        def download():
+            params = {key: value for key, value in (('start', start_input.value), ('end', end_input.value)) if value}
+            ui.download.from_url(f'/admin/export?{urlencode(params)}')
+
+        ui.button('Download JSONL.gz', on_click=download).classes('bg-green-500 text-white')
+
+
+def parse_day(value: Optional[str], name: str) -> Optional[datetime]:
+    """A YYYY-MM-DD query parameter, or 400 when it is not a valid date."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f'{name} must be a date as YYYY-MM-DD')
+
+
+@app.get('/admin/export')
+async def export_conversations(request: Request, start: Optional[str] = None, end: Optional[str] = None,
+                               token: str = ''):
+    # Every stored conversation is in here, so only for admins, checked before the cursor is opened
+    require_admin(request, token)
+    start_day, end_day = parse_day(start, 'start'), parse_day(end, 'end')
+    # Streamed from a server-side cursor through gzip, so memory stays flat however many conversations there are
+    start_time = start_day or datetime.min
+    end_time = end_day + timedelta(days=1) if end_day else datetime.max
+    filename = f"conversations_{start or 'all'}_{end or 'now'}.jsonl.gz"
+    return StreamingResponse(
+        gzip_jsonl(conversation_records(async_user_db.export_rows(start_time, end_time))),
+        media_type='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
 def logout_session(username):
     # Trigger admin page refresh when button is clicked
     ui.run_javascript('window.dispatchEvent(new Event("admin-page-update"))')
@@ -1,13 +1,24 @@
 from nicegui import ui, app
-import requests
+import asyncio
 import json
+import weakref
 from datetime import datetime
 import os
-from typing import List, Optional
+from typing import Callable, List, Optional
 import uuid
 from dotenv import load_dotenv
-from utilities.database import user_db
-from utilities.utils import find_user_from_pool, update_user_status
+from utilities import metrics
+from utilities.persistence import conversation_writer
+from utilities.utils import hold_user_lease
+from utilities.slots import user_slots
+from utilities.admission import admission_queue, format_wait
+from utilities.langflow_backends import create_langflow_backends
+from utilities.governor import BackendBusy
+from utilities.langflow_client import LangFlowTimeout
+from utilities.chat_view import ChatView
+from utilities.response_cache import response_cache
+from utilities.history_window import history_window
+from utilities.session_store import ChatSession, session_store
 
 #example of linkk
 #        ui.link('Share Your Dreams', '/chat').props('flat color=primary')
@@ -22,16 +33,34 @@ FLOW_ID = os.environ.get("FLOW_ID")
 APPLICATION_TOKEN = os.environ.get("APPLICATION_TOKEN")
 ENDPOINT = os.environ.get("ENDPOINT")
 
-def run_flow(message: str, history: Optional[List[dict]] = None) -> dict:
-    """Run the LangFlow with the given message and conversation history."""
-    api_url = f"{BASE_API_URL}/api/v1/run/{ENDPOINT}"
-    
-    # Get the current session ID and username from storage
-    session_id = app.storage.browser.get('session_id', str(uuid.uuid4()))
-    username = app.storage.browser.get('username', 'User')
+# Streaming settings: stream tokens into the chat, refreshing it at most every STREAM_UPDATE_INTERVAL seconds
+STREAM_RESPONSES = os.environ.get("LANGFLOW_STREAM", "true").lower() == "true"
+STREAM_UPDATE_INTERVAL = float(os.environ.get("STREAM_UPDATE_INTERVAL", "0.1"))
+
+# Send the (token-budgeted) conversation history with every turn instead of relying on LangFlow's own memory
+SEND_HISTORY = os.environ.get("LANGFLOW_SEND_HISTORY", "false").lower() == "true"
+
+# Shared async clients, one per LangFlow node; all chats reuse their pools of keep-alive connections
+langflow_client = create_langflow_backends()
+
+# Held while a session's turn runs, so a second turn cannot interleave its messages with the first one's
+turn_locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+# Turns and downloads that failed with an unexpected error, after the visitor was shown the generic notice
+chat_failures = metrics.counter('chat_failures_total')
+
+async def run_flow(message: str, session: ChatSession, history: Optional[List[dict]] = None,
+                   on_token: Optional[Callable[[str], None]] = None) -> dict:
+    """Run the LangFlow with the given message and conversation history of `session`.
+
+    The history is cut down to the recent turns that fit the token budget, plus a summary of older ones.
+    When `on_token` is given the streaming endpoint is used and each partial token is passed to it.
+    """
+    session_id = session.session_id
+    username = session.username
     
     if history and len(history) > 0:
-        formatted_history = json.dumps(history)
+        formatted_history = json.dumps(history_window.window(session_id, history))
         payload = {
             "input_value": message,
             "output_type": "chat",
@@ -49,94 +78,124 @@ def run_flow(message: str, history: Optional[List[dict]] = None) -> dict:
             "session_id": session_id
         }
 
-
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": APPLICATION_TOKEN  # Authentication key from environment variable
-    }    
-    try:
-        response = requests.post(api_url, json=payload, headers=headers, timeout=60)
-        response_data = response.json()
-        return response_data
-    except requests.Timeout:
-        raise Exception("Request timed out. Please try again.")
-    except Exception as e:
-        raise e
+    if on_token is not None:
+        return await langflow_client.stream(payload, on_token)
+    return await langflow_client.run(payload)
 
 
 
 """Add a message to the conversation history."""
-def add_to_history(role: str, content: str, agent: str = "Unknown User", session_id: str = ""):
+def add_to_history(session: ChatSession, role: str, content: str):
     message = {
         "role": role,
         "content": content,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "agent": agent
+        "agent": session.username
     } 
-    app.storage.browser['conversation_history'].append(message)
+    session_store.append(session, message)
 
-def display_conversation(conversation_history_txt, chat_display):
-    # Build the complete content
-    content = ""
-    for message in conversation_history_txt:
-        content += f'**{message["role"]}:** {message["content"]}\n\n'
-    # Set the content once
-    chat_display.content = content
-
-
-def send_message(chat_display, message_input, session_id):
+async def send_message(chat_view: ChatView, message_input, send_button, session_id: str, username: str):
     if not message_input.value:
         return
-    
+    lock = turn_locks.setdefault(session_id, asyncio.Lock())
+    if lock.locked():
+        return  # the message stays in the input until the running turn is over
+    async with lock:
+        send_button.disable()
+        try:
+            await take_turn(chat_view, message_input, session_id, username)
+        finally:
+            send_button.enable()
+
+async def take_turn(chat_view: ChatView, message_input, session_id: str, username: str):
+    answered = False
+    user_message = None
     try:
+        # Paged in from the database when the store evicted it, which can fail like any other step of the turn
+        session = await session_store.get(session_id, username)
+        history = session.history
+        first_seq = len(history)  # position of this turn's messages in the history
+
         # Store message before clearing input
         user_message = message_input.value.strip()
         message_input.value = ''  # Clear input early for better UX
         
-        # Add user message and update display
-        add_to_history(role='user', content=user_message, agent=app.storage.browser.get("username", "Unknown User"), session_id=session_id)
-        display_conversation(app.storage.browser['conversation_history'], chat_display)
+        # Add user message and append it to the display
+        add_to_history(session, role='user', content=user_message)
+        user_entry = history[-1]
+        user_element = chat_view.append(user_entry)
         
         # Show loading spinner
         loading = ui.spinner('dots').classes('text-primary')
+        streaming = chat_view.stream('assistant', STREAM_UPDATE_INTERVAL) if STREAM_RESPONSES else None
         
         try:
             # Get and add assistant response
-            response = run_flow(user_message)
+            on_token = streaming.on_token if streaming else None
+            prior = history[:first_seq]
+            if not prior:
+                # First turns repeat a lot (suggested questions, greetings), so they share cached answers
+                response = await response_cache.get_or_run(user_message, None, lambda: run_flow(user_message, session, on_token=on_token))
+            elif SEND_HISTORY or any(message.get("cached") for message in prior):
+                # LangFlow never saw a cached turn, so send it the conversation so far
+                response = await run_flow(user_message, session, prior, on_token=on_token)
+            else:
+                response = await run_flow(user_message, session, on_token=on_token)
             if response and "outputs" in response and len(response["outputs"]) > 0:
                 assistant_message = response["outputs"][0]["outputs"][0]["results"]["message"]["text"]
-                add_to_history(role='assistant', content=assistant_message, agent=app.storage.browser.get("username", "Unknown User"), session_id=session_id)
-                display_conversation(app.storage.browser['conversation_history'], chat_display)
+                add_to_history(session, role='assistant', content=assistant_message)
+                if response.get("cached"):
+                    history[-1]["cached"] = True
+                if streaming:
+                    streaming.finish(assistant_message)
+                    streaming = None
+                else:
+                    chat_view.append(history[-1])
+                answered = True
                 
-                # Save conversation to database
-                save_db()
+                # Queue the new messages of this turn for saving to the database
+                await save_db(session, first_seq, [user_entry, history[-1]])
             else:
                 ui.notify('Invalid response from server', type='warning')
         finally:
             loading.delete()  # Ensure spinner is removed
+            if streaming:
+                streaming.discard()  # Drop the partial answer of a failed request
+            if not answered:
+                # The message is restored to the input, so take it out of the history until it is resent
+                session_store.truncate(session, first_seq)
+                user_element.delete()
+                message_input.value = user_message
             
+    except BackendBusy as e:
+        # LangFlow is overloaded or down: say so instead of showing the error
+        ui.notify(str(e), type='warning')
+    except LangFlowTimeout:
+        ui.notify('Lucy is taking too long to answer. Please send your message again.', type='warning')
     except Exception as e:
-        ui.notify(f'Error: {str(e)}', type='negative')
-        message_input.value = user_message  # Restore message on error
+        chat_failures.inc()
+        print(f"Chat turn of session {session_id} failed: {e!r}")
+        ui.notify('Sorry, Lucy could not answer this time. Please send your message again.', type='negative')
+        if not answered and user_message is not None:
+            message_input.value = user_message  # Restore message on error
 
 
 
 @ui.page('/chat')
-def chat_page():
+def chat_page(ticket: str = ''):
+    # Take a free user slot, the one reserved for this visitor's ticket, or wait in line
+    username = admission_queue.claim(ticket) if ticket else admission_queue.try_admit()
+    if username is None:
+        if not ticket or admission_queue.position(ticket) is None:
+            ticket = admission_queue.join()
+        waiting_room(ticket)
+        return
+    lease_token = hold_user_lease(username)
+
+    # The history lives in the server-side session store; the browser only keeps the session id
     session_id = str(uuid.uuid4())
     app.storage.browser['session_id'] = session_id
-    app.storage.browser['conversation_history'] = []
-
-    username = find_user_from_pool()
-    app.storage.browser['username'] = username
-
-    if username == -1:    
-        with ui.dialog() as error_dialog:
-            with ui.card():
-                ui.label(f'No users available at this time, try again later').classes('text-h6 q-mb-md')
-                with ui.row().classes('w-full justify-end gap-2'):
-                    ui.button('Go Back', on_click=lambda: ui.navigate.to('/')).classes('bg-gray-500 text-white')
-        error_dialog.open()
+    session_store.create(session_id, username)
 
 
     # Main content
@@ -149,10 +208,10 @@ def chat_page():
         with ui.row().classes('w-full bg-gray-100 p-4 rounded-md justify-center'):
             ui.button('Return to Home', on_click=lambda: ui.navigate.to('/')).classes('bg-blue-500 text-white')
             ui.button('Suggested Questions', on_click=lambda: questions_dialog.open()).classes('bg-blue-500 text-white')
-            ui.button('Logout', on_click=logout_session).classes('bg-blue-500 text-white')
+            ui.button('Logout', on_click=lambda: logout_session(session_id, username, lease_token)).classes('bg-blue-500 text-white')
         with ui.row().classes('w-full bg-gray-100 p-4 rounded-md'):
-            ui.label(f'User: {app.storage.browser.get("username")}').classes('text-md')
-            ui.label(f'Session: {app.storage.browser["session_id"]}').classes('text-md')
+            ui.label(f'User: {username}').classes('text-md')
+            ui.label(f'Session: {session_id}').classes('text-md')
 
         # Questions Dialog
         with ui.dialog() as questions_dialog:
@@ -165,22 +224,65 @@ def chat_page():
                 with ui.row().classes('w-full justify-end'):
                     ui.button('Close', on_click=questions_dialog.close).classes('bg-blue-500 text-white')
 
+        # Shown while LangFlow is turning requests away
+        with ui.row().classes('w-full bg-yellow-100 p-2 rounded-md justify-center') \
+                .bind_visibility_from(langflow_client, 'busy'):
+            ui.label('Lucy is very busy right now, answers may take a moment. Your message will not be lost.').classes('text-md')
+
         # Chat display
-        chat_display = ui.markdown('').classes('w-full h-64 border rounded-lg p-4 overflow-auto')
+        chat_view = ChatView()
         
         # Message input
         message_input = ui.textarea('Type your message here...').classes('w-full h-50 mb-1')
 
-        # Send button
-        ui.button('Send', on_click=lambda: send_message(chat_display, message_input, session_id)).classes('w-full')
+        # Send button, disabled while a turn is running
+        send_button = ui.button('Send', on_click=lambda: send_message(chat_view, message_input, send_button, session_id,
+                                                                       username)).classes('w-full')
         
         #with ui.row().classes('w-full max-w-5xl mx-auto p-2 justify-center gap-4'):
-            #ui.button('Download a Files', on_click=download_file).classes('bg-blue-500 text-white')
+            #ui.button('Download a Files', on_click=lambda: download_file(session_id, username)).classes('bg-blue-500 text-white')
             #ui.button('Save DB', on_click=save_db).classes('bg-blue-500 text-white')
 
-def logout_session():
+def waiting_room(ticket: str):
+    """Show the visitor their place in line until a user slot is reserved for them."""
+    admitted = False
+
+    with ui.dialog().props('persistent') as dialog:
+        with ui.card():
+            ui.label(f'No users available at this time, you are in line').classes('text-h6 q-mb-md')
+            position_label = ui.label().classes('text-md')
+            wait_label = ui.label().classes('text-md')
+            with ui.row().classes('w-full justify-end gap-2'):
+                ui.button('Go Back', on_click=lambda: ui.navigate.to('/')).classes('bg-gray-500 text-white')
+
+    def update_position():
+        nonlocal admitted
+        if ticket in admission_queue.reserved:
+            admitted = True
+            timer.deactivate()
+            ui.navigate.to(f'/chat?ticket={ticket}')
+            return
+        position = admission_queue.position(ticket)
+        if position is not None:
+            position_label.text = f'Your position: {position}'
+            wait_label.text = f'Estimated wait: {format_wait(admission_queue.estimated_wait(position))}'
+
+    def leave_line():
+        if not admitted:
+            admission_queue.cancel(ticket)
+
+    timer = ui.timer(1.0, update_position)
+    ui.context.client.on_disconnect(leave_line)
+    update_position()
+    dialog.open()
+
+
+def logout_session(session_id: str, username: str, lease_token: Optional[int]):
     def confirm_logout():
-        update_user_status(app.storage.browser['username'], False)
+        if lease_token is not None:
+            user_slots.release(username, token=lease_token)  # not the lease of whoever holds the username now
+        history_window.forget(session_id)
+        session_store.discard(session_id)
         
         # Navigate to home page
         ui.navigate.to('/')
@@ -195,40 +297,30 @@ def logout_session():
     dialog.open()
 
 
-def download_file():
+async def download_file(session_id: str, username: str):
     import json
     from datetime import datetime
     
+    try:
+        session = await session_store.get(session_id, username)
+    except Exception as e:
+        chat_failures.inc()
+        print(f"Loading session {session_id} for download failed: {e!r}")
+        ui.notify('Sorry, the conversation could not be loaded. Please try again.', type='negative')
+        return
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"conversation_{app.storage.browser.get('username', 'user')}_{timestamp}.json"
+    filename = f"conversation_{session.username}_{timestamp}.json"
     
     # Convert conversation history to JSON string with proper encoding
-    content = json.dumps(app.storage.browser['conversation_history'], 
+    content = json.dumps(session.history, 
                         ensure_ascii=False, 
                         indent=2)
     
     # Create download link
     ui.download(content.encode('utf-8'), filename)
 
-def save_db():
-    session_id = app.storage.browser['session_id']
-    username = app.storage.browser.get('username', 'Unknown User')
-    # Convert to JSON string with double quotes
-    conversation = json.dumps(app.storage.browser['conversation_history'], 
-                            ensure_ascii=False, 
-                            indent=2)
-    
-    # Check if conversation exists
-    existing_conversation = user_db.get_conversation(session_id)
-    
-    if existing_conversation:
-        # Update existing conversation
-        success = user_db.update_conversation(session_id, conversation)
-        ui.notify('Conversation updated' if success else 'Update failed')
-    else:
-        # Create new conversation
-        success = user_db.create_conversation(session_id, username, conversation)
-        ui.notify('Conversation saved' if success else 'Save failed')
-
-        
+async def save_db(session: ChatSession, first_seq: int, messages: List[dict]):
+    """Queue a turn's `messages`, which sit at position `first_seq` of the history, for saving to the database."""
+    # Written by the background worker, coalesced with other pending saves of this session
+    await conversation_writer.enqueue(session.session_id, session.username, first_seq, messages)
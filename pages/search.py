@@ -0,0 +1,64 @@
+import html
+
+from fastapi import Request
+from nicegui import ui
+
+from utilities.admin_auth import require_admin
+from utilities.async_database import FIRST_SEARCH_PAGE, async_user_db
+from utilities.chat_view import ChatView
+
+
+def highlight(snippet: str) -> str:
+    """Escape a search snippet and turn its [[[ ]]] markers into <mark> tags."""
+    return html.escape(snippet).replace('[[[', '<mark>').replace(']]]', '</mark>')
+
+
+@ui.page('/admin/search')
+def search_page(request: Request, token: str = ''):
+    # Shows stored conversations, so only for admins, like the export
+    require_admin(request, token)
+    cursor = FIRST_SEARCH_PAGE
+
+    with ui.column().classes('w-full max-w-4xl mx-auto p-4'):
+        ui.label('Search Conversations').classes('text-h4 q-mb-md')
+        with ui.row().classes('w-full items-center gap-2'):
+            query_input = ui.input('Words or "exact phrase", -word to exclude').classes('flex-grow')
+            ui.button('Search', on_click=lambda: search(new=True)).classes('bg-blue-500 text-white')
+        results = ui.column().classes('w-full gap-2')
+        more_button = ui.button('Load more', on_click=lambda: search(new=False)).classes('bg-gray-500 text-white')
+        more_button.visible = False
+        ui.button('Return to Admin', on_click=lambda: ui.navigate.to('/admin')).classes('bg-blue-500 text-white')
+
+    query_input.on('keydown.enter', lambda: search(new=True))
+
+    async def show_conversation(session_id: str):
+        history = await async_user_db.get_history(session_id)
+        with ui.dialog() as dialog, ui.card().classes('w-full max-w-3xl'):
+            ui.label(f'Session: {session_id}').classes('text-md')
+            ChatView().extend(history)
+            ui.button('Close', on_click=dialog.close).classes('bg-blue-500 text-white')
+        dialog.open()
+
+    async def search(new: bool):
+        nonlocal cursor
+        query = (query_input.value or '').strip()
+        if not query:
+            return
+        if new:
+            cursor = FIRST_SEARCH_PAGE
+            results.clear()
+        try:
+            rows, cursor = await async_user_db.search_messages(query, after=cursor)
+        except Exception as e:
+            ui.notify(f'Search failed: {e}', type='negative')
+            return
+        with results:
+            if new and not rows:
+                ui.label('No conversations found').classes('text-md')
+            for row in rows:
+                with ui.card().classes('w-full cursor-pointer') \
+                        .on('click', lambda _, session_id=row['session_id']: show_conversation(session_id)):
+                    ui.label(f"{row['username']} · {row['created_at']:%Y-%m-%d %H:%M} · {row['role']}") \
+                        .classes('text-sm text-gray-600')
+                    ui.html(highlight(row['snippet']))
+        more_button.visible = cursor is not None
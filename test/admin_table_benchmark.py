@@ -0,0 +1,104 @@
+"""Websocket payload and server time of an /admin table refresh with 10k slots.
+
+Compares the old table, which was refilled with every slot on each refresh, with SlotTable, which
+sends one server-side page and pushes only the changed rows that are on it. Payload bytes are the JSON of
+the element updates and messages (the row patches) NiceGUI's outbox would emit.
+Run with: python test/admin_table_benchmark.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from nicegui import Client, core, ui
+from nicegui.outbox import Deleted
+from nicegui.page import page
+
+from utilities.slot_table import COLUMNS, SlotTable
+from utilities.slots import SlotAllocator
+
+SLOTS = 10_000
+LEASED = 3_000
+REFRESHES = 20
+
+
+def pending_payload(client: Client) -> int:
+    """Size of the update and other messages the outbox would send, then forget them."""
+    updates = {element_id: None if isinstance(element, Deleted) else element._to_dict()
+               for element_id, element in client.outbox.updates.items()}
+    messages = [data for _, _, data in client.outbox.messages]
+    client.outbox.updates.clear()
+    client.outbox.messages.clear()
+    return len(json.dumps(updates, default=str).encode()) + len(json.dumps(messages, default=str).encode())
+
+
+async def measure(client: Client, refresh) -> tuple:
+    await asyncio.sleep(0)
+    pending_payload(client)
+    payload = seconds = 0
+    for _ in range(REFRESHES):
+        start = time.perf_counter()
+        with client:
+            refresh()
+        seconds += time.perf_counter() - start
+        await asyncio.sleep(0)  # JavaScript calls are queued by a background task
+        payload += pending_payload(client)
+    return payload / REFRESHES, seconds / REFRESHES
+
+
+def report(name: str, payload: float, seconds: float):
+    print(f"{name:<34}{payload:>14,.0f}{seconds * 1000:>12.2f}")
+
+
+async def main():
+    core.loop = asyncio.get_running_loop()  # run_javascript queues its message from a background task
+    slots = SlotAllocator()
+    slots.rebuild(f"user_{i:05d}" for i in range(SLOTS))
+    for _ in range(LEASED):
+        slots.lease()
+    print(f"{SLOTS:,} slots, {LEASED:,} leased")
+    print(f"{'refresh':<34}{'bytes':>14}{'ms':>12}")
+
+    client = Client(page('/'))
+    with client:
+        table = ui.table(columns=COLUMNS, rows=slots.rows())
+
+    def full_refresh():
+        table.rows = slots.rows()
+        table.update()
+
+    report('full table, any refresh', *await measure(client, full_refresh))
+
+    client = Client(page('/'))
+    with client:
+        slot_table = SlotTable(slots)
+    report('SlotTable, page reload', *await measure(client, slot_table.load))
+
+    def sorted_by_age():
+        slot_table.table.pagination = {**slot_table.table.pagination, 'sortBy': 'lease_age', 'page': 7}
+        slot_table.load()
+
+    report('SlotTable, sorted page 7', *await measure(client, sorted_by_age))
+    slot_table.table.pagination = {**slot_table.table.pagination, 'sortBy': 'username', 'page': 1}
+    with client:
+        slot_table.load()
+
+    def visible_release():
+        slots.release('user_00003')
+        slots.acquire('user_00003')
+        slot_table.push_changes()
+
+    report('SlotTable, visible slot changed', *await measure(client, visible_release))
+
+    def hidden_release():
+        slots.release('user_02000')
+        slots.acquire('user_02000')
+        slot_table.push_changes()
+
+    report('SlotTable, off-page slot changed', *await measure(client, hidden_release))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,411 @@
+"""End-to-end load test of the /chat flow.
+
+Starts main.py against a local mock LangFlow (see mock_langflow.py) and the Postgres of the POSTGRES_* settings,
+then drives chat sessions the way a browser does: load /chat, connect to NiceGUI's socket.io endpoint with the
+page's client id, type each message into the textarea, click Send and wait for the answer over the websocket.
+
+Sessions arrive open-loop, as a Poisson process whose rate follows --profile, however slowly earlier sessions are
+served. A profile is comma-separated stages of `seconds:rate` (constant sessions per second) or `seconds:from-to`
+(a linear ramp). Each session sends --turns messages with exponential think times of mean --think seconds between
+an answer and the next message. Sessions the app sends to the waiting room are counted as queued.
+
+Reports the p50/p95/p99 of the page load (GET /chat), send to reply (Send click until the answer is complete) and
+save latency (answer until the turn is in conversation_messages, only with a reachable Postgres) as JSON, together
+with the app's /metrics, so runs can be compared. --url runs against an already started app instead.
+Run with: python test/chat_load_test.py --profile 30:0.5-5,60:5 --turns 3 --think 5 --output run.json
+"""
+import argparse
+import ast
+import asyncio
+import json
+import os
+import random
+import re
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import psycopg
+import socketio
+from dotenv import load_dotenv
+from psycopg.conninfo import make_conninfo
+
+from mock_langflow import MockLangFlowServer, create_app, free_port
+
+load_dotenv()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+MESSAGES = [
+    "¿Qué empresas de Silicon Valley puedo visitar en una semana?",
+    "Quiero conocer startups de inteligencia artificial en San Francisco",
+    "¿Cuál es la mejor época del año para visitar Stanford?",
+    "¿Cómo organizo reuniones con fondos de capital de riesgo en Sand Hill Road?",
+    "Recomiéndame una agenda de tres días para un grupo de emprendedores",
+]
+
+# (duration in seconds, rate at its start, rate at its end), in sessions per second
+Stage = Tuple[float, float, float]
+
+
+def parse_profile(text: str) -> List[Stage]:
+    stages = []
+    for stage in text.split(','):
+        seconds, rates = stage.split(':')
+        start, _, end = rates.partition('-')
+        stages.append((float(seconds), float(start), float(end or start)))
+    return stages
+
+
+def rate_at(stages: List[Stage], t: float) -> float:
+    for seconds, start, end in stages:
+        if t < seconds:
+            return start + (end - start) * t / seconds
+        t -= seconds
+    return 0.0
+
+
+def arrival_times(stages: List[Stage], rng: random.Random) -> Iterator[float]:
+    """Arrival offsets of a Poisson process whose rate follows the stages, by thinning one at the peak rate."""
+    duration = sum(seconds for seconds, _, _ in stages)
+    peak = max(max(start, end) for _, start, end in stages)
+    t = 0.0
+    while peak > 0:
+        t += rng.expovariate(peak)
+        if t >= duration:
+            return
+        if rng.random() * peak < rate_at(stages, t):
+            yield t
+
+
+def summary(seconds: List[float]) -> dict:
+    if not seconds:
+        return {"count": 0}
+    values = sorted(seconds)
+
+    def percentile(q: float) -> float:
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1)
+
+    return {"count": len(values), "mean_ms": round(sum(values) / len(values) * 1000, 1), "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95), "p99_ms": percentile(0.99), "max_ms": round(values[-1] * 1000, 1)}
+
+
+class LoadStats:
+    def __init__(self):
+        self.sessions = Counter()
+        self.turns = Counter()
+        self.errors = Counter()
+        self.page_load: List[float] = []
+        self.send_to_reply: List[float] = []
+        self.save: List[float] = []
+        self.active = 0
+
+
+def parse_page(html: str) -> Tuple[Dict[str, dict], dict]:
+    """The elements and socket.io query a NiceGUI page hands to nicegui.js."""
+    raw = re.search(r'parseElements\(String\.raw`(.*?)`\)', html, re.S).group(1)
+    for escaped, char in (('&#36;', '$'), ('&#96;', '`'), ('&gt;', '>'), ('&lt;', '<'), ('&amp;', '&')):
+        raw = raw.replace(escaped, char)
+    query = ast.literal_eval(re.search(r'^\s*query: (\{.*\}),$', html, re.M).group(1))
+    return json.loads(raw), query
+
+
+def listener(elements: Dict[str, dict], tag: str, label: str, event: str) -> Optional[Tuple[str, str]]:
+    """(element id, listener id) of the `event` listener of the element with this tag and label."""
+    for element_id, element in elements.items():
+        if element.get('tag') == tag and element.get('props', {}).get('label') == label:
+            for listener_info in element.get('events', []):
+                if listener_info['type'] == event:
+                    return element_id, listener_info['listener_id']
+    return None
+
+
+class ChatClient:
+    """One visitor's /chat page and its socket.io connection, driven like nicegui.js does in the browser."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.cookies = ''
+        self.socket = socketio.AsyncClient(reconnection=False)
+        self.socket.on('update', self._on_update)
+        self.socket.on('notify', self._on_notify)
+        self.spinners = set()
+        self.sent_text = None
+        self.turn: Optional[asyncio.Future] = None
+        self.notices: List[str] = []
+
+    async def load(self) -> bool:
+        """Load the page; False when it is the waiting room."""
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60) as http:
+            response = await http.get('/chat')
+            response.raise_for_status()
+            self.cookies = '; '.join(f'{name}={value}' for name, value in http.cookies.items())
+        elements, self.query = parse_page(response.text)
+        self.textarea = listener(elements, 'nicegui-input', 'Type your message here...', 'update:value')
+        self.send_button = listener(elements, 'q-btn', 'Send', 'click')
+        self.session_id = next((element['text'][len('Session: '):] for element in elements.values()
+                                if str(element.get('text', '')).startswith('Session: ')), None)
+        return self.textarea is not None and self.send_button is not None
+
+    async def connect(self):
+        query = dict(self.query, tab_id=secrets.token_hex(16), document_id=secrets.token_hex(16))
+        query = '&'.join(f'{key}={str(value).lower() if isinstance(value, bool) else value}'
+                         for key, value in query.items())
+        await self.socket.connect(f'{self.base_url}/?{query}', socketio_path='/_nicegui_ws/socket.io',
+                                  transports=['websocket'], headers={'Cookie': self.cookies})
+
+    async def _emit(self, target: Tuple[str, str], args: list):
+        element_id, listener_id = target
+        await self.socket.emit('event', {'id': int(element_id), 'client_id': self.query['client_id'],
+                                         'listener_id': listener_id, 'args': args})
+
+    async def send(self, text: str, timeout: float) -> bool:
+        """Send a message and wait until its answer is complete; False when the app gave the message back."""
+        self.turn = asyncio.get_running_loop().create_future()
+        self.sent_text = text
+        await self._emit(self.textarea, [json.dumps(text)])
+        await self._emit(self.send_button, [])
+        return await asyncio.wait_for(self.turn, timeout)
+
+    def _on_update(self, msg: dict):
+        answered = given_back = False
+        for element_id, element in msg.items():
+            if element_id == '_id':
+                continue
+            if element is None:
+                if element_id in self.spinners:
+                    self.spinners.discard(element_id)
+                    answered = True
+            elif element.get('tag', '').startswith('q-spinner'):
+                self.spinners.add(element_id)
+            elif self.textarea and element_id == self.textarea[0]:
+                # The app clears the textarea on send and puts the message back when the turn fails
+                given_back = element.get('props', {}).get('value') == self.sent_text
+        if (answered or given_back) and self.turn is not None and not self.turn.done():
+            self.turn.set_result(not given_back)
+
+    def _on_notify(self, msg: dict):
+        self.notices.append(msg.get('message', ''))
+
+    async def close(self):
+        await self.socket.disconnect()
+
+
+class SaveTracker:
+    """Polls conversation_messages until the answered turns are saved, timing each from its answer."""
+
+    def __init__(self, conninfo: str, stats: LoadStats, interval: float = 0.05):
+        self.conninfo = conninfo
+        self.stats = stats
+        self.interval = interval
+        self.waiting: Dict[str, List[Tuple[int, float]]] = {}
+
+    def expect(self, session_id: str, messages: int, answered_at: float):
+        self.waiting.setdefault(session_id, []).append((messages, answered_at))
+
+    async def run(self):
+        async with await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True) as conn:
+            while True:
+                if self.waiting:
+                    cursor = await conn.execute('''
+                        SELECT session_id, count(*) FROM conversation_messages
+                        WHERE session_id = ANY(%s) GROUP BY session_id
+                    ''', (list(self.waiting),))
+                    now = time.perf_counter()
+                    for session_id, saved in await cursor.fetchall():
+                        pending = self.waiting[session_id]
+                        while pending and pending[0][0] <= saved:
+                            self.stats.save.append(now - pending.pop(0)[1])
+                        if not pending:
+                            del self.waiting[session_id]
+                await asyncio.sleep(self.interval)
+
+    async def drain(self, timeout: float) -> int:
+        """Wait for the outstanding saves; returns how many turns were still not saved after `timeout` seconds."""
+        deadline = time.perf_counter() + timeout
+        while self.waiting and time.perf_counter() < deadline:
+            await asyncio.sleep(self.interval)
+        return sum(len(pending) for pending in self.waiting.values())
+
+
+async def chat_session(n: int, base_url: str, args, rng: random.Random, stats: LoadStats,
+                       saves: Optional[SaveTracker]):
+    stats.sessions['arrived'] += 1
+    client = ChatClient(base_url)
+    start = time.perf_counter()
+    try:
+        admitted = await client.load()
+        stats.page_load.append(time.perf_counter() - start)
+        if not admitted:
+            stats.sessions['queued'] += 1
+            return
+        stats.sessions['admitted'] += 1
+        await client.connect()
+        stats.active += 1
+        answered = 0
+        for turn in range(args.turns):
+            if turn and args.think > 0:
+                await asyncio.sleep(rng.expovariate(1 / args.think))
+            text = f"{rng.choice(MESSAGES)} (sesión {n}, turno {turn + 1})"  # unique, so no cached answers
+            stats.turns['sent'] += 1
+            sent = time.perf_counter()
+            try:
+                ok = await client.send(text, args.reply_timeout)
+            except asyncio.TimeoutError:
+                stats.turns['timed_out'] += 1
+                stats.errors['no answer within the reply timeout'] += 1
+                break
+            if not ok:
+                stats.turns['failed'] += 1
+                continue
+            answered_at = time.perf_counter()
+            stats.send_to_reply.append(answered_at - sent)
+            stats.turns['answered'] += 1
+            answered += 1
+            if saves is not None and client.session_id:
+                saves.expect(client.session_id, answered * 2, answered_at)
+        stats.sessions['completed'] += 1
+    except Exception as e:
+        stats.sessions['failed'] += 1
+        stats.errors[f'{type(e).__name__}: {e}'[:200]] += 1
+    finally:
+        stats.errors.update(client.notices)
+        if client.socket.connected:
+            stats.active -= 1
+            await client.close()
+
+
+async def report_progress(stats: LoadStats, start: float, interval: float = 5.0):
+    while True:
+        await asyncio.sleep(interval)
+        print(f"{time.perf_counter() - start:6.0f}s  sessions {stats.sessions['arrived']:>5} arrived "
+              f"{stats.active:>4} active  turns {stats.turns['answered']:>6} answered "
+              f"{stats.turns['failed'] + stats.turns['timed_out']:>4} failed", file=sys.stderr)
+
+
+async def run_load(args, base_url: str, conninfo: Optional[str]) -> dict:
+    stats = LoadStats()
+    saves = SaveTracker(conninfo, stats) if conninfo else None
+    background = [asyncio.create_task(report_progress(stats, time.perf_counter()))]
+    if saves:
+        background.append(asyncio.create_task(saves.run()))
+    rng = random.Random(args.seed)
+    sessions = []
+    started_at = datetime.now().isoformat(timespec='seconds')
+    start = time.perf_counter()
+    for n, offset in enumerate(arrival_times(parse_profile(args.profile), rng)):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        session_rng = random.Random(rng.random())
+        sessions.append(asyncio.create_task(chat_session(n, base_url, args, session_rng, stats, saves)))
+    await asyncio.gather(*sessions)
+    unsaved = await saves.drain(args.save_timeout) if saves else None
+    duration = time.perf_counter() - start
+    for task in background:
+        task.cancel()
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+        server_metrics = (await http.get('/metrics')).json()
+    return {
+        "config": {**vars(args), "profile_stages": parse_profile(args.profile)},
+        "started_at": started_at,
+        "duration_s": round(duration, 1),
+        "sessions": dict(stats.sessions),
+        "turns": {**stats.turns, "unsaved": unsaved},
+        "errors": dict(stats.errors.most_common(20)),
+        "latency": {
+            "page_load": summary(stats.page_load),
+            "send_to_reply": summary(stats.send_to_reply),
+            "save": summary(stats.save) if saves else None,
+        },
+        "server_metrics": server_metrics,
+    }
+
+
+def postgres_conninfo() -> Optional[str]:
+    """Connection string of the POSTGRES_* database, or None when it cannot be reached."""
+    conninfo = make_conninfo(host=os.getenv('POSTGRES_HOST'), dbname=os.getenv('POSTGRES_DB'),
+                             user=os.getenv('POSTGRES_USER'), password=os.getenv('POSTGRES_PASSWORD'),
+                             port=os.getenv('POSTGRES_PORT', '5432'), connect_timeout=3)
+    try:
+        psycopg.connect(conninfo).close()
+        return conninfo
+    except psycopg.OperationalError:
+        return None
+
+
+def start_app(args, port: int, langflow_url: str, storage: str, log) -> subprocess.Popen:
+    env = dict(os.environ, PORT=str(port), RELOAD='false', STORAGE_SECRET=secrets.token_hex(32),
+               NICEGUI_STORAGE_PATH=storage, BASE_API_URL=langflow_url, ENDPOINT='load-test', LANGFLOW_BACKENDS='',
+               LANGFLOW_STREAM='true' if args.stream else 'false', POOL_SHARED='false',
+               POOL_MIN_SIZE=str(args.pool_size), POOL_MAX_SIZE=str(args.pool_size))
+    return subprocess.Popen([sys.executable, 'main.py'], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+
+def wait_ready(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/', timeout=5).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not come up within {timeout:.0f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test of the /chat flow.')
+    parser.add_argument('--profile', default='30:0.5-2,60:2', help='arrival stages, seconds:rate or seconds:from-to')
+    parser.add_argument('--turns', type=int, default=3, help='messages per session')
+    parser.add_argument('--think', type=float, default=5.0, help='mean think time between turns, in seconds')
+    parser.add_argument('--reply-timeout', type=float, default=120.0)
+    parser.add_argument('--save-timeout', type=float, default=30.0, help='how long to wait for the last saves')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='test an already running app instead of starting main.py')
+    parser.add_argument('--pool-size', type=int, default=500, help='user slots of the started app')
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--langflow-delay', type=float, default=1.0, help='mock LangFlow time to first token')
+    parser.add_argument('--langflow-tokens', type=int, default=50)
+    parser.add_argument('--langflow-token-delay', type=float, default=0.02)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    conninfo = postgres_conninfo()
+    if conninfo is None:
+        print("Postgres is not reachable: save latency is not measured", file=sys.stderr)
+    if args.url:
+        report = asyncio.run(run_load(args, args.url.rstrip('/'), conninfo))
+    else:
+        mock = create_app(delay=args.langflow_delay, tokens=args.langflow_tokens,
+                          token_delay=args.langflow_token_delay)
+        port = free_port()
+        with MockLangFlowServer(mock) as langflow, tempfile.TemporaryDirectory() as storage, \
+                open(os.path.join(storage, 'app.log'), 'w') as log:
+            process = start_app(args, port, langflow.base_url, os.path.join(storage, 'nicegui'), log)
+            try:
+                wait_ready(f'http://127.0.0.1:{port}')
+                report = asyncio.run(run_load(args, f'http://127.0.0.1:{port}', conninfo))
+            finally:
+                os.killpg(process.pid, signal.SIGTERM)
+                try:
+                    process.wait(timeout=30)  # the app flushes its pending saves first
+                except subprocess.TimeoutExpired:
+                    os.killpg(process.pid, signal.SIGKILL)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
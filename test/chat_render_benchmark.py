@@ -0,0 +1,90 @@
+"""Websocket payload and server time per chat turn: full markdown rebuild vs append-only ChatView.
+
+Payload bytes are the JSON of the element updates NiceGUI's outbox would emit for one turn
+(a user message plus an assistant answer) after the history already holds N messages.
+Run with: python test/chat_render_benchmark.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from nicegui import Client, ui
+from nicegui.page import page
+
+from utilities.chat_view import ChatView
+
+HISTORY_SIZES = [10, 100, 1000]
+TURNS = 20  # turns measured per history size
+ANSWER = "Claro, aquí tienes algunas ideas para tu visita al Silicon Valley. " * 8
+
+
+def message(i: int) -> dict:
+    role = 'user' if i % 2 == 0 else 'assistant'
+    return {"role": role, "content": f"Mensaje {i}: {ANSWER}"}
+
+
+def pending_payload(client: Client) -> int:
+    """Size of the update message the outbox would send, then forget the updates."""
+    updates = {element_id: element._to_dict() for element_id, element in client.outbox.updates.items()}
+    client.outbox.updates.clear()
+    return len(json.dumps(updates, default=str).encode())
+
+
+def full_rebuild(client: Client, size: int) -> tuple:
+    """The old display_conversation: one markdown element rebuilt from the whole history twice per turn."""
+    history = [message(i) for i in range(size)]
+    with client:
+        chat_display = ui.markdown('')
+
+    def display_conversation():
+        content = ""
+        for m in history:
+            content += f'**{m["role"]}:** {m["content"]}\n\n'
+        chat_display.content = content
+
+    display_conversation()
+    pending_payload(client)
+    payload = seconds = 0
+    for turn in range(TURNS):
+        start = time.perf_counter()
+        history.append(message(size + 2 * turn))
+        display_conversation()
+        payload += pending_payload(client)
+        history.append(message(size + 2 * turn + 1))
+        display_conversation()
+        payload += pending_payload(client)
+        seconds += time.perf_counter() - start
+    return payload / TURNS, seconds / TURNS
+
+
+def append_only(client: Client, size: int) -> tuple:
+    with client:
+        chat_view = ChatView()
+        chat_view.extend([message(i) for i in range(size)])
+    pending_payload(client)
+    payload = seconds = 0
+    for turn in range(TURNS):
+        start = time.perf_counter()
+        with client:
+            chat_view.append(message(size + 2 * turn))
+            payload += pending_payload(client)
+            chat_view.append(message(size + 2 * turn + 1))
+            payload += pending_payload(client)
+        seconds += time.perf_counter() - start
+    return payload / TURNS, seconds / TURNS
+
+
+async def main():
+    print(f"{'messages':>9}{'rebuild bytes/turn':>20}{'rebuild ms/turn':>17}{'append bytes/turn':>19}{'append ms/turn':>16}")
+    for size in HISTORY_SIZES:
+        rebuild_bytes, rebuild_seconds = full_rebuild(Client(page('/')), size)
+        append_bytes, append_seconds = append_only(Client(page('/')), size)
+        print(f"{size:>9}{rebuild_bytes:>20,.0f}{rebuild_seconds * 1000:>17.2f}"
+              f"{append_bytes:>19,.0f}{append_seconds * 1000:>16.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Peak RSS and throughput of exporting 1M message rows as gzip JSONL.
+
+Compares the streaming export (conversation_records + gzip_jsonl, as /admin/export runs them) with
+building the whole export in memory the way download_file builds one history. Each variant runs in
+its own process so ru_maxrss is its own peak. The rows are synthetic; with POSTGRES_HOST set, the
+`postgres` variant also seeds the tables and exports through the named server-side cursor.
+Run with: python test/export_benchmark.py
+"""
+import asyncio
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.export import conversation_records, gzip_jsonl
+
+ROWS = 1_000_000
+MESSAGES_PER_CONVERSATION = 10
+CONTENT = "Me gustaría visitar empresas de inteligencia artificial y probar un food truck en Palo Alto. "
+START = datetime(2025, 1, 1)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def synthetic_rows():
+    for i in range(ROWS):
+        conversation, seq = divmod(i, MESSAGES_PER_CONVERSATION)
+        created_at = START + timedelta(seconds=i)
+        yield (f"session_{conversation:07d}", f"user_{conversation % 50}", created_at, None, None, None, None,
+               seq, 'user' if seq % 2 == 0 else 'assistant', f"user_{conversation % 50}", CONTENT, created_at)
+
+
+async def stream_export(rows) -> int:
+    size = 0
+    with open(os.devnull, 'wb') as sink:
+        async for chunk in gzip_jsonl(conversation_records(rows)):
+            sink.write(chunk)
+            size += len(chunk)
+    return size
+
+
+async def memory_export(rows) -> int:
+    records = [record async for record in conversation_records(rows)]
+    content = '\n'.join(json.dumps(record, ensure_ascii=False) for record in records)
+    return len(gzip.compress(content.encode()))
+
+
+async def seed_and_export_postgres() -> int:
+    from utilities.async_database import AsyncUserDB
+    from utilities.schema import message_rows
+    db = AsyncUserDB(min_size=1, max_size=2, statement_timeout=600)
+    async with db.connection() as conn:
+        await conn.execute("DELETE FROM conversations WHERE session_id LIKE 'export_bench_%'")
+        async with conn.cursor() as cursor:
+            conversations = ROWS // MESSAGES_PER_CONVERSATION
+            async with cursor.copy('COPY conversations (session_id, username, save_time) FROM STDIN') as copy:
+                for c in range(conversations):
+                    await copy.write_row((f"export_bench_{c:07d}", f"user_{c % 50}", START))
+            async with cursor.copy('COPY conversation_messages (session_id, seq, role, agent, content, created_at, '
+                                   'cached) FROM STDIN') as copy:
+                for c in range(conversations):
+                    messages = [{"role": 'user' if seq % 2 == 0 else 'assistant', "agent": f"user_{c % 50}",
+                                 "content": CONTENT, "timestamp": START} for seq in range(MESSAGES_PER_CONVERSATION)]
+                    for row in message_rows(f"export_bench_{c:07d}", 0, messages):
+                        await copy.write_row(row)
+    start = time.perf_counter()
+    size = await stream_export(db.export_rows(START, START + timedelta(days=1)))
+    print(f"  export alone took {time.perf_counter() - start:.1f} s")
+    async with db.connection() as conn:
+        await conn.execute("DELETE FROM conversations WHERE session_id LIKE 'export_bench_%'")
+    await db.close()
+    return size
+
+
+def run_variant(variant: str):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if variant == 'stream':
+        size = asyncio.run(stream_export(synthetic_rows()))
+    elif variant == 'memory':
+        size = asyncio.run(memory_export(synthetic_rows()))
+    else:
+        size = asyncio.run(seed_and_export_postgres())
+    elapsed = time.perf_counter() - start
+    print(f"{variant:<10}{elapsed:>10.1f} s{ROWS / elapsed:>14,.0f} rows/s{size / 2 ** 20:>10.1f} MB gz"
+          f"{peak_rss_mb():>12.0f} MB peak RSS (baseline {baseline:.0f} MB)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_variant(sys.argv[1])
+    else:
+        print(f"{ROWS:,} message rows in {ROWS // MESSAGES_PER_CONVERSATION:,} conversations")
+        variants = ['stream', 'memory'] + (['postgres'] if os.environ.get('POSTGRES_HOST') else [])
+        for variant in variants:
+            subprocess.run([sys.executable, __file__, variant], check=True)
@@ -0,0 +1,74 @@
+"""Tail latency of LangFlow runs and streams against a mock with a long tail, with and without hedged requests.
+
+Two percent of the mock's runs stall for several seconds. The hedged client sends a second copy of
+any run still pending after the observed p95 (capped at 5% of runs) and takes the first answer; a
+stream is hedged while it waits for its first token and the copy whose tokens arrive first is kept.
+Run with: python test/hedging_benchmark.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.dirname(__file__))
+from utilities import metrics
+from utilities.langflow_client import LangFlowClient
+from mock_langflow import MockLangFlowServer, create_app
+
+RUNS = 1000
+CONCURRENCY = 20
+DELAY = 0.1  # seconds of normal latency
+TAIL_RATIO = 0.02  # share of runs that stall
+TAIL_DELAY = 3.0  # seconds a stalled run takes on top
+HEDGE_RATE = 0.05
+ENDPOINT = 'bench'
+TOKENS = 5
+TOKEN_DELAY = 0.005
+
+
+async def measure(client: LangFlowClient, name: str, stream: bool):
+    results = metrics.Histogram(name, window=RUNS)
+    queue = asyncio.Queue()
+    for i in range(RUNS):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            payload = {"input_value": f"Hola {i}", "output_type": "chat", "input_type": "chat"}
+            if stream:
+                await client.stream(payload, lambda chunk: None)
+            else:
+                await client.run(payload)
+            results.observe(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    summary = results.snapshot()
+    print(f"{name:<14}{summary['p50'] * 1000:>9.0f} ms{summary['p95'] * 1000:>9.0f} ms"
+          f"{summary['p99'] * 1000:>9.0f} ms{max(results.values) * 1000:>9.0f} ms")
+
+
+async def main():
+    app = create_app(delay=DELAY, tokens=TOKENS, token_delay=TOKEN_DELAY, tail_ratio=TAIL_RATIO, tail_delay=TAIL_DELAY)
+    with MockLangFlowServer(app) as server:
+        print(f"{RUNS} calls each, {CONCURRENCY} concurrent, {TAIL_RATIO:.0%} stall for {TAIL_DELAY:.0f} s")
+        print(f"{'':<14}{'p50':>12}{'p95':>12}{'p99':>12}{'max':>12}")
+        for stream in (False, True):
+            kind = 'stream' if stream else 'run'
+            # Separate labels, so the two clients keep separate latency histograms
+            plain = LangFlowClient(server.base_url, ENDPOINT, label=f'plain {kind}')
+            await measure(plain, f'plain {kind}', stream)
+            await plain.close()
+
+            hedged = LangFlowClient(server.base_url, ENDPOINT, hedge=True, hedge_rate=HEDGE_RATE,
+                                    label=f'hedged {kind}')
+            await measure(hedged, f'hedged {kind}', stream)
+            await hedged.close()
+            print(f"hedges sent: {int(hedged.hedged.value)} ({hedged.hedged.value / RUNS:.1%} of {kind}s), "
+                  f"won by the hedge: {int(hedged.hedge_wins.value)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Stored size and encode/decode speed of conversation histories in each storage format.
+
+Compares the legacy TEXT encodings (indent=2 JSON and the Python repr the old save_db wrote) with the
+history codec's compact JSON (JSONB) and zlib formats. When the POSTGRES_* settings point at a reachable
+database it also reports pg_column_size, i.e. the bytes Postgres stores after its own TOAST compression.
+Run with: python test/history_codec_benchmark.py
+"""
+import ast
+import json
+import os
+import sys
+import time
+import zlib
+
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.history_codec import decode_history, encode_history, FORMAT_JSONB, FORMAT_ZLIB
+
+load_dotenv()
+
+TURNS = (10, 50, 200)
+REPEAT = 200
+ANSWER = "Te recomiendo visitar el campus de Stanford y reservar un tour por Sand Hill Road. " * 6
+
+
+def make_history(turns: int) -> list:
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"Pregunta {turn}: ¿qué me recomiendas?",
+                        "timestamp": "2025-01-01 12:00:00", "agent": "user_bench"})
+        history.append({"role": "assistant", "content": f"Respuesta {turn}: {ANSWER}",
+                        "timestamp": "2025-01-01 12:00:00", "agent": "user_bench"})
+    return history
+
+
+# name -> (encode, decode, stored bytes)
+FORMATS = {
+    'json indent=2 (TEXT)': (lambda h: json.dumps(h, ensure_ascii=False, indent=2), json.loads,
+                             lambda v: len(v.encode())),
+    'python repr (TEXT)': (str, ast.literal_eval, lambda v: len(v.encode())),
+    'compact json (JSONB)': (lambda h: encode_history(h, compress_threshold=sys.maxsize),
+                             lambda v: decode_history(*v, None), lambda v: len(v[1].encode())),
+    'zlib (BYTEA)': (lambda h: encode_history(h, compress_threshold=0),
+                     lambda v: decode_history(*v, None), lambda v: len(v[2])),
+}
+
+
+def timed(function, value) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        function(value)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def column_sizes(history: list) -> dict:
+    """pg_column_size of each format, or {} without a database."""
+    try:
+        conn = psycopg2.connect(host=os.getenv('POSTGRES_HOST'), database=os.getenv('POSTGRES_DB'),
+                                user=os.getenv('POSTGRES_USER'), password=os.getenv('POSTGRES_PASSWORD'),
+                                port=os.getenv('POSTGRES_PORT', '5432'), connect_timeout=3)
+    except psycopg2.OperationalError:
+        return {}
+    _, compact, _ = encode_history(history, compress_threshold=sys.maxsize)
+    _, _, packed = encode_history(history, compress_threshold=0)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE bench_codec (text_indent TEXT, text_repr TEXT, '
+                           'compact JSONB, packed BYTEA)')
+            cursor.execute('ALTER TABLE bench_codec ALTER COLUMN packed SET STORAGE EXTERNAL')
+            cursor.execute('INSERT INTO bench_codec VALUES (%s, %s, %s::jsonb, %s)',
+                           (json.dumps(history, ensure_ascii=False, indent=2), str(history), compact, packed))
+            cursor.execute('SELECT pg_column_size(text_indent), pg_column_size(text_repr), '
+                           'pg_column_size(compact), pg_column_size(packed) FROM bench_codec')
+            return dict(zip(FORMATS, cursor.fetchone()))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    assert encode_history(make_history(1))[0] == FORMAT_JSONB
+    assert encode_history(make_history(200))[0] == FORMAT_ZLIB
+    for turns in TURNS:
+        history = make_history(turns)
+        stored = column_sizes(history)
+        print(f"\n{turns} turns ({2 * turns} messages)")
+        print(f"{'format':<24}{'bytes':>10}{'in postgres':>13}{'encode':>11}{'decode':>11}")
+        for name, (encode, decode, size) in FORMATS.items():
+            value = encode(history)
+            assert decode(value) == history
+            in_postgres = f"{stored[name]:,}" if stored else '-'
+            print(f"{name:<24}{size(value):>10,}{in_postgres:>13}"
+                  f"{timed(encode, history) * 1000:>9.2f}ms{timed(decode, value) * 1000:>9.2f}ms")
@@ -0,0 +1,68 @@
+"""Payload size and end-to-end latency per turn, sending the full history versus the token-budgeted window.
+
+The mock LangFlow charges a fixed delay plus a small cost per prompt token of the conversation history,
+so latency follows payload size the way LLM prompt processing does.
+Run with: python test/history_window_benchmark.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.dirname(__file__))
+from utilities.history_window import HistoryWindow
+from utilities.langflow_client import LangFlowClient
+from mock_langflow import MockLangFlowServer, create_app
+
+TURNS = 200
+REPORT_EVERY = 25
+DELAY = 0.05  # seconds of fixed LangFlow latency per run
+PROMPT_TOKEN_DELAY = 0.00002  # seconds per history token, about 50k prompt tokens per second
+ENDPOINT = 'bench'
+ANSWER = ("Para su visita le recomiendo empezar por el centro histórico, que está a diez minutos a pie "
+          "del hotel. Por la tarde puede tomar el tren hacia la costa y volver antes de la cena. ") * 4
+
+
+def message(role: str, content: str) -> dict:
+    return {"role": role, "content": content, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "agent": "user_1"}
+
+
+async def run_session(client: LangFlowClient, window: HistoryWindow = None):
+    """Play TURNS turns of one session and return (turn, payload bytes, seconds) every REPORT_EVERY turns."""
+    history = []
+    results = []
+    for turn in range(1, TURNS + 1):
+        start = time.perf_counter()
+        sent = window.window('session_1', history) if window else history
+        payload = {"input_value": f"Pregunta {turn} sobre el plan de visita", "output_type": "chat",
+                   "input_type": "chat", "conversation_history": json.dumps(sent),
+                   "user": "user_1", "session_id": "session_1"}
+        await client.run(payload)
+        elapsed = time.perf_counter() - start
+        history.append(message('user', payload["input_value"]))
+        history.append(message('assistant', ANSWER))
+        if turn % REPORT_EVERY == 0:
+            results.append((turn, len(json.dumps(payload).encode()), elapsed))
+    return results
+
+
+async def main():
+    app = create_app(delay=DELAY, tokens=0, prompt_token_delay=PROMPT_TOKEN_DELAY)
+    with MockLangFlowServer(app) as server:
+        client = LangFlowClient(server.base_url, ENDPOINT)
+        full = await run_session(client)
+        windowed = await run_session(client, HistoryWindow(token_budget=2000, summary_budget=500))
+        await client.close()
+
+    print(f"{'turn':>6}{'full payload':>16}{'full latency':>15}{'window payload':>18}{'window latency':>17}")
+    for (turn, full_bytes, full_time), (_, window_bytes, window_time) in zip(full, windowed):
+        print(f"{turn:>6}{full_bytes / 1024:>13.1f} KB{full_time * 1000:>12.0f} ms"
+              f"{window_bytes / 1024:>15.1f} KB{window_time * 1000:>14.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Event-loop latency with 50 concurrent chats against a slow mock LangFlow endpoint.
+
+Compares the old blocking `requests.post` call with the pooled async LangFlowClient.
+Run with: python test/langflow_client_benchmark.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.dirname(__file__))
+from utilities.langflow_client import LangFlowClient
+from mock_langflow import MockLangFlowServer, create_app
+
+CONCURRENT_CHATS = 50
+RESPONSE_DELAY = 0.2  # seconds the mock endpoint takes per answer
+PROBE_INTERVAL = 0.005  # seconds between event-loop latency probes
+ENDPOINT = 'bench'
+
+
+def payload(i: int) -> dict:
+    return {"input_value": f"Hola {i}", "output_type": "chat", "input_type": "chat",
+            "user": f"user_{i}", "session_id": f"session_{i}"}
+
+
+async def probe_loop(lags: list, stop: asyncio.Event):
+    """Measure how late the event loop wakes up a sleeping task."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run_scenario(name: str, chat) -> dict:
+    lags = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop(lags, stop))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(i) for i in range(CONCURRENT_CHATS)))
+    wall = time.perf_counter() - start
+
+    stop.set()
+    await probe
+    lags.sort()
+    return {
+        "scenario": name,
+        "wall_time_s": wall,
+        "loop_lag_p50_ms": statistics.median(lags) * 1000,
+        "loop_lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000,
+        "loop_lag_max_ms": lags[-1] * 1000,
+    }
+
+
+async def main():
+    with MockLangFlowServer(create_app(delay=RESPONSE_DELAY, tokens=0)) as server:
+        url = f"{server.base_url}/api/v1/run/{ENDPOINT}"
+
+        async def blocking_chat(i: int):
+            # What the old run_flow did inside the click handler
+            requests.post(url, json=payload(i), headers={"x-api-key": ""}, timeout=60).json()
+
+        client = LangFlowClient(server.base_url, ENDPOINT)
+        client.client  # create the pooled client (and its SSL context) before measuring
+
+        async def async_chat(i: int):
+            await client.run(payload(i))
+
+        results = [
+            await run_scenario('blocking requests.post', blocking_chat),
+            await run_scenario('async LangFlowClient', async_chat),
+        ]
+        await client.close()
+
+    print(f"{CONCURRENT_CHATS} concurrent chats, mock endpoint delay {RESPONSE_DELAY * 1000:.0f} ms")
+    print(f"{'scenario':<26}{'wall (s)':>10}{'lag p50 (ms)':>14}{'lag p99 (ms)':>14}{'lag max (ms)':>14}")
+    for r in results:
+        print(f"{r['scenario']:<26}{r['wall_time_s']:>10.2f}{r['loop_lag_p50_ms']:>14.1f}"
+              f"{r['loop_lag_p99_ms']:>14.1f}{r['loop_lag_max_ms']:>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""Bytes written per turn for a 200-turn conversation: whole-blob rewrite vs append-only message rows.
+
+Always reports the logical bytes each schema sends to the database per turn. When the POSTGRES_*
+settings point at a reachable database it also reports the WAL bytes Postgres generated, using
+throwaway tables in a `bench_storage` schema.
+Run with: python test/message_storage_benchmark.py
+"""
+import json
+import os
+from datetime import datetime
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TURNS = 200
+ANSWER = "Te recomiendo visitar el campus de Stanford y reservar un tour por Sand Hill Road. " * 6
+
+
+def message_rows(session_id: str, first_seq: int, messages: list) -> list:
+    """Same rows UserDB.append_messages_batch writes (importing utilities.database would connect)."""
+    return [(session_id, first_seq + offset, m["role"], m["agent"], m["content"], m["timestamp"])
+            for offset, m in enumerate(messages)]
+
+
+def turn_messages(turn: int) -> list:
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [
+        {"role": "user", "content": f"Pregunta {turn}: ¿qué me recomiendas?", "timestamp": timestamp, "agent": "user_bench"},
+        {"role": "assistant", "content": f"Respuesta {turn}: {ANSWER}", "timestamp": timestamp, "agent": "user_bench"},
+    ]
+
+
+def logical_bytes():
+    history = []
+    blob_bytes = []
+    row_bytes = []
+    for turn in range(TURNS):
+        first_seq = len(history)
+        new_messages = turn_messages(turn)
+        history.extend(new_messages)
+        blob_bytes.append(len(json.dumps(history, ensure_ascii=False, indent=2).encode()))
+        row_bytes.append(sum(len(str(value).encode()) for row in message_rows('bench', first_seq, new_messages) for value in row))
+    return blob_bytes, row_bytes
+
+
+def wal_bytes(conn):
+    """WAL Postgres generated per turn under each schema."""
+    def wal_position(cursor):
+        cursor.execute('SELECT pg_current_wal_lsn()')
+        return cursor.fetchone()[0]
+
+    def wal_diff(cursor, start, end):
+        cursor.execute('SELECT pg_wal_lsn_diff(%s, %s)', (end, start))
+        return int(cursor.fetchone()[0])
+
+    with conn.cursor() as cursor:
+        cursor.execute('DROP SCHEMA IF EXISTS bench_storage CASCADE')
+        cursor.execute('CREATE SCHEMA bench_storage')
+        cursor.execute('''
+            CREATE TABLE bench_storage.conversations (
+                session_id VARCHAR(255) PRIMARY KEY, username VARCHAR(255) NOT NULL,
+                save_time TIMESTAMP NOT NULL, conversation_history TEXT)
+        ''')
+        cursor.execute('''
+            CREATE TABLE bench_storage.conversation_messages (
+                session_id VARCHAR(255) NOT NULL, seq INTEGER NOT NULL, role VARCHAR(32) NOT NULL,
+                agent VARCHAR(255), content TEXT NOT NULL, created_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (session_id, seq))
+        ''')
+        cursor.execute('''INSERT INTO bench_storage.conversations VALUES ('bench', 'user_bench', now(), '[]')''')
+    conn.commit()
+
+    history = []
+    blob_wal = []
+    row_wal = []
+    with conn.cursor() as cursor:
+        for turn in range(TURNS):
+            first_seq = len(history)
+            new_messages = turn_messages(turn)
+            history.extend(new_messages)
+
+            start = wal_position(cursor)
+            cursor.execute('UPDATE bench_storage.conversations SET conversation_history = %s WHERE session_id = %s',
+                           (json.dumps(history, ensure_ascii=False, indent=2), 'bench'))
+            conn.commit()
+            blob_wal.append(wal_diff(cursor, start, wal_position(cursor)))
+
+            start = wal_position(cursor)
+            cursor.executemany('''
+                INSERT INTO bench_storage.conversation_messages (session_id, seq, role, agent, content, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', message_rows('bench', first_seq, new_messages))
+            conn.commit()
+            row_wal.append(wal_diff(cursor, start, wal_position(cursor)))
+        cursor.execute('DROP SCHEMA bench_storage CASCADE')
+    conn.commit()
+    return blob_wal, row_wal
+
+
+def report(label: str, blob: list, rows: list):
+    print(label)
+    print(f"{'turn':>6}{'blob rewrite':>16}{'message rows':>16}")
+    for turn in (1, 10, 50, 100, 200):
+        print(f"{turn:>6}{blob[turn - 1]:>16,}{rows[turn - 1]:>16,}")
+    print(f"{'total':>6}{sum(blob):>16,}{sum(rows):>16,}\n")
+
+
+def main():
+    report(f"Logical bytes written per turn ({TURNS} turns)", *logical_bytes())
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('POSTGRES_HOST'), database=os.getenv('POSTGRES_DB'),
+            user=os.getenv('POSTGRES_USER'), password=os.getenv('POSTGRES_PASSWORD'),
+            port=os.getenv('POSTGRES_PORT', '5432'))
+    except psycopg2.OperationalError as e:
+        print(f"Postgres not reachable, skipping WAL measurement: {e}")
+        return
+    try:
+        report(f"WAL bytes per turn ({TURNS} turns)", *wal_bytes(conn))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Local mock of the LangFlow run API for benchmarks and load tests."""
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+
+def build_response(text: str) -> dict:
+    """Build a response shaped like LangFlow's /api/v1/run output."""
+    return {"outputs": [{"outputs": [{"results": {"message": {"text": text}}}]}]}
+
+
+def create_app(delay: float = 1.0, tokens: int = 50, token_delay: float = 0.02,
+               prompt_token_delay: float = 0.0, tail_ratio: float = 0.0, tail_delay: float = 0.0) -> FastAPI:
+    """Create a mock LangFlow app that answers every run after `delay` seconds.
+
+    Prompt processing adds `prompt_token_delay` seconds per token (four characters) of the payload's
+    conversation_history. With `?stream=true` the answer is sent as `tokens` token events,
+    `token_delay` seconds apart, after the first delay, followed by an end event.
+    A `tail_ratio` share of the runs is slowed down by another `tail_delay` seconds, like a stuck worker.
+    """
+    mock = FastAPI()
+
+    async def stream_events(text: str, prompt_delay: float):
+        await asyncio.sleep(delay + prompt_delay)
+        words = [f"{word} " for word in (text.split() * tokens)[:tokens]]
+        for word in words:
+            yield json.dumps({"event": "token", "data": {"chunk": word}}) + "\n\n"
+            await asyncio.sleep(token_delay)
+        yield json.dumps({"event": "end", "data": {"result": build_response(''.join(words))}}) + "\n\n"
+
+    @mock.get('/health')
+    async def health():
+        return {"status": "ok"}
+
+    @mock.post('/api/v1/run/{endpoint}')
+    async def run(endpoint: str, payload: dict, stream: bool = False):
+        text = f"Echo: {payload.get('input_value', '')}"
+        prompt_delay = len(payload.get('conversation_history', '')) // 4 * prompt_token_delay
+        if random.random() < tail_ratio:
+            prompt_delay += tail_delay
+        if stream:
+            return StreamingResponse(stream_events(text, prompt_delay), media_type='text/event-stream')
+        await asyncio.sleep(delay + prompt_delay + tokens * token_delay)
+        return build_response(text)
+
+    return mock
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class MockLangFlowServer:
+    """Run a mock LangFlow app with uvicorn in a background thread."""
+
+    def __init__(self, app: FastAPI, port: int = 0):
+        self.port = port or free_port()
+        config = uvicorn.Config(app, host='127.0.0.1', port=self.port, log_level='warning',
+                                backlog=2048, limit_concurrency=None)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
@@ -0,0 +1,137 @@
+"""/chat page loads per second with 1, 2 and 4 app processes.
+
+Starts the processes the way the README's "Scaling out" section does, one port each, and spreads
+CONCURRENCY concurrent page loads over them round-robin for DURATION seconds (plain page loads need no
+sticky routing). When the POSTGRES_* settings point at a reachable database the processes share the user
+pool through it (POOL_SHARED); otherwise each keeps its own pool. Scaling is bounded by the CPU cores,
+which the load generator shares with the app processes.
+Run with: python test/multi_worker_benchmark.py
+"""
+import asyncio
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+WORKERS = (1, 2, 4)
+BASE_PORT = 8181
+CONCURRENCY = 32
+WARMUP = 2.0
+DURATION = 10.0
+
+
+def postgres_reachable() -> bool:
+    try:
+        psycopg2.connect(host=os.getenv('POSTGRES_HOST'), database=os.getenv('POSTGRES_DB'),
+                         user=os.getenv('POSTGRES_USER'), password=os.getenv('POSTGRES_PASSWORD'),
+                         port=os.getenv('POSTGRES_PORT', '5432'), connect_timeout=3).close()
+        return True
+    except psycopg2.OperationalError:
+        return False
+
+
+def start_workers(count: int, shared: bool, storage: str) -> list:
+    secret = secrets.token_hex(32)
+    processes = []
+    for i in range(count):
+        env = dict(os.environ, PORT=str(BASE_PORT + i), RELOAD='false', STORAGE_SECRET=secret,
+                   WORKER_ID=f'bench-{i}', NICEGUI_STORAGE_PATH=os.path.join(storage, f'worker-{i}'),
+                   POOL_SHARED='true' if shared else 'false', POOL_SHARED_MAX_SIZE='100000',
+                   POOL_MIN_SIZE='2000', POOL_MAX_SIZE='2000', POOL_RESIZE_INTERVAL='1',
+                   LEASE_TTL='2', LEASE_REAP_INTERVAL='0.5')
+        processes.append(subprocess.Popen([sys.executable, 'main.py'], cwd=ROOT, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                          start_new_session=True))
+    return processes
+
+
+def stop_workers(processes: list):
+    for process in processes:
+        os.killpg(process.pid, signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+async def wait_ready(client: httpx.AsyncClient, urls: list):
+    deadline = time.monotonic() + 60
+    for url in urls:
+        while True:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'{url} did not come up')
+            await asyncio.sleep(0.5)
+
+
+async def load(count: int) -> tuple:
+    urls = [f'http://127.0.0.1:{BASE_PORT + i}/chat' for i in range(count)]
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await wait_ready(client, urls)
+        latencies = []
+        errors = 0
+        measuring = False
+
+        async def requester(offset: int):
+            nonlocal errors
+            i = offset
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    response = await client.get(urls[i % count])
+                    ok = response.status_code == 200
+                except httpx.TransportError:
+                    ok = False
+                if measuring:
+                    if ok:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors += 1
+                i += 1
+
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(requester(offset)) for offset in range(CONCURRENCY)]
+        await asyncio.sleep(WARMUP)
+        measuring = True
+        await asyncio.sleep(DURATION)
+        measuring = False
+        stop.set()
+        await asyncio.gather(*tasks)
+    latencies.sort()
+    return len(latencies) / DURATION, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], errors
+
+
+if __name__ == "__main__":
+    shared = postgres_reachable()
+    print(f"{os.cpu_count()} CPU cores, user pool {'shared through Postgres' if shared else 'per process'}")
+    # The load generator needs a core of its own next to the largest run
+    if not shared or (os.cpu_count() or 1) <= max(WORKERS):
+        print("Not a measurement of the shared mode's scaling: that needs the POSTGRES_* settings and "
+              f"more than {max(WORKERS)} cores")
+    print(f"{'processes':>10}{'pages/s':>10}{'speedup':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as storage:
+        for count in WORKERS:
+            processes = start_workers(count, shared, storage)
+            try:
+                rate, p50, p95, errors = asyncio.run(load(count))
+            finally:
+                stop_workers(processes)
+            baseline = baseline or rate
+            print(f"{count:>10}{rate:>10.0f}{rate / baseline:>8.2f}x{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}{errors:>8}")
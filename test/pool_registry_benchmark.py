@@ -0,0 +1,97 @@
+"""Write cost of one user status change as the pool grows to 100k users.
+
+Compares rewriting the whole pool as one JSON file on every change (what NiceGUI does for
+app.storage.general) with appending the change to the pool's PoolLog, including its periodic
+compactions. Also compares the memory the old nested user dicts and the SlotAllocator take.
+Files are written to a temporary directory.
+Run with: python test/pool_registry_benchmark.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.pool_log import PoolLog
+from utilities.slots import SlotAllocator
+
+SIZES = (1_000, 10_000, 100_000)
+CHANGES = 2_000
+REWRITES = 50  # the old way is too slow to time over all changes at 100k users
+
+
+def usernames(count: int) -> list:
+    return [f"user_{i:032x}" for i in range(count)]
+
+
+def rewrite_file(directory: str, count: int):
+    """Old: flip a user's status in the nested dict and write the whole dict out again."""
+    user_list = {u: {"username": u, "time_logged": None, "logged": False} for u in usernames(count)}
+    path = os.path.join(directory, 'storage-general.json')
+    written = 0
+    start = time.perf_counter()
+    for username in list(user_list)[:REWRITES]:
+        user_list[username].update(logged=True, time_logged=datetime.now().isoformat())
+        with open(path, 'w') as f:
+            written += f.write(json.dumps({"user_list": user_list}))
+    return (time.perf_counter() - start) / REWRITES, written / REWRITES
+
+
+def change_log(directory: str, count: int):
+    """New: lease a slot and append the change; compactions included in the totals."""
+    log = PoolLog(os.path.join(directory, f'user_pool_{count}'), min_compact_lines=1000)
+    slots = SlotAllocator()
+    slots.rebuild(usernames(count))
+    slots.persist(log)  # initial snapshot
+    compactions = log.generation
+    start = time.perf_counter()
+    written = 0
+    for i in range(CHANGES):
+        username = slots.lease()
+        if i % 2:
+            slots.release(username)
+        size_before = os.path.getsize(log.log_path) if os.path.exists(log.log_path) else 0
+        generation = log.generation
+        slots.persist(log)  # persist every change, the worst case for the log
+        if log.generation != generation:
+            written += os.path.getsize(log.snapshot_path)
+        else:
+            written += os.path.getsize(log.log_path) - size_before
+    elapsed = time.perf_counter() - start
+    assert log.load() == slots.snapshot()
+    log.close()
+    return elapsed / CHANGES, written / CHANGES, log.generation - compactions
+
+
+def memory(count: int):
+    tracemalloc.start()
+    user_list = {u: {"username": u, "time_logged": None, "logged": False} for u in usernames(count)}
+    for username in list(user_list)[:count // 10]:
+        user_list[username].update(logged=True, time_logged=datetime.now().isoformat())
+    old, _ = tracemalloc.get_traced_memory()
+    del user_list
+    tracemalloc.stop()
+    tracemalloc.start()
+    slots = SlotAllocator()
+    slots.rebuild(usernames(count))
+    for _ in range(count // 10):
+        slots.lease()
+    new, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return old, new
+
+
+if __name__ == "__main__":
+    print(f"Status changes, each persisted before the next ({REWRITES} rewrites, {CHANGES} log appends)")
+    print(f"{'users':>8}{'rewrite ms':>12}{'bytes':>12}{'log ms':>10}{'bytes':>8}{'compactions':>13}"
+          f"{'dicts MB':>10}{'slots MB':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in SIZES:
+            rewrite_seconds, rewrite_bytes = rewrite_file(directory, count)
+            log_seconds, log_bytes, compactions = change_log(directory, count)
+            old, new = memory(count)
+            print(f"{count:>8,}{rewrite_seconds * 1000:>12.2f}{rewrite_bytes:>12,.0f}{log_seconds * 1000:>10.3f}"
+                  f"{log_bytes:>8,.0f}{compactions:>13}{old / 2 ** 20:>10.1f}{new / 2 ** 20:>10.1f}")
@@ -0,0 +1,107 @@
+"""Server memory for many chat sessions: a history list per browser session vs the capped session store.
+
+USERS users chat for TURNS turns each, their turns interleaved at random. The old way keeps every history in
+the user's storage for as long as the process runs; the session store keeps at most CAP_MB of them and pages
+the others back in from a simulated database (with DB_LATENCY per read) fed by the write-behind queue.
+The store's size is its own accounting, which is checked against tracemalloc at the end.
+Run with: python test/session_store_benchmark.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.persistence import WriteBehindQueue
+from utilities.session_store import SessionStore
+
+USERS = 2000
+TURNS = 20
+CAP_MB = 16
+DB_LATENCY = 0.002
+ANSWER = "Le recomiendo visitar el campus de Stanford y reservar un tour por Sand Hill Road. " * 4
+
+
+def message(role: str, content: str, username: str) -> dict:
+    return {"role": role, "content": content, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "agent": username}
+
+
+def schedule() -> list:
+    """(user, turn) pairs: every user's turns in order, users interleaved at random."""
+    random.seed(1)
+    remaining = {user: 0 for user in range(USERS)}
+    order = []
+    while remaining:
+        user = random.choice(list(remaining))
+        order.append((user, remaining[user]))
+        remaining[user] += 1
+        if remaining[user] == TURNS:
+            del remaining[user]
+    return order
+
+
+def browser_storage() -> float:
+    """MB held by one history list per user, as app.storage.browser did."""
+    tracemalloc.start()
+    storages = {}
+    for user, turn in schedule():
+        storage = storages.setdefault(user, {"session_id": f"session_{user}", "conversation_history": []})
+        storage["conversation_history"].append(message('user', f"Pregunta {turn}", f"user_{user}"))
+        storage["conversation_history"].append(message('assistant', f"{turn}: {ANSWER}", f"user_{user}"))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 2 ** 20
+
+
+async def session_store():
+    database = {}  # session_id -> saved messages
+
+    async def save_batch(batch):
+        for session_id, _, first_seq, messages in batch:
+            stored = database.setdefault(session_id, [])
+            del stored[first_seq:]
+            stored.extend(messages)
+
+    async def load_history(session_id):
+        await asyncio.sleep(DB_LATENCY)
+        return list(database.get(session_id, []))
+
+    writer = WriteBehindQueue(save_batch, flush_interval=0.01)
+    store = SessionStore(load_history, writer, max_bytes=CAP_MB * 1024 * 1024)
+    for user, turn in schedule():
+        session = await store.get(f"session_{user}", f"user_{user}")
+        assert len(session.history) == 2 * turn, "paged-in history lost messages"
+        first_seq = len(session.history)
+        store.append(session, message('user', f"Pregunta {turn}", f"user_{user}"))
+        store.append(session, message('assistant', f"{turn}: {ANSWER}", f"user_{user}"))
+        await writer.enqueue(session.session_id, session.username, first_seq, session.history[first_seq:])
+    await writer.stop()
+    print(f"session store         {store.bytes / 2 ** 20:8.1f} MB, {len(store.sessions)} sessions in memory "
+          f"(cap {CAP_MB} MB)")
+    print(f"                      {store.page_ins.value} page-ins, {store.evictions.value} evictions, "
+          f"{store.hits.value} hits, page-in p95 {store.page_in_latency.percentile(0.95) * 1000:.1f} ms")
+    print(f"                      {store.appended_bytes.value / (USERS * TURNS):.0f} bytes added per turn")
+
+
+def accounting_error() -> float:
+    """Ratio between the store's size accounting and the memory its sessions really take."""
+    store = SessionStore(None, None, max_sessions=USERS, max_bytes=1 << 40)
+    tracemalloc.start()
+    for user in range(200):
+        session = store.create(f"session_{user}", f"user_{user}")
+        for turn in range(TURNS):
+            store.append(session, message('user', f"Pregunta {turn}", f"user_{user}"))
+            store.append(session, message('assistant', f"{turn}: {ANSWER}", f"user_{user}"))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store.bytes / current
+
+
+if __name__ == "__main__":
+    print(f"{USERS} users x {TURNS} turns")
+    print(f"browser storage       {browser_storage():8.1f} MB, grows with every user and turn")
+    asyncio.run(session_store())
+    print(f"size accounting is {accounting_error():.2f}x the traced memory")
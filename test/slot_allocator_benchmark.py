@@ -0,0 +1,84 @@
+"""Slot allocations per second with 10k slots and 500 concurrent requesters.
+
+Compares the old scan of the user_list dict (as find_user_from_pool did over app.storage.general)
+with SlotAllocator, and checks that no slot is ever leased twice at the same time.
+Run with: python test/slot_allocator_benchmark.py
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.slots import SlotAllocator
+
+SLOTS = 10_000
+REQUESTERS = 500
+LEASES_PER_REQUESTER = 200
+HELD_SLOTS = 9_000  # slots leased by long sessions before the benchmark starts
+
+
+class ScanPool:
+    """The old implementation: scan every user for one that is not logged in."""
+
+    def __init__(self, usernames):
+        self.user_list = {u: {"username": u, "time_logged": None, "logged": False} for u in usernames}
+        self.lock = threading.Lock()  # the old code had none; without it slots are handed out twice
+
+    def lease(self):
+        with self.lock:
+            for username, user_data in self.user_list.items():
+                if not user_data.get('logged', False):
+                    user_data['logged'] = True
+                    user_data['time_logged'] = datetime.now().isoformat()
+                    return username
+        return None
+
+    def release(self, username):
+        with self.lock:
+            self.user_list[username]['logged'] = False
+            self.user_list[username]['time_logged'] = None
+
+
+def run(name: str, pool, leases_per_requester: int):
+    for _ in range(HELD_SLOTS):
+        pool.lease()
+    held = set()
+    held_lock = threading.Lock()
+    duplicates = 0
+    start_barrier = threading.Barrier(REQUESTERS)
+
+    def requester():
+        nonlocal duplicates
+        start_barrier.wait()
+        for _ in range(leases_per_requester):
+            username = pool.lease()
+            if username is None:
+                continue
+            with held_lock:
+                if username in held:
+                    duplicates += 1
+                held.add(username)
+            with held_lock:
+                held.discard(username)
+            pool.release(username)
+
+    threads = [threading.Thread(target=requester) for _ in range(REQUESTERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = REQUESTERS * leases_per_requester
+    print(f"{name:<16}{total / elapsed:>14,.0f} allocations/s   duplicates: {duplicates}")
+
+
+if __name__ == "__main__":
+    usernames = [f"user_{i}" for i in range(SLOTS)]
+    print(f"{SLOTS:,} slots, {HELD_SLOTS:,} already leased, {REQUESTERS} concurrent requesters")
+    run('dict scan', ScanPool(usernames), leases_per_requester=10)
+    allocator = SlotAllocator()
+    allocator.rebuild(usernames)
+    run('SlotAllocator', allocator, leases_per_requester=LEASES_PER_REQUESTER)
@@ -0,0 +1,130 @@
+"""Import time and time to first request of main.py.
+
+Starts `python main.py` RUNS times and measures from process start to the first 200 response of `/` and then
+of `/chat`, once with Postgres unreachable and, when the POSTGRES_* settings point at a reachable database,
+once with it up. One more start under `python -X importtime` breaks the import time of main.py down by the
+packages it imports. Also times importing utilities.database, which scripts like the migrations use.
+Run with: python test/startup_benchmark.py
+"""
+import os
+import secrets
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PORT = 8191
+RUNS = 5
+TOP_IMPORTS = 8
+
+
+def postgres_reachable() -> bool:
+    try:
+        psycopg2.connect(host=os.getenv('POSTGRES_HOST'), database=os.getenv('POSTGRES_DB'),
+                         user=os.getenv('POSTGRES_USER'), password=os.getenv('POSTGRES_PASSWORD'),
+                         port=os.getenv('POSTGRES_PORT', '5432'), connect_timeout=3).close()
+        return True
+    except psycopg2.OperationalError:
+        return False
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(storage: str, postgres_up: bool, stderr, python_args: tuple = ()) -> subprocess.Popen:
+    env = dict(os.environ, PORT=str(PORT), RELOAD='false', STORAGE_SECRET=secrets.token_hex(32),
+               NICEGUI_STORAGE_PATH=storage)
+    if not postgres_up:
+        env.update(POSTGRES_HOST='127.0.0.1', POSTGRES_PORT=str(closed_port()))
+    return subprocess.Popen([sys.executable, *python_args, 'main.py'], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=stderr, start_new_session=True)
+
+
+def stop_app(process: subprocess.Popen):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def wait_for(client: httpx.Client, path: str, start: float, timeout: float = 60) -> float:
+    """Seconds from `start` until `path` answers 200."""
+    while time.perf_counter() - start < timeout:
+        try:
+            if client.get(f'http://127.0.0.1:{PORT}{path}').status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f'{path} did not answer within {timeout:.0f}s')
+
+
+def first_requests(postgres_up: bool) -> tuple:
+    """Median seconds to the first `/` and the first `/chat` after start."""
+    home, chat = [], []
+    with tempfile.TemporaryDirectory() as storage, httpx.Client(timeout=30) as client:
+        for run in range(RUNS):
+            start = time.perf_counter()
+            process = start_app(os.path.join(storage, str(run)), postgres_up, subprocess.DEVNULL)
+            try:
+                home.append(wait_for(client, '/', start))
+                chat.append(wait_for(client, '/chat', start))
+            finally:
+                stop_app(process)
+    return statistics.median(home), statistics.median(chat)
+
+
+def import_times() -> tuple:
+    """Total import time of main.py and the cumulative time of its slowest top-level imports, in seconds."""
+    with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryFile('w+') as stderr:
+        process = start_app(storage, False, stderr, ('-X', 'importtime'))
+        try:
+            with httpx.Client(timeout=30) as client:
+                wait_for(client, '/', time.perf_counter())
+        finally:
+            stop_app(process)
+        stderr.seek(0)
+        top_level = {}
+        for line in stderr:
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit() and not name.startswith('  ', 1):
+                top_level[name.strip()] = top_level.get(name.strip(), 0) + int(cumulative) / 1e6
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+    return sum(top_level.values()), slowest
+
+
+def script_import_time() -> float:
+    result = subprocess.run([sys.executable, '-c', 'import time; start = time.perf_counter(); '
+                             'import utilities.database; print(time.perf_counter() - start)'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout)
+
+
+if __name__ == "__main__":
+    total, slowest = import_times()
+    print(f"main.py imports: {total * 1000:.0f} ms")
+    for name, seconds in slowest:
+        print(f"  {name:<40}{seconds * 1000:>8.0f} ms")
+    print(f"import utilities.database: {script_import_time() * 1000:.0f} ms")
+    print(f"\nTime to first request, median of {RUNS} starts")
+    print(f"{'postgres':>10}{'/ ms':>10}{'/chat ms':>10}")
+    for postgres_up in ((False, True) if postgres_reachable() else (False,)):
+        home, chat = first_requests(postgres_up)
+        print(f"{'up' if postgres_up else 'down':>10}{home * 1000:>10.0f}{chat * 1000:>10.0f}")
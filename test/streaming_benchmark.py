@@ -0,0 +1,51 @@
+"""Time-to-first-token for streamed answers versus waiting for the full LangFlow response.
+
+Run with: python test/streaming_benchmark.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.dirname(__file__))
+from utilities import metrics
+from utilities.langflow_client import LangFlowClient
+from mock_langflow import MockLangFlowServer, create_app
+
+CONCURRENT_CHATS = 20
+FIRST_TOKEN_DELAY = 0.5  # seconds before the mock emits its first token
+TOKENS = 100
+TOKEN_DELAY = 0.02  # seconds between tokens
+ENDPOINT = 'bench'
+
+
+def payload(i: int) -> dict:
+    return {"input_value": f"Hola {i}", "output_type": "chat", "input_type": "chat",
+            "user": f"user_{i}", "session_id": f"session_{i}"}
+
+
+async def main():
+    app = create_app(delay=FIRST_TOKEN_DELAY, tokens=TOKENS, token_delay=TOKEN_DELAY)
+    with MockLangFlowServer(app) as server:
+        client = LangFlowClient(server.base_url, ENDPOINT)
+        client.client
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client.run(payload(i)) for i in range(CONCURRENT_CHATS)))
+        blocking_wall = time.perf_counter() - start
+        full_response = metrics.histogram('langflow_latency_seconds').snapshot()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client.stream(payload(i), lambda chunk: None) for i in range(CONCURRENT_CHATS)))
+        streaming_wall = time.perf_counter() - start
+        ttft = metrics.histogram('langflow_ttft_seconds').snapshot()
+        await client.close()
+
+    print(f"{CONCURRENT_CHATS} concurrent chats, {TOKENS} tokens per answer")
+    print(f"full response wait  p50 {full_response['p50']:.2f}s  p95 {full_response['p95']:.2f}s  (wall {blocking_wall:.2f}s)")
+    print(f"time to first token p50 {ttft['p50']:.2f}s  p95 {ttft['p95']:.2f}s  (wall {streaming_wall:.2f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
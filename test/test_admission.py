@@ -0,0 +1,109 @@
+"""Behaviour of the /chat admission queue: pool sizing between its bounds and handing freed slots to the line.
+
+Run with: python -m pytest test
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.admission import AdmissionQueue
+from utilities.slots import SlotAllocator
+
+
+def admission(min_size=2, max_size=5, spare_slots=1):
+    slots = SlotAllocator()
+    names = iter(f'user_{n}' for n in range(1000))
+    queue = AdmissionQueue(slots, min_size=min_size, max_size=max_size, spare_slots=spare_slots,
+                           new_usernames=lambda count: [next(names) for _ in range(count)])
+    queue.resize()
+    return queue, slots
+
+
+def test_idle_pool_stays_at_min_size():
+    queue, slots = admission()
+    assert slots.capacity == 2
+    queue.resize()
+    assert slots.capacity == 2
+
+
+def test_pool_grows_with_demand_up_to_max_size():
+    queue, slots = admission()
+    assert queue.try_admit() and queue.try_admit()
+    assert queue.try_admit() is None
+    tickets = [queue.join() for _ in range(5)]
+    assert queue.target_size() == 5  # 2 in use + 5 waiting + 1 spare, capped
+    queue.resize()
+    assert slots.capacity == 5
+    # The new slots went to the head of the line
+    assert [queue.claim(ticket) is not None for ticket in tickets] == [True, True, True, False, False]
+    assert queue.position(tickets[3]) == 1
+
+
+def test_pool_does_not_grow_without_backend_headroom():
+    queue, slots = admission()
+    queue.try_admit()
+    queue.try_admit()
+    queue.join()
+    queue.has_headroom = lambda: False
+    assert queue.target_size() == 2
+    queue.resize()
+    assert slots.capacity == 2
+
+
+def test_pool_shrinks_back_without_removing_leased_slots():
+    queue, slots = admission(min_size=1, max_size=4, spare_slots=0)
+    admitted = [queue.try_admit()]
+    tickets = [queue.join() for _ in range(3)]
+    queue.resize()
+    admitted += [queue.claim(ticket) for ticket in tickets]
+    assert slots.capacity == 4 and None not in admitted
+    for username in admitted[1:]:
+        slots.release(username)
+    queue.resize()
+    assert slots.capacity == 1
+    assert slots.usernames() == [admitted[0]]
+
+
+def test_freed_slot_goes_to_the_head_of_the_line():
+    queue, slots = admission(max_size=2)
+    first, second = queue.try_admit(), queue.try_admit()
+    ahead, behind = queue.join(), queue.join()
+    slots.release(second)
+    assert queue.claim(behind) is None
+    assert queue.claim(ahead) == second
+    assert queue.position(behind) == 1
+
+
+def test_cancelled_reservation_passes_the_slot_on():
+    queue, slots = admission(max_size=2)
+    queue.try_admit()
+    second = queue.try_admit()
+    ahead, behind = queue.join(), queue.join()
+    slots.release(second)
+    queue.cancel(ahead)  # left before claiming the reserved slot
+    assert queue.claim(behind) == second
+
+
+def test_rebuilt_pool_reserves_new_slots_for_the_line():
+    queue, slots = admission(max_size=2)
+    queue.try_admit()
+    second = queue.try_admit()
+    reserved, waiting = queue.join(), queue.join()
+    slots.release(second)
+    slots.reset()  # every lease ends, including the one reserved for `reserved`
+    assert queue.position(waiting) is None  # both tickets got one of the freed slots, in line order
+    claimed = {queue.claim(reserved), queue.claim(waiting)}
+    assert claimed == set(slots.usernames())
+    assert queue.try_admit() is None  # no slot is handed out twice
+
+
+def test_rebuilt_pool_keeps_the_line_order_when_slots_run_short():
+    queue, slots = admission(max_size=2)
+    queue.try_admit()
+    second = queue.try_admit()
+    reserved, first_waiting, second_waiting = queue.join(), queue.join(), queue.join()
+    slots.release(second)
+    slots.rebuild(['user_a'])
+    assert queue.claim(reserved) == 'user_a'
+    assert queue.position(first_waiting) == 1 and queue.position(second_waiting) == 2
+    assert queue.try_admit() is None
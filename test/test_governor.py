@@ -0,0 +1,129 @@
+"""Behaviour of the LangFlow concurrency governor: AIMD limit, wait queue and circuit breaker states.
+
+Run with: python -m pytest test
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities import governor
+from utilities.governor import BackendBusy, CircuitBreaker, ConcurrencyGovernor
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the governor module, moved forward by the tests."""
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(governor, 'time', SimpleNamespace(monotonic=lambda: fake.now))
+    return fake
+
+
+def test_limit_grows_additively_within_target_latency(clock):
+    limiter = ConcurrencyGovernor(initial_limit=4, max_limit=5, target_latency=1.0)
+    for _ in range(4):
+        limiter.in_flight += 1
+        limiter.release(0.5, True)
+    assert limiter.limit == pytest.approx(4.9, abs=0.05)  # about one more per `limit` good calls
+    for _ in range(10):
+        limiter.in_flight += 1
+        limiter.release(0.5, True)
+    assert limiter.limit == 5
+
+
+def test_limit_halves_at_most_once_per_target_latency(clock):
+    limiter = ConcurrencyGovernor(initial_limit=16, min_limit=3, target_latency=1.0, breaker=CircuitBreaker(100))
+    limiter.in_flight = 3
+    limiter.release(0.1, False)
+    limiter.release(5.0, True)  # too slow, but within the same target latency window
+    assert limiter.limit == 8
+    clock.now += 1
+    limiter.release(5.0, True)
+    assert limiter.limit == 4
+    clock.now += 1
+    limiter.in_flight += 1
+    limiter.release(0.1, False)
+    assert limiter.limit == 3
+
+
+def test_abandoned_call_leaves_the_limit_alone(clock):
+    limiter = ConcurrencyGovernor(initial_limit=4)
+    limiter.in_flight = 1
+    limiter.release(100.0, None)
+    assert (limiter.limit, limiter.in_flight, limiter.breaker.state) == (4, 0, 'closed')
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_half_open_breaker_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == 30
+
+
+def test_callers_over_the_limit_wait_in_line():
+    async def scenario():
+        limiter = ConcurrencyGovernor(initial_limit=1, max_queued=1, queue_timeout=5)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 1
+        with pytest.raises(BackendBusy):
+            await limiter.acquire()  # the line is full
+        limiter.release(0.1, True)
+        await asyncio.wait_for(waiting, 1)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert (limiter.in_flight, len(limiter.waiters)) == (1, 0)
+
+
+def test_opening_breaker_fails_the_whole_line():
+    async def scenario():
+        limiter = ConcurrencyGovernor(initial_limit=1, queue_timeout=5, breaker=CircuitBreaker(failure_threshold=1))
+        await limiter.acquire()
+        rejected = limiter.rejected.value
+        waiting = [asyncio.create_task(limiter.acquire()) for _ in range(3)]
+        await asyncio.sleep(0)
+        limiter.release(0.1, False)
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        with pytest.raises(BackendBusy):
+            await limiter.acquire()
+        return limiter, results, limiter.rejected.value - rejected
+
+    limiter, results, rejected = asyncio.run(scenario())
+    assert all(isinstance(result, BackendBusy) for result in results)
+    assert rejected == 4  # the three failed waiters and the caller turned away after them
+    assert limiter.busy and limiter.in_flight == 0
@@ -0,0 +1,132 @@
+"""Behaviour of the write-behind queue: seq checks, coalescing and re-queueing of failed flushes.
+
+Run with: python -m pytest test
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.persistence import WriteBehindQueue
+
+
+def message(content):
+    return {"role": "user", "content": content}
+
+
+class FlakyStore:
+    """save_batch stand-in that fails the first `failures` calls and records the batches it saved."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.saved = []
+
+    async def save_batch(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("database unavailable")
+        self.saved.extend(batch)
+
+
+def queue_for(store, **kwargs):
+    # The worker sleeps through the test; flushes are driven by hand
+    return WriteBehindQueue(store.save_batch, flush_interval=60, retry_delay=0, **kwargs)
+
+
+def test_contiguous_saves_of_a_session_are_coalesced():
+    async def scenario():
+        queue = queue_for(FlakyStore())
+        coalesced = queue.coalesced.value
+        await queue.enqueue('s1', 'user_1', 0, [message('a'), message('b')])
+        await queue.enqueue('s1', 'user_1', 2, [message('c'), message('d')])
+        return queue, queue.coalesced.value - coalesced
+
+    queue, coalesced = asyncio.run(scenario())
+    assert coalesced == 1
+    assert queue.pending['s1'] == ('s1', 'user_1', 0, [message('a'), message('b'), message('c'), message('d')])
+
+
+@pytest.mark.parametrize('first_seq', [0, 1, 3])
+def test_non_contiguous_save_is_rejected(first_seq):
+    async def scenario():
+        queue = queue_for(FlakyStore())
+        await queue.enqueue('s1', 'user_1', 0, [message('a'), message('b')])
+        with pytest.raises(ValueError):
+            await queue.enqueue('s1', 'user_1', first_seq, [message('c')])
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.pending['s1'] == ('s1', 'user_1', 0, [message('a'), message('b')])
+
+
+def test_failed_flush_is_requeued_ahead_and_merged_with_newer_saves():
+    async def scenario():
+        store = FlakyStore(failures=1)
+        queue = queue_for(store)
+        await queue.enqueue('s1', 'user_1', 0, [message('a'), message('b')])
+        await queue.enqueue('s2', 'user_2', 0, [message('x')])
+        batch_size, queue.batch_size = queue.batch_size, 1
+        assert not await queue._flush_batch()  # s1 fails while s2 still waits
+        queue.batch_size = batch_size
+        await queue.enqueue('s1', 'user_1', 2, [message('c')])
+        assert list(queue.pending) == ['s1', 's2']
+        assert queue.pending['s1'] == ('s1', 'user_1', 0, [message('a'), message('b'), message('c')])
+        assert await queue._flush_batch()
+        return store, queue
+
+    store, queue = asyncio.run(scenario())
+    assert not queue.pending
+    assert store.saved == [('s1', 'user_1', 0, [message('a'), message('b'), message('c')]),
+                           ('s2', 'user_2', 0, [message('x')])]
+
+
+def test_unsaved_covers_in_flight_and_pending_saves():
+    async def scenario():
+        queue = queue_for(FlakyStore())
+        seen = []
+
+        async def save_batch(batch):
+            # A turn of the same session arrives while its earlier save is being written
+            await queue.enqueue('s1', 'user_1', 2, [message('c')])
+            seen.extend(queue.unsaved('s1'))
+
+        queue.save_batch = save_batch
+        await queue.enqueue('s1', 'user_1', 0, [message('a'), message('b')])
+        await queue._flush_batch()
+        return queue, seen
+
+    queue, seen = asyncio.run(scenario())
+    assert seen == [('s1', 'user_1', 0, [message('a'), message('b')]), ('s1', 'user_1', 2, [message('c')])]
+    assert queue.unsaved('s1') == [('s1', 'user_1', 2, [message('c')])]
+
+
+def test_enqueue_waits_for_space_when_full():
+    async def scenario():
+        queue = queue_for(FlakyStore(), max_pending=1)
+        await queue.enqueue('s1', 'user_1', 0, [message('a')])
+        await queue.enqueue('s1', 'user_1', 1, [message('b')])  # coalesced saves do not need space
+        blocked = asyncio.create_task(queue.enqueue('s2', 'user_2', 0, [message('x')]))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await queue._flush_batch()
+        await asyncio.wait_for(blocked, 1)
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert list(queue.pending) == ['s2']
+
+
+def test_stop_flushes_everything_pending():
+    async def scenario():
+        store = FlakyStore(failures=1)
+        queue = WriteBehindQueue(store.save_batch, flush_interval=0, retry_delay=0)
+        await queue.enqueue('s1', 'user_1', 0, [message('a')])
+        await queue.enqueue('s2', 'user_2', 0, [message('x')])
+        await queue.stop()
+        return store, queue
+
+    store, queue = asyncio.run(scenario())
+    assert not queue.pending
+    assert sorted(save[0] for save in store.saved) == ['s1', 's2']
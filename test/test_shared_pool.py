@@ -0,0 +1,80 @@
+"""Behaviour of the Postgres-shared user pool against an in-memory stand-in for pool_slots.
+
+Run with: python -m pytest test
+"""
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities.admission import AdmissionQueue
+from utilities.shared_pool import SharedSlotPool
+from utilities.slots import SlotAllocator
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakeDB:
+    """Answers the give-back and heartbeat statements from a dict of username -> owner."""
+
+    def __init__(self, owners):
+        self.owners = owners
+        self.failures = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+    async def execute(self, sql, params=None, prepare=False):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("database unavailable")
+        if 'SET owner = NULL' in sql:
+            owner, usernames = params
+            for username in usernames:
+                if self.owners.get(username) == owner:
+                    self.owners[username] = None
+            return FakeCursor([])
+        _, owner = params  # heartbeat
+        return FakeCursor([(username,) for username, holder in self.owners.items() if holder == owner])
+
+
+def shared_pool(count, owners):
+    slots = SlotAllocator()
+    slots.rebuild([f'user_{n}' for n in range(count)])
+    queue = AdmissionQueue(slots, min_size=1, max_size=count, spare_slots=0)
+    return SharedSlotPool(FakeDB(owners), queue, worker_id='web-1'), slots
+
+
+def test_failed_give_back_is_retried_by_the_next_resize():
+    pool, slots = shared_pool(3, {f'user_{n}': 'web-1' for n in range(3)})
+    pool.db.failures = 1
+    try:
+        asyncio.run(pool.resize())
+    except OSError:
+        pass
+    assert slots.capacity == 1
+    assert pool.unreturned == ['user_2', 'user_1']
+    asyncio.run(pool.resize())
+    assert pool.unreturned == []
+    assert pool.db.owners == {'user_0': 'web-1', 'user_1': None, 'user_2': None}
+
+
+def test_slots_taken_over_by_another_process_lose_their_lease():
+    pool, slots = shared_pool(2, {'user_0': 'web-1', 'user_1': 'web-2'})
+    released = []
+    slots.release_listeners.append(lambda username, held: released.append(username))
+    slots.acquire('user_1')
+    taken_over = pool.taken_over.value
+    asyncio.run(pool.heartbeat())
+    assert slots.usernames() == ['user_0']
+    assert released == ['user_1']
+    assert pool.taken_over.value - taken_over == 1
+    assert not slots.renew('user_1')
@@ -0,0 +1,130 @@
+"""Behaviour of SlotAllocator: leasing, renewal, reaping of expired leases and the free/leased indexes.
+
+Run with: python -m pytest test
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utilities import slots
+from utilities.slots import SlotAllocator
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the slots module, moved forward by the tests."""
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(slots, 'time', SimpleNamespace(monotonic=lambda: fake.now))
+    return fake
+
+
+def allocator(count=3, lease_ttl=10.0):
+    pool = SlotAllocator(lease_ttl=lease_ttl, reap_interval=1.0)
+    pool.rebuild([f'user_{n}' for n in range(count)])
+    return pool
+
+
+def leased(pool):
+    return sorted(row['username'] for row in pool.query(0, 100, logged=True)[1])
+
+
+def free(pool):
+    return sorted(row['username'] for row in pool.query(0, 100, logged=False)[1])
+
+
+def test_leases_longest_free_first_until_exhausted(clock):
+    pool = allocator()
+    assert [pool.lease() for _ in range(3)] == ['user_0', 'user_1', 'user_2']
+    assert pool.lease() is None
+    pool.release('user_1')
+    pool.release('user_0')
+    assert pool.lease() == 'user_1'
+
+
+def test_indexes_follow_lease_and_release(clock):
+    pool = allocator()
+    pool.lease()
+    assert pool.acquire('user_2')
+    assert not pool.acquire('user_2')
+    assert not pool.acquire('user_9')
+    assert (pool.capacity, pool.available, pool.in_use) == (3, 1, 2)
+    assert leased(pool) == ['user_0', 'user_2']
+    assert free(pool) == ['user_1']
+    pool.release('user_0')
+    pool.release('user_0')  # releasing a free slot changes nothing
+    assert leased(pool) == ['user_2']
+    assert free(pool) == ['user_0', 'user_1']
+
+
+def test_reaper_reclaims_expired_leases(clock):
+    pool = allocator()
+    released = []
+    pool.release_listeners.append(lambda username, held: released.append(username))
+    pool.lease()
+    clock.now += 9
+    assert pool.reap() == 0
+    clock.now += 2
+    assert pool.reap() == 1
+    assert released == ['user_0']
+    assert free(pool) == ['user_0', 'user_1', 'user_2']
+
+
+def test_renewed_lease_outlives_its_first_deadline(clock):
+    pool = allocator()
+    pool.lease()
+    clock.now += 8
+    pool.renew('user_0')
+    clock.now += 8  # past the first deadline, before the renewed one
+    assert pool.reap() == 0
+    assert leased(pool) == ['user_0']
+    clock.now += 3
+    assert pool.reap() == 1
+
+
+def test_renewal_with_a_shorter_ttl_expires_sooner(clock):
+    pool = allocator()
+    pool.lease()
+    pool.renew('user_0', ttl=2)
+    clock.now += 3
+    assert pool.reap() == 1
+
+
+def test_stale_timer_of_an_earlier_lease_is_ignored(clock):
+    pool = allocator(count=1)
+    pool.lease()
+    clock.now += 5
+    pool.release('user_0')
+    assert pool.lease() == 'user_0'  # leased again, due 10 s from now
+    clock.now += 6  # the first lease's timer fires
+    assert pool.reap() == 0
+    clock.now += 5
+    assert pool.reap() == 1
+
+
+def test_stale_lease_token_cannot_touch_the_next_lease(clock):
+    pool = allocator(count=1)
+    pool.lease()
+    stale = pool.lease_token('user_0')
+    pool.release('user_0')
+    pool.lease()
+    current = pool.lease_token('user_0')
+    assert not pool.renew('user_0', ttl=1, token=stale)
+    pool.release('user_0', token=stale)
+    assert leased(pool) == ['user_0']
+    clock.now += 5
+    assert pool.reap() == 0  # the stale renewal did not shorten the lease
+    assert pool.renew('user_0', token=current)
+    pool.release('user_0', token=current)
+    assert free(pool) == ['user_0']
+    assert pool.lease_token('user_0') is None
+
+
+def test_shrink_only_removes_free_slots(clock):
+    pool = allocator()
+    pool.acquire('user_2')
+    assert pool.shrink(5) == ['user_1', 'user_0']
+    assert pool.usernames() == ['user_2']
+    assert pool.remove(['user_2']) == []
@@ -0,0 +1,33 @@
+import os
+import secrets
+
+from fastapi import HTTPException, Request
+from nicegui import app
+
+# Unlocks the conversation export and search; both stay closed while it is not set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+def _matches(candidate: str) -> bool:
+    return bool(ADMIN_TOKEN and candidate) and secrets.compare_digest(candidate.encode(), ADMIN_TOKEN.encode())
+
+
+def is_admin(request: Request, token: str = '') -> bool:
+    """Whether the request carries the admin token.
+
+    It comes as a `token` query parameter, which the browser storage then remembers for the following requests,
+    or as an `Authorization: Bearer` header, e.g. from scripts.
+    """
+    if _matches(token):
+        app.storage.browser['admin_token'] = token
+        return True
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer ') and _matches(authorization[len('Bearer '):]):
+        return True
+    return _matches(app.storage.browser.get('admin_token', ''))
+
+
+def require_admin(request: Request, token: str = ''):
+    """Answer 401 unless the request carries the admin token."""
+    if not is_admin(request, token):
+        raise HTTPException(status_code=401, detail='Admin token required')
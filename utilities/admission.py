@@ -0,0 +1,153 @@
+import asyncio
+import math
+import os
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from utilities import metrics
+from utilities.slots import SlotAllocator, user_slots
+
+
+class AdmissionQueue:
+    """FIFO admission control for /chat in front of a SlotAllocator.
+
+    Visitors that find no free slot take a ticket and wait in line. When a slot frees up it is
+    leased for the ticket at the head of the line, which then claims it. The pool grows towards
+    `max_size` while people are waiting and the LangFlow backend has headroom, and shrinks back
+    towards `min_size` when slots sit idle.
+    """
+
+    def __init__(self, slots: SlotAllocator, min_size: int = 25, max_size: int = 50, spare_slots: int = 2,
+                 resize_interval: float = 10.0, default_session_length: float = 600.0,
+                 new_usernames: Callable[[int], list] = None):
+        self.slots = slots
+        self.min_size = min_size
+        self.max_size = max_size
+        self.spare_slots = spare_slots
+        self.resize_interval = resize_interval
+        self.new_usernames = new_usernames or (lambda count: [f"user_{uuid.uuid4()}" for _ in range(count)])
+        self.has_headroom: Callable[[], bool] = lambda: True
+        self.waiting: 'OrderedDict[str, None]' = OrderedDict()  # tickets in arrival order
+        self.reserved: Dict[str, str] = {}  # ticket -> username leased for it
+        self.session_length = default_session_length  # moving average of observed sessions, in seconds
+
+        slots.release_listeners.append(self._on_release)
+        slots.rebuild_listeners.append(self.reset)
+        metrics.gauge('admission_waiting', lambda: len(self.waiting))
+        self.admitted = metrics.counter('admission_admitted_total')
+        self.queued = metrics.counter('admission_queued_total')
+        self.resized = metrics.counter('admission_pool_resizes_total')
+
+    def try_admit(self) -> Optional[str]:
+        """Lease a slot right away, unless all are taken or others are already waiting."""
+        if self.waiting:
+            return None
+        username = self.slots.lease()
+        if username is not None:
+            self.admitted.inc()
+        return username
+
+    def join(self) -> str:
+        """Queue a new visitor and return their ticket."""
+        ticket = str(uuid.uuid4())
+        self.waiting[ticket] = None
+        self.queued.inc()
+        self.dispatch()
+        return ticket
+
+    def claim(self, ticket: str) -> Optional[str]:
+        """Username reserved for `ticket`, if its turn has come."""
+        username = self.reserved.pop(ticket, None)
+        if username is not None:
+            self.admitted.inc()
+        return username
+
+    def cancel(self, ticket: str):
+        """The visitor left: drop the ticket and give back a slot reserved for it."""
+        self.waiting.pop(ticket, None)
+        username = self.reserved.get(ticket)
+        if username is not None:
+            self.slots.release(username)  # the release listener drops the reservation
+
+    def position(self, ticket: str) -> Optional[int]:
+        """1-based place in line, or None once the ticket is no longer waiting."""
+        for position, waiting_ticket in enumerate(self.waiting, start=1):
+            if waiting_ticket == ticket:
+                return position
+        return None
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until `position` visitors ahead have been admitted, at the observed turnover rate."""
+        capacity = max(self.slots.capacity, 1)
+        return position * self.session_length / capacity
+
+    def dispatch(self):
+        """Hand free slots to the visitors at the head of the line."""
+        while self.waiting:
+            username = self.slots.lease()
+            if username is None:
+                return
+            ticket, _ = self.waiting.popitem(last=False)
+            self.reserved[ticket] = username
+
+    def reset(self):
+        """Hand out the slots of a replaced pool again.
+
+        Every lease ended with the old pool, so the tickets a slot was reserved for go back to the head of the line.
+        """
+        for ticket in reversed(list(self.reserved)):
+            self.waiting[ticket] = None
+            self.waiting.move_to_end(ticket, last=False)
+        self.reserved.clear()
+        self.dispatch()
+
+    def _on_release(self, username: str, held: float):
+        for ticket, reserved_username in list(self.reserved.items()):
+            if reserved_username == username:
+                del self.reserved[ticket]  # never claimed, the reaper took the slot back
+                break
+        else:
+            self.session_length = 0.9 * self.session_length + 0.1 * held
+        self.dispatch()
+
+    def target_size(self) -> int:
+        """Pool size for the current demand and backend headroom, between the bounds."""
+        demand = self.slots.in_use + len(self.waiting) + self.spare_slots
+        target = min(max(demand, self.min_size), self.max_size)
+        if not self.has_headroom():
+            # LangFlow is saturated: admit nobody beyond the chats already running
+            target = max(min(target, self.slots.in_use), self.min_size)
+        return target
+
+    def resize(self):
+        """Grow or shrink the pool between its bounds according to demand and backend headroom."""
+        target = self.target_size()
+        capacity = self.slots.capacity
+        if target > capacity:
+            self.slots.grow(self.new_usernames(target - capacity))
+            self.resized.inc()
+            self.dispatch()
+        elif target < capacity and self.slots.shrink(capacity - target):
+            self.resized.inc()
+
+    async def run(self):
+        """Resize the pool every `resize_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.resize_interval)
+            self.resize()
+
+
+def format_wait(seconds: float) -> str:
+    minutes = math.ceil(seconds / 60)
+    return f'about {minutes} minute{"s" if minutes != 1 else ""}'
+
+
+# Shared admission queue for the chat page
+admission_queue = AdmissionQueue(
+    user_slots,
+    min_size=int(os.environ.get("POOL_MIN_SIZE", "25")),
+    max_size=int(os.environ.get("POOL_MAX_SIZE", "50")),
+    spare_slots=int(os.environ.get("POOL_SPARE_SLOTS", "2")),
+    resize_interval=float(os.environ.get("POOL_RESIZE_INTERVAL", "10")),
+)
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from psycopg.rows import dict_row
+
+from utilities import metrics
+from utilities.async_database import AsyncUserDB, async_user_db
+
+# The rollup queries recompute what `{changed}` selects: the messages of transactions that had not committed when
+# the previous refresh took its snapshot, or every message on the first refresh
+CHANGED_SINCE = 'inserted_xid >= %(since)s::xid8'
+ALL_MESSAGES = 'TRUE'
+
+REFRESH_HOURLY = '''
+    INSERT INTO analytics_hourly (hour, sessions_started, active_sessions, active_users,
+                                  user_messages, assistant_messages, user_chars, assistant_chars)
+    SELECT h.hour,
+           (SELECT count(*) FROM conversations c
+            WHERE c.save_time >= h.hour AND c.save_time < h.hour + interval '1 hour'),
+           m.active_sessions, m.active_users, m.user_messages, m.assistant_messages, m.user_chars, m.assistant_chars
+    FROM (
+        SELECT DISTINCT date_trunc('hour', created_at) AS hour FROM conversation_messages WHERE {changed}
+    ) h
+    CROSS JOIN LATERAL (
+        SELECT count(DISTINCT session_id) AS active_sessions,
+               count(DISTINCT agent) AS active_users,
+               count(*) FILTER (WHERE role = 'user') AS user_messages,
+               count(*) FILTER (WHERE role <> 'user') AS assistant_messages,
+               coalesce(sum(length(content)) FILTER (WHERE role = 'user'), 0) AS user_chars,
+               coalesce(sum(length(content)) FILTER (WHERE role <> 'user'), 0) AS assistant_chars
+        FROM conversation_messages
+        WHERE created_at >= h.hour AND created_at < h.hour + interval '1 hour'
+    ) m
+    ON CONFLICT (hour) DO UPDATE SET
+        sessions_started = EXCLUDED.sessions_started,
+        active_sessions = EXCLUDED.active_sessions,
+        active_users = EXCLUDED.active_users,
+        user_messages = EXCLUDED.user_messages,
+        assistant_messages = EXCLUDED.assistant_messages,
+        user_chars = EXCLUDED.user_chars,
+        assistant_chars = EXCLUDED.assistant_chars
+'''
+
+REFRESH_SESSIONS = '''
+    INSERT INTO analytics_sessions (session_id, username, started_at, last_message_at, turns, messages, total_chars)
+    SELECT session_id, min(agent), min(created_at), max(created_at),
+           count(*) FILTER (WHERE role = 'user'), count(*), sum(length(content))
+    FROM conversation_messages
+    WHERE session_id IN (SELECT DISTINCT session_id FROM conversation_messages WHERE {changed})
+    GROUP BY session_id
+    ON CONFLICT (session_id) DO UPDATE SET
+        username = EXCLUDED.username,
+        started_at = EXCLUDED.started_at,
+        last_message_at = EXCLUDED.last_message_at,
+        turns = EXCLUDED.turns,
+        messages = EXCLUDED.messages,
+        total_chars = EXCLUDED.total_chars
+'''
+
+
+class Analytics:
+    """Activity reports for /admin, read from rollup tables instead of the raw conversations.
+
+    `refresh` only recomputes the hours and sessions of the messages stored since the previous refresh.
+    They are found by the transaction that inserted them rather than by created_at: a message can be
+    committed long after it was written (LangFlow latency, write-behind, retries), and every transaction
+    still running when a refresh starts has an id at or above that refresh's snapshot xmin, so the next
+    refresh picks up its messages whenever it commits. Recomputing a bucket is idempotent.
+    """
+
+    def __init__(self, db: AsyncUserDB, refresh_interval: float = 60.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.refresh_latency = metrics.histogram('analytics_refresh_seconds')
+
+    async def refresh(self):
+        """Bring the rollups up to date with the messages stored since the last refresh."""
+        start = time.perf_counter()
+        async with self.db.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT snapshot_xmin::text FROM analytics_state WHERE name = 'rollups' FOR UPDATE")
+            row = await cursor.fetchone()
+            since = row[0] if row else None
+            # Taken before the rollup queries: transactions below it have committed, so those queries see them
+            cursor = await conn.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text')
+            snapshot_xmin = (await cursor.fetchone())[0]
+            # The first refresh covers everything, including the messages stored before inserted_xid existed
+            changed = CHANGED_SINCE if since is not None else ALL_MESSAGES
+            await conn.execute(REFRESH_HOURLY.format(changed=changed), {"since": since})
+            await conn.execute(REFRESH_SESSIONS.format(changed=changed), {"since": since})
+            await conn.execute('''
+                INSERT INTO analytics_state (name, watermark, snapshot_xmin) VALUES ('rollups', now(), %s::xid8)
+                ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, snapshot_xmin = EXCLUDED.snapshot_xmin
+            ''', (snapshot_xmin,))
+        self.refresh_latency.observe(time.perf_counter() - start)
+
+    async def refresh_periodically(self):
+        """Refresh the rollups every `refresh_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Analytics refresh failed: {e}")
+
+    async def hourly(self, hours: int = 48) -> List[Dict[str, Any]]:
+        """Activity per hour over the last `hours` hours, oldest first."""
+        async with self.db.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute('''
+                    SELECT hour, sessions_started, active_sessions, active_users,
+                           user_messages, assistant_messages,
+                           user_chars / NULLIF(user_messages, 0) AS avg_user_chars,
+                           assistant_chars / NULLIF(assistant_messages, 0) AS avg_assistant_chars
+                    FROM analytics_hourly
+                    WHERE hour >= %s
+                    ORDER BY hour
+                ''', (datetime.now() - timedelta(hours=hours),), prepare=True)
+                return await cursor.fetchall()
+
+    async def turns_per_session(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Number of sessions started in the last `days` days by how many turns they had."""
+        async with self.db.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute('''
+                    SELECT CASE WHEN turns >= 20 THEN '20+' ELSE turns::text END AS turns,
+                           count(*) AS sessions
+                    FROM analytics_sessions
+                    WHERE started_at >= %s
+                    GROUP BY 1
+                    ORDER BY min(turns)
+                ''', (datetime.now() - timedelta(days=days),), prepare=True)
+                return await cursor.fetchall()
+
+    async def summary(self, days: int = 7) -> Dict[str, Any]:
+        """Totals over the last `days` days."""
+        async with self.db.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute('''
+                    SELECT count(*) AS sessions,
+                           count(DISTINCT username) AS users,
+                           coalesce(avg(turns), 0)::float AS avg_turns,
+                           coalesce(sum(messages), 0) AS messages,
+                           coalesce(round(sum(total_chars) / NULLIF(sum(messages), 0)), 0)::bigint AS avg_message_chars
+                    FROM analytics_sessions
+                    WHERE started_at >= %s
+                ''', (datetime.now() - timedelta(days=days),), prepare=True)
+                return await cursor.fetchone()
+
+
+# Shared analytics over the async pool, refreshed in the background
+analytics = Analytics(
+    async_user_db,
+    refresh_interval=float(os.environ.get("ANALYTICS_REFRESH_INTERVAL", "60")),
+)
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import psycopg
+from dotenv import load_dotenv
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from utilities import metrics
+from utilities.history_codec import decode_history
+from utilities.schema import (CREATE_MIGRATIONS_TABLE, MIGRATION_LOCK_KEY, MessageBatch, SCHEMA_VERSION,
+                              history_from_rows, message_rows, pending_migrations)
+
+load_dotenv()
+
+# Matches ranked by relevance, one page after the keyset cursor (rank, session_id, seq); the snippet
+# is only built for the rows of the page
+SEARCH_MESSAGES = '''
+    WITH q AS (SELECT websearch_to_tsquery('spanish', %(query)s) AS query),
+    page AS (
+        SELECT session_id, seq, rank
+        FROM (
+            SELECT m.session_id, m.seq, ts_rank_cd(m.search_vector, q.query)::real AS rank
+            FROM conversation_messages m, q
+            WHERE m.search_vector @@ q.query
+        ) hits
+        WHERE (rank, session_id, seq) < (%(rank)s, %(session_id)s, %(seq)s)
+        ORDER BY rank DESC, session_id DESC, seq DESC
+        LIMIT %(limit)s
+    )
+    SELECT page.session_id, page.seq, page.rank, m.role, m.created_at, c.username,
+           ts_headline('spanish', m.content, q.query,
+                       'StartSel=[[[, StopSel=]]], MaxFragments=2, MaxWords=25, MinWords=8') AS snippet
+    FROM page
+    JOIN conversation_messages m ON m.session_id = page.session_id AND m.seq = page.seq
+    JOIN conversations c ON c.session_id = page.session_id
+    CROSS JOIN q
+    ORDER BY page.rank DESC, page.session_id DESC, page.seq DESC
+'''
+
+# Keyset cursor that comes before every search result
+FIRST_SEARCH_PAGE = (float('inf'), '', 0)
+
+
+class AsyncUserDB:
+    """Async access to the conversations tables through one bounded pool of connections.
+
+    Callers wait up to `acquire_timeout` seconds for a free connection (at most `max_waiting` of them,
+    0 means unlimited) instead of failing as soon as the pool is exhausted. Connections are checked
+    before they are handed out and every statement is cancelled after `statement_timeout` seconds, except the
+    export, which gets `export_timeout` seconds (0 means no limit). Nothing connects until the first use or `warm_up`, which opens the pool and migrates the schema once.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 20, acquire_timeout: float = 10.0,
+                 max_waiting: int = 0, statement_timeout: float = 15.0, export_timeout: float = 0.0):
+        conninfo = make_conninfo(
+            host=os.getenv('POSTGRES_HOST'),
+            dbname=os.getenv('POSTGRES_DB'),
+            user=os.getenv('POSTGRES_USER'),
+            password=os.getenv('POSTGRES_PASSWORD'),
+            port=os.getenv('POSTGRES_PORT', '5432'),
+        )
+        self.pool = AsyncConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=acquire_timeout,
+            max_waiting=max_waiting,
+            check=AsyncConnectionPool.check_connection,
+            kwargs={"options": f"-c statement_timeout={int(statement_timeout * 1000)}"},
+            open=False,
+        )
+        self.export_timeout = export_timeout
+        self.schema_ready = False
+        self._closed = False
+        self._ready_lock = asyncio.Lock()
+        self.acquire_latency = metrics.histogram('db_pool_acquire_seconds')
+        metrics.gauge('db_pool_size', lambda: self.stats()["size"])
+        metrics.gauge('db_pool_in_use', lambda: self.stats()["in_use"])
+        metrics.gauge('db_pool_waiting', lambda: self.stats()["waiting"])
+
+    async def ready(self):
+        """Open the pool and bring the schema up to date, the first time only."""
+        if self.schema_ready:
+            return
+        async with self._ready_lock:
+            if self.schema_ready:
+                return
+            if self.pool.closed and not self._closed:
+                await self.pool.open(wait=False)
+            async with self.pool.connection() as conn:
+                await self.migrate(conn)
+            self.schema_ready = True
+
+    async def warm_up(self, retry_interval: float = 1.0, max_retry_interval: float = 30.0):
+        """Get the pool and schema ready before the first request needs them, retrying until Postgres is up.
+
+        The open pool keeps establishing its `min_size` connections in the background meanwhile.
+        """
+        while not self._closed:
+            try:
+                await self.ready()
+                return
+            except psycopg.Error as e:
+                if self._closed:
+                    return
+                print(f"Database not ready, retrying in {retry_interval:.0f}s: {e}")
+            await asyncio.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, max_retry_interval)
+
+    async def close(self):
+        self._closed = True
+        await self.pool.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Connections in the pool, in use by callers, and callers waiting for one."""
+        stats = self.pool.get_stats()
+        size = stats.get("pool_size", 0)
+        return {
+            "size": size,
+            "in_use": size - stats.get("pool_available", 0),
+            "waiting": stats.get("requests_waiting", 0),
+        }
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[psycopg.AsyncConnection]:
+        """Borrow a connection; the transaction is committed on exit, or rolled back on error."""
+        if not self.schema_ready:
+            await self.ready()
+        start = time.perf_counter()
+        async with self.pool.connection() as conn:
+            self.acquire_latency.observe(time.perf_counter() - start)
+            yield conn
+
+    @staticmethod
+    async def migrate(conn: psycopg.AsyncConnection) -> int:
+        """Apply the schema versions the database is missing; returns how many were applied."""
+        async with conn.transaction():
+            await conn.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_KEY,))
+            await conn.execute(CREATE_MIGRATIONS_TABLE)
+            cursor = await conn.execute('SELECT COALESCE(max(version), 0) FROM schema_migrations')
+            version = (await cursor.fetchone())[0]
+            migrations = pending_migrations(version)
+            for version, statement in migrations:
+                await conn.execute(statement)
+                await conn.execute('INSERT INTO schema_migrations (version) VALUES (%s)', (version,))
+        if migrations:
+            print(f"Database schema migrated to version {SCHEMA_VERSION}")
+        return len(migrations)
+
+    async def get_conversation(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get conversation details by session_id."""
+        async with self.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute('SELECT * FROM conversations WHERE session_id = %s', (session_id,), prepare=True)
+                return await cursor.fetchone()
+
+    async def append_messages_batch(self, batches: List[MessageBatch]) -> None:
+        """Insert the new messages of several conversations in one transaction.
+
+        Only the new rows are written; messages already stored under the same (session_id, seq)
+        are left alone, so a retried batch is harmless.
+        """
+        now = datetime.now()
+        rows = []
+        for session_id, _, first_seq, messages in batches:
+            rows.extend(message_rows(session_id, first_seq, messages))
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany('''
+                    INSERT INTO conversations (session_id, username, save_time)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (session_id) DO NOTHING
+                ''', [(session_id, username, now) for session_id, username, _, _ in batches])
+                await cursor.executemany('''
+                    INSERT INTO conversation_messages (session_id, seq, role, agent, content, created_at, cached)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (session_id, seq) DO NOTHING
+                ''', rows)
+
+    async def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Reassemble the full conversation history of a session from its stored messages."""
+        async with self.connection() as conn:
+            cursor = await conn.execute('''
+                SELECT role, content, created_at, agent, cached
+                FROM conversation_messages
+                WHERE session_id = %s
+                ORDER BY seq
+            ''', (session_id,), prepare=True)
+            rows = await cursor.fetchall()
+            if rows:
+                return history_from_rows(rows)
+            cursor = await conn.execute('''
+                SELECT history_format, history, history_packed, conversation_history
+                FROM conversations
+                WHERE session_id = %s
+            ''', (session_id,))
+            result = await cursor.fetchone()
+            if result:
+                return decode_history(*result)
+        return []
+
+    async def search_messages(self, query: str, limit: int = 20, after: Tuple[float, str, int] = FIRST_SEARCH_PAGE
+                              ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, str, int]]]:
+        """Messages matching a web-style search (`food truck`, `"food truck" -tacos`), best first.
+
+        Returns one page of matches and the cursor of the next page, None after the last one.
+        Highlighted terms in the snippets are wrapped in [[[ and ]]].
+        """
+        async with self.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(SEARCH_MESSAGES, {
+                    "query": query, "limit": limit, "rank": after[0], "session_id": after[1], "seq": after[2],
+                }, prepare=True)
+                rows = await cursor.fetchall()
+        if len(rows) < limit:
+            return rows, None
+        last = rows[-1]
+        return rows, (last["rank"], last["session_id"], last["seq"])
+
+    async def export_rows(self, start: datetime = datetime.min, end: datetime = datetime.max,
+                          batch_size: int = 2000) -> AsyncIterator[tuple]:
+        """Stream the conversations saved in [start, end) with their messages, ordered by session and seq.
+
+        Rows are (session_id, username, save_time, history_format, history, history_packed,
+        conversation_history, seq, role, agent, content, created_at). The stored history columns are only
+        filled for conversations without message rows, which come once, with NULL message columns. Rows are
+        read through a named server-side cursor, `batch_size` rows per round trip, so memory does not
+        grow with the table. The cursor lives as long as the download, so the pool's statement timeout
+        is replaced by `export_timeout` for its transaction.
+        """
+        async with self.connection() as conn:
+            await conn.execute(f'SET LOCAL statement_timeout = {int(self.export_timeout * 1000)}')
+            async with conn.cursor(name='conversation_export') as cursor:
+                cursor.itersize = batch_size
+                await cursor.execute('''
+                    SELECT c.session_id, c.username, c.save_time,
+                           CASE WHEN m.seq IS NULL THEN c.history_format END,
+                           CASE WHEN m.seq IS NULL THEN c.history END,
+                           CASE WHEN m.seq IS NULL THEN c.history_packed END,
+                           CASE WHEN m.seq IS NULL THEN c.conversation_history END,
+                           m.seq, m.role, m.agent, m.content, m.created_at
+                    FROM conversations c
+                    LEFT JOIN conversation_messages m ON m.session_id = c.session_id
+                    WHERE c.save_time >= %s AND c.save_time < %s
+                    ORDER BY c.session_id, m.seq
+                ''', (start, end))
+                async for row in cursor:
+                    yield row
+
+
+# One pool per process, opened on first use or by the warm-up on app startup
+async_user_db = AsyncUserDB(
+    min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+    max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "20")),
+    acquire_timeout=float(os.environ.get("DB_ACQUIRE_TIMEOUT", "10")),
+    max_waiting=int(os.environ.get("DB_POOL_MAX_WAITING", "0")),
+    statement_timeout=float(os.environ.get("DB_STATEMENT_TIMEOUT", "15")),
+    export_timeout=float(os.environ.get("DB_EXPORT_STATEMENT_TIMEOUT", "0")),
+)
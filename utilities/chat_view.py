@@ -0,0 +1,73 @@
+import time
+from typing import List, Optional
+
+from nicegui import ui
+
+
+def format_message(role: str, content: str) -> str:
+    """Markdown for one chat message."""
+    return f'**{role}:** {content}'
+
+
+class StreamingMessage:
+    """Message element that fills up with streamed tokens, refreshing at most every `interval` seconds."""
+
+    def __init__(self, element: ui.markdown, role: str, interval: float):
+        self.element = element
+        self.role = role
+        self.interval = interval
+        self.parts: List[str] = []
+        self.last_update = 0.0
+
+    def on_token(self, chunk: str):
+        self.parts.append(chunk)
+        now = time.monotonic()
+        if now - self.last_update >= self.interval:
+            self.last_update = now
+            self.element.content = format_message(self.role, ''.join(self.parts))
+
+    def finish(self, content: str):
+        """Show the complete message in place of the partial one."""
+        self.element.content = format_message(self.role, content)
+
+    def discard(self):
+        """Remove the partial message, e.g. when the request failed."""
+        self.element.delete()
+
+
+class ChatView:
+    """Chat transcript that appends one element per message instead of re-rendering the whole history.
+
+    Messages are grouped into chunks of `chunk_size` so that adding a message only resends the
+    current chunk's child list, keeping the websocket payload per turn independent of history length.
+    """
+
+    def __init__(self, chunk_size: int = 50):
+        self.chunk_size = chunk_size
+        self.scroll_area = ui.scroll_area().classes('w-full h-64 border rounded-lg p-4')
+        self._chunk: Optional[ui.column] = None
+        self._chunk_length = 0
+
+    def _new_message(self, content: str) -> ui.markdown:
+        if self._chunk is None or self._chunk_length >= self.chunk_size:
+            with self.scroll_area:
+                self._chunk = ui.column().classes('w-full gap-0')
+            self._chunk_length = 0
+        with self._chunk:
+            element = ui.markdown(content).classes('w-full')
+        self._chunk_length += 1
+        self.scroll_area.scroll_to(percent=1.0)
+        return element
+
+    def append(self, message: dict) -> ui.markdown:
+        """Add one message from the conversation history."""
+        return self._new_message(format_message(message['role'], message['content']))
+
+    def extend(self, messages: List[dict]):
+        """Add several messages, e.g. when restoring a conversation."""
+        for message in messages:
+            self.append(message)
+
+    def stream(self, role: str, interval: float) -> StreamingMessage:
+        """Start a message whose content arrives as a stream of tokens."""
+        return StreamingMessage(self._new_message(format_message(role, '')), role, interval)
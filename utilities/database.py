@@ -1,18 +1,38 @@
 import os
+import threading
 from datetime import datetime
-from typing import Optional, Dict, Any
-from nicegui import app
+from typing import Optional, Dict, Any, List, Tuple
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
 from psycopg2.pool import SimpleConnectionPool
 from dotenv import load_dotenv
+from utilities.history_codec import decode_history, encode_history, is_repr, parse_legacy
+from utilities.schema import (CREATE_MIGRATIONS_TABLE, MIGRATION_LOCK_KEY, MessageBatch, SCHEMA_VERSION,
+                              history_from_rows, message_rows, pending_migrations)
 
 load_dotenv()
 
+
 class UserDB:
+    """Sync access to the conversations tables, for scripts; connects and migrates the schema on first use."""
+
     def __init__(self):
-        self.connection_pool = self._create_connection_pool()
-        self._init_db()
+        self._connection_pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection_pool(self) -> SimpleConnectionPool:
+        if self._connection_pool is None:
+            with self._lock:
+                if self._connection_pool is None:
+                    pool = self._create_connection_pool()
+                    try:
+                        self._init_db(pool)
+                    except psycopg2.Error:
+                        pool.closeall()
+                        raise
+                    self._connection_pool = pool
+        return self._connection_pool
 
     def _create_connection_pool(self):
         """Create a connection pool for PostgreSQL."""
@@ -23,63 +43,195 @@ class UserDB:
             database=os.getenv('POSTGRES_DB'),
             user=os.getenv('POSTGRES_USER'),
             password=os.getenv('POSTGRES_PASSWORD'),
-            port=os.getenv('POSTGRES_PORT', '5432')
+            port=os.getenv('POSTGRES_PORT', '5432'),
         )
 
     def __del__(self):
         """Clean up the connection pool when the object is destroyed."""
-        if hasattr(self, 'connection_pool'):
-            self.connection_pool.closeall()
+        if getattr(self, '_connection_pool', None) is not None:
+            self._connection_pool.closeall()
 
-    def _init_db(self):
-        """Initialize the database with the conversations table."""
-        conn = self.connection_pool.getconn()
+    def _init_db(self, pool: SimpleConnectionPool):
+        """Apply the schema versions the database is missing."""
+        conn = pool.getconn()
         try:
             with conn.cursor() as cursor:
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS conversations (
-                        session_id VARCHAR(255) PRIMARY KEY,
-                        username VARCHAR(255) NOT NULL,
-                        save_time TIMESTAMP NOT NULL,
-                        conversation_history TEXT
-                    )
-                ''')
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_KEY,))
+                cursor.execute(CREATE_MIGRATIONS_TABLE)
+                cursor.execute('SELECT COALESCE(max(version), 0) FROM schema_migrations')
+                migrations = pending_migrations(cursor.fetchone()[0])
+                for version, statement in migrations:
+                    cursor.execute(statement)
+                    cursor.execute('INSERT INTO schema_migrations (version) VALUES (%s)', (version,))
             conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
         finally:
-            self.connection_pool.putconn(conn)
+            pool.putconn(conn)
+        if migrations:
+            print(f"Database schema migrated to version {SCHEMA_VERSION}")
+
+    def append_messages(self, session_id: str, username: str, first_seq: int,
+                        messages: List[Dict[str, Any]]) -> None:
+        """Insert new messages of a conversation, creating the conversation record if needed."""
+        self.append_messages_batch([(session_id, username, first_seq, messages)])
 
-    def create_conversation(self, session_id: str, username: str, conversation_history: str) -> bool:
-        """Create a new conversation record."""
+    def append_messages_batch(self, batches: List[MessageBatch]) -> None:
+        """Insert the new messages of several conversations in one transaction.
+
+        Only the new rows are written; messages already stored under the same (session_id, seq)
+        are left alone, so a retried batch is harmless.
+        """
         conn = self.connection_pool.getconn()
         try:
             with conn.cursor() as cursor:
-                cursor.execute('''
-                    INSERT INTO conversations (session_id, username, save_time, conversation_history)
-                    VALUES (%s, %s, %s, %s)
-                ''', (session_id, username, datetime.now(), conversation_history))
+                now = datetime.now()
+                execute_values(cursor, '''
+                    INSERT INTO conversations (session_id, username, save_time)
+                    VALUES %s
+                    ON CONFLICT (session_id) DO NOTHING
+                ''', [(session_id, username, now) for session_id, username, _, _ in batches])
+                rows = []
+                for session_id, _, first_seq, messages in batches:
+                    rows.extend(message_rows(session_id, first_seq, messages))
+                execute_values(cursor, '''
+                    INSERT INTO conversation_messages (session_id, seq, role, agent, content, created_at, cached)
+                    VALUES %s
+                    ON CONFLICT (session_id, seq) DO NOTHING
+                ''', rows)
             conn.commit()
-            return True
-        except psycopg2.IntegrityError:
-            return False
+        except psycopg2.Error:
+            conn.rollback()
+            raise
         finally:
             self.connection_pool.putconn(conn)
 
-    def update_conversation(self, session_id: str, conversation_history: str) -> bool:
-        """Update an existing conversation with new history."""
+    def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Reassemble the full conversation history of a session from its stored messages.
+
+        Conversations saved before the messages table existed are read from their stored history.
+        """
         conn = self.connection_pool.getconn()
         try:
             with conn.cursor() as cursor:
                 cursor.execute('''
-                    UPDATE conversations 
-                    SET conversation_history = %s 
+                    SELECT role, content, created_at, agent, cached
+                    FROM conversation_messages
                     WHERE session_id = %s
-                ''', (conversation_history, session_id))
-            conn.commit()
-            return True
+                    ORDER BY seq
+                ''', (session_id,))
+                rows = cursor.fetchall()
+                if rows:
+                    return history_from_rows(rows)
+                cursor.execute('''
+                    SELECT history_format, history, history_packed, conversation_history
+                    FROM conversations
+                    WHERE session_id = %s
+                ''', (session_id,))
+                result = cursor.fetchone()
+                if result:
+                    return decode_history(*result)
+            return []
+        finally:
+            self.connection_pool.putconn(conn)
+
+    def migrate_conversations_to_messages(self, batch_size: int = 500) -> Dict[str, int]:
+        """Split the stored history of every conversation without message rows into conversation_messages.
+
+        The stored history is left in place. Returns how many conversations were migrated or skipped
+        because their history could not be parsed.
+        """
+        stats = {"migrated": 0, "skipped": 0}
+        last_session_id = ''
+        conn = self.connection_pool.getconn()
+        try:
+            while True:
+                with conn.cursor() as cursor:
+                    cursor.execute('''
+                        SELECT c.session_id, c.history_format, c.history, c.history_packed, c.conversation_history
+                        FROM conversations c
+                        WHERE c.session_id > %s
+                          AND (c.history_format IS NOT NULL OR c.conversation_history IS NOT NULL)
+                          AND NOT EXISTS (SELECT 1 FROM conversation_messages m WHERE m.session_id = c.session_id)
+                        ORDER BY c.session_id
+                        LIMIT %s
+                    ''', (last_session_id, batch_size))
+                    conversations = cursor.fetchall()
+                    if not conversations:
+                        break
+                    rows = []
+                    for session_id, *stored in conversations:
+                        last_session_id = session_id
+                        try:
+                            messages = decode_history(*stored)
+                        except ValueError:
+                            stats["skipped"] += 1
+                            continue
+                        rows.extend(message_rows(session_id, 0, messages))
+                        stats["migrated"] += 1
+                    execute_values(cursor, '''
+                        INSERT INTO conversation_messages (session_id, seq, role, agent, content, created_at, cached)
+                        VALUES %s
+                        ON CONFLICT (session_id, seq) DO NOTHING
+                    ''', rows)
+                conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        finally:
+            self.connection_pool.putconn(conn)
+        return stats
+
+    def migrate_history_format(self, batch_size: int = 500) -> Dict[str, int]:
+        """Re-encode the legacy conversation_history text of every conversation with the history codec.
+
+        Both legacy encodings are converted: JSON, and the Python repr that the old save_db wrote with str().
+        The text column is cleared once a row is converted. Returns how many conversations were converted
+        from JSON or from repr, and how many were skipped because their text is neither.
+        """
+        stats = {"json": 0, "repr": 0, "skipped": 0}
+        last_session_id = ''
+        conn = self.connection_pool.getconn()
+        try:
+            while True:
+                with conn.cursor() as cursor:
+                    cursor.execute('''
+                        SELECT session_id, conversation_history
+                        FROM conversations
+                        WHERE session_id > %s
+                          AND history_format IS NULL
+                          AND conversation_history IS NOT NULL
+                        ORDER BY session_id
+                        LIMIT %s
+                    ''', (last_session_id, batch_size))
+                    conversations = cursor.fetchall()
+                    if not conversations:
+                        break
+                    rows = []
+                    for session_id, conversation_history in conversations:
+                        last_session_id = session_id
+                        try:
+                            history = parse_legacy(conversation_history)
+                        except ValueError:
+                            stats["skipped"] += 1
+                            continue
+                        stats["repr" if is_repr(conversation_history) else "json"] += 1
+                        rows.append((session_id, *encode_history(history)))
+                    execute_values(cursor, '''
+                        UPDATE conversations c
+                        SET history_format = v.history_format::smallint, history = v.history::jsonb,
+                            history_packed = v.history_packed::bytea, conversation_history = NULL
+                        FROM (VALUES %s) AS v (session_id, history_format, history, history_packed)
+                        WHERE c.session_id = v.session_id AND c.history_format IS NULL
+                    ''', rows)
+                conn.commit()
         except psycopg2.Error:
-            return False
+            conn.rollback()
+            raise
         finally:
             self.connection_pool.putconn(conn)
+        return stats
 
     def get_conversation(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get conversation details by session_id."""
@@ -94,29 +246,5 @@ class UserDB:
         finally:
             self.connection_pool.putconn(conn)
 
-# Create a global instance
+# Create a global instance; it connects on first use
 user_db = UserDB()
-
-def save_db():
-    session_id = app.storage.browser['session_id']
-    username = app.storage.browser.get('username', 'Unknown User')
-    conversation = str(app.storage.browser['conversation_history'])
-    
-    # Try to update first
-    if not user_db.update_conversation(session_id, conversation):
-        # If update fails, create new conversation
-        user_db.create_conversation(session_id, username, conversation) 
-
-def get_conversation(session_id: str) -> Optional[Dict[str, Any]]:
-    """Get conversation details by session_id."""
-    conn = user_db.connection_pool.getconn()
-    try:
-        with conn.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute('SELECT * FROM conversations WHERE session_id = %s', (session_id,))
-            result = cursor.fetchone()
-            if result:
-                return dict(result)
-            return None
-    finally:
-        user_db.connection_pool.putconn(conn)
-        
\ No newline at end of file
@@ -0,0 +1,45 @@
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict
+
+from utilities.history_codec import decode_history
+
+
+async def conversation_records(rows: AsyncIterator[tuple]) -> AsyncIterator[Dict[str, Any]]:
+    """Group export rows, ordered by session, into one record per conversation."""
+    record = None
+    async for session_id, username, save_time, *stored, seq, role, agent, content, created_at in rows:
+        if record is None or record["session_id"] != session_id:
+            if record is not None:
+                yield record
+            record = {"session_id": session_id, "username": username, "save_time": save_time.isoformat(),
+                      "messages": []}
+            if seq is None:
+                # Saved before conversations were stored as message rows
+                try:
+                    record["messages"] = decode_history(*stored)
+                except ValueError:
+                    record["conversation_history"] = stored[-1]
+        if seq is not None:
+            record["messages"].append({"role": role, "content": content, "agent": agent,
+                                       "timestamp": created_at.isoformat()})
+    if record is not None:
+        yield record
+
+
+async def gzip_jsonl(records: AsyncIterator[Dict[str, Any]], chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Encode records as gzip-compressed JSON lines, yielding compressed chunks of about `chunk_size` bytes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    pending = []
+    pending_size = 0
+    async for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode()
+        pending.append(line)
+        pending_size += len(line)
+        if pending_size >= chunk_size:
+            chunk = compressor.compress(b''.join(pending))
+            pending.clear()
+            pending_size = 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
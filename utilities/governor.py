@@ -0,0 +1,201 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from utilities import metrics
+
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class BackendBusy(Exception):
+    """LangFlow cannot take the request now; the message is meant for the user."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails calls fast for `reset_timeout` seconds.
+
+    After that a single probe call is let through (half open): its success closes the breaker, its
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, label: str = ''):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        suffix = f'[{label}]' if label else ''
+        self.opened = metrics.counter(f'langflow_breaker_opened_total{suffix}')
+        metrics.gauge(f'langflow_breaker_state{suffix}', lambda: BREAKER_STATES[self.state])
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state only one probe at a time."""
+        if self.state == 'open' and self.retry_after() == 0:
+            self.state = 'half_open'
+            self.probing = False
+        if self.state == 'closed':
+            return True
+        if self.state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            self.probing = False
+            self.opened.inc()
+
+
+class ConcurrencyGovernor:
+    """Limits concurrent LangFlow calls with an AIMD limit, a bounded FIFO wait queue and a circuit breaker.
+
+    The limit grows by about one for every `limit` calls that finish within `target_latency`, and is
+    halved (at most once per `target_latency`) when a call fails or runs slower. Callers over the limit
+    wait in line for up to `queue_timeout` seconds; when the line is full, the deadline passes or the
+    breaker is open, they get BackendBusy right away instead of waiting out the HTTP timeout.
+    """
+
+    def __init__(self, min_limit: int = 2, max_limit: int = 100, initial_limit: int = 10,
+                 target_latency: float = 30.0, max_queued: int = 100, queue_timeout: float = 15.0,
+                 breaker: Optional[CircuitBreaker] = None, label: str = ''):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial_limit)
+        self.target_latency = target_latency
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker(label=label)
+        self.in_flight = 0
+        self.waiters: deque = deque()  # futures of queued callers, in arrival order
+        self.last_decrease = 0.0
+        # One set of metrics per governor; `label` tells them apart when there are several backends
+        suffix = f'[{label}]' if label else ''
+        self.rejected = metrics.counter(f'langflow_governor_rejected_total{suffix}')
+        self.queue_wait = metrics.histogram(f'langflow_governor_queue_seconds{suffix}')
+        metrics.gauge(f'langflow_concurrency_limit{suffix}', lambda: int(self.limit))
+        metrics.gauge(f'langflow_governor_in_flight{suffix}', lambda: self.in_flight)
+        metrics.gauge(f'langflow_governor_queued{suffix}', lambda: len(self.waiters))
+
+    @property
+    def busy(self) -> bool:
+        """Whether new calls are being turned away."""
+        return self.breaker.state == 'open' or len(self.waiters) >= self.max_queued
+
+    def _reject(self, message: str, retry_after: float):
+        self.rejected.inc()
+        raise BackendBusy(message, retry_after)
+
+    async def acquire(self):
+        """Wait for a free place under the limit, or raise BackendBusy."""
+        if not self.breaker.allow():
+            self._reject('Lucy is not available right now. Please try again in a moment.', self.breaker.retry_after())
+        if self.breaker.state == 'half_open' or (self.in_flight < int(self.limit) and not self.waiters):
+            self.in_flight += 1  # the half-open probe never waits in line
+            return
+        if len(self.waiters) >= self.max_queued:
+            self._reject('Lucy is answering many visitors right now. Please try again in a moment.', self.queue_timeout)
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # The place is handed over by _wake(), which already counts it as in flight
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except BaseException as e:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            if not waiter.done():
+                waiter.cancel()
+            elif not waiter.cancelled() and waiter.exception() is None:
+                # Handed over just as the caller gave up, pass the place on
+                self.in_flight -= 1
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject('Lucy is taking longer than usual. Please try again in a moment.', self.queue_timeout)
+            raise
+        self.queue_wait.observe(time.monotonic() - start)
+
+    def release(self, elapsed: float, ok: Optional[bool]):
+        """Give back a place and adjust the limit to how the call went (None: abandoned, no verdict)."""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if ok is None:
+            self.breaker.probing = False
+        elif ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        if ok and elapsed <= self.target_latency:
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+        elif ok is not None and now - self.last_decrease >= self.target_latency:
+            self.limit = max(self.limit / 2, self.min_limit)
+            self.last_decrease = now
+        self._wake()
+
+    def _wake(self):
+        if self.breaker.state == 'open':
+            # Fail the whole line fast instead of letting it time out one by one
+            while self.waiters:
+                waiter = self.waiters.popleft()
+                if not waiter.done():
+                    self.rejected.inc()
+                    waiter.set_exception(BackendBusy('Lucy is not available right now. Please try again in a moment.',
+                                                     self.breaker.retry_after()))
+            return
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a place for one LangFlow call; an exception counts as a failed call, a cancellation as none."""
+        await self.acquire()
+        start = time.monotonic()
+        ok = None
+        try:
+            yield
+            ok = True
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self.release(time.monotonic() - start, ok)
+
+
+def create_governor(label: str = '') -> ConcurrencyGovernor:
+    """Create the governor configured by the LANGFLOW_GOVERNOR_* and LANGFLOW_BREAKER_* settings."""
+    return ConcurrencyGovernor(
+        min_limit=int(os.environ.get("LANGFLOW_GOVERNOR_MIN_LIMIT", "2")),
+        max_limit=int(os.environ.get("LANGFLOW_GOVERNOR_MAX_LIMIT", "100")),
+        initial_limit=int(os.environ.get("LANGFLOW_GOVERNOR_INITIAL_LIMIT", "10")),
+        target_latency=float(os.environ.get("LANGFLOW_TARGET_LATENCY", "30")),
+        max_queued=int(os.environ.get("LANGFLOW_GOVERNOR_MAX_QUEUED", "100")),
+        queue_timeout=float(os.environ.get("LANGFLOW_GOVERNOR_QUEUE_TIMEOUT", "15")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("LANGFLOW_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.environ.get("LANGFLOW_BREAKER_RESET", "30")),
+            label=label,
+        ),
+        label=label,
+    )
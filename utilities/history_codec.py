@@ -0,0 +1,71 @@
+"""Reads the history stored with conversations saved before they were kept as conversation_messages rows.
+
+That history is legacy conversation_history text (JSON or a Python repr), or what migrate_history_format
+re-encoded it to: compact JSONB, or zlib for large histories. The app no longer writes any of these; turns
+are appended as message rows.
+"""
+import ast
+import json
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# Values of conversations.history_format; NULL means the legacy conversation_history TEXT column
+FORMAT_JSONB = 1  # compact JSON in the history JSONB column, queryable in SQL
+FORMAT_ZLIB = 2  # zlib-compressed compact JSON in history_packed, for large histories
+
+# Histories whose compact JSON reaches this many bytes are stored compressed
+COMPRESS_THRESHOLD = int(os.environ.get("HISTORY_COMPRESS_THRESHOLD", "16384"))
+
+History = List[Dict[str, Any]]
+
+
+def encode_history(history: Optional[History], compress_threshold: int = COMPRESS_THRESHOLD
+                   ) -> Tuple[Optional[int], Optional[str], Optional[bytes]]:
+    """Encode a history as (history_format, history JSON text, history_packed bytes); None encodes as all NULLs."""
+    if history is None:
+        return None, None, None
+    compact = json.dumps(history, ensure_ascii=False, separators=(',', ':'))
+    encoded = compact.encode()
+    if len(encoded) >= compress_threshold:
+        return FORMAT_ZLIB, None, zlib.compress(encoded, 6)
+    return FORMAT_JSONB, compact, None
+
+
+def is_repr(text: str) -> bool:
+    """Whether legacy history text is a Python repr (as str() wrote it) rather than JSON."""
+    try:
+        json.loads(text)
+        return False
+    except ValueError:
+        return text.lstrip().startswith('[')
+
+
+def parse_legacy(text: str) -> History:
+    """Parse legacy conversation_history text, written either as JSON or as a Python repr.
+
+    Raises ValueError if it is neither.
+    """
+    try:
+        history = json.loads(text)
+    except ValueError:
+        try:
+            history = ast.literal_eval(text)  # literals only, never evaluates code
+        except (ValueError, SyntaxError) as e:
+            raise ValueError(f"History is neither JSON nor a Python repr: {e}")
+    if not isinstance(history, list):
+        raise ValueError("History is not a list of messages")
+    return history
+
+
+def decode_history(history_format: Optional[int], history: Any, history_packed: Optional[bytes],
+                   conversation_history: Optional[str]) -> History:
+    """Decode the stored history of a conversation, whichever format it was written in."""
+    if history_format == FORMAT_ZLIB:
+        return json.loads(zlib.decompress(history_packed))
+    if history_format == FORMAT_JSONB:
+        # Database drivers already decode JSONB, unless it was selected as text
+        return json.loads(history) if isinstance(history, str) else history
+    if conversation_history:
+        return parse_legacy(conversation_history)
+    return []
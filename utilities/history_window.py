@@ -0,0 +1,106 @@
+import os
+import re
+from collections import OrderedDict
+from typing import Callable, List
+
+from utilities import metrics
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text`, about four characters per token for Spanish and English prose."""
+    return len(text) // 4 + 1
+
+
+def first_sentence(text: str, max_chars: int = 160) -> str:
+    sentence = re.split(r'(?<=[.!?])\s', ' '.join(text.split()), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 1] + '…'
+
+
+def extractive_summary(summary: str, messages: List[dict], token_budget: int) -> str:
+    """Fold `messages` into `summary`: one line per message, oldest lines dropped beyond `token_budget`."""
+    lines = summary.splitlines() if summary else []
+    lines.extend(f"{message.get('role', 'user')}: {first_sentence(message.get('content', ''))}"
+                 for message in messages)
+    while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > token_budget:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+class SessionSummary:
+    __slots__ = ('text', 'covered')
+
+    def __init__(self):
+        self.text = ''
+        self.covered = 0  # number of leading history messages folded into the text
+
+
+class HistoryWindow:
+    """Fits a conversation history into a token budget for the LangFlow payload.
+
+    The most recent messages are sent as they are, up to `token_budget` tokens. Older ones are folded
+    into a summary of at most `summary_budget` tokens. Summaries are kept per session and only extended
+    with the messages that dropped out of the window since the last turn, so no turn re-reads the whole
+    history.
+    """
+
+    def __init__(self, token_budget: int = 2000, summary_budget: int = 500, max_sessions: int = 1000,
+                 summarize: Callable[[str, List[dict], int], str] = extractive_summary):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_sessions = max_sessions
+        self.summarize = summarize
+        self.summaries: 'OrderedDict[str, SessionSummary]' = OrderedDict()  # least recently used first
+        self.payload_tokens = metrics.histogram('history_window_tokens')
+        self.summarized = metrics.counter('history_window_summarized_messages_total')
+
+    def _summary(self, session_id: str, history: List[dict]) -> SessionSummary:
+        summary = self.summaries.get(session_id)
+        if summary is None or summary.covered > len(history):
+            summary = SessionSummary()  # new session, or its history was replaced
+            self.summaries[session_id] = summary
+        self.summaries.move_to_end(session_id)
+        while len(self.summaries) > self.max_sessions:
+            self.summaries.popitem(last=False)
+        return summary
+
+    def window(self, session_id: str, history: List[dict]) -> List[dict]:
+        """The messages to send for `history`: a summary of older turns, then the recent ones in full."""
+        summary = self._summary(session_id, history)
+        # Walk back from the newest message while the budget lasts; the window never reaches into
+        # messages already summarized, and always holds at least the last message
+        start = len(history)
+        used = 0
+        while start > summary.covered:
+            tokens = estimate_tokens(history[start - 1].get('content', ''))
+            if used + tokens > self.token_budget and start < len(history):
+                break
+            used += tokens
+            start -= 1
+        if start > summary.covered:
+            summary.text = self.summarize(summary.text, history[summary.covered:start], self.summary_budget)
+            self.summarized.inc(start - summary.covered)
+            summary.covered = start
+
+        recent = history[start:]
+        if not summary.text:
+            self.payload_tokens.observe(used)
+            return recent
+        self.payload_tokens.observe(used + estimate_tokens(summary.text))
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary.text}"}] + recent
+
+    def forget(self, session_id: str):
+        """Drop the cached summary of a finished session."""
+        self.summaries.pop(session_id, None)
+
+
+def create_history_window() -> HistoryWindow:
+    """Create the window configured by HISTORY_TOKEN_BUDGET and HISTORY_SUMMARY_BUDGET."""
+    return HistoryWindow(
+        token_budget=int(os.environ.get("HISTORY_TOKEN_BUDGET", "2000")),
+        summary_budget=int(os.environ.get("HISTORY_SUMMARY_BUDGET", "500")),
+        max_sessions=int(os.environ.get("HISTORY_MAX_SESSIONS", "1000")),
+    )
+
+
+# Shared history window for run_flow payloads
+history_window = create_history_window()
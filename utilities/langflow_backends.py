@@ -0,0 +1,158 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from utilities import metrics
+from utilities.governor import BackendBusy
+from utilities.langflow_client import LangFlowClient, create_langflow_client
+
+
+class Backend:
+    """One LangFlow node of a backend set and what routing knows about it."""
+
+    def __init__(self, client: LangFlowClient):
+        self.client = client
+        self.healthy = True
+        self.check_failures = 0  # consecutive failed health checks
+        self.check_successes = 0  # consecutive passed health checks
+        self.ewma_latency = 0.0  # seconds, 0 until the first call finished
+
+    @property
+    def available(self) -> bool:
+        """In rotation: passing health checks and its circuit breaker not open."""
+        return self.healthy and self.client.governor.breaker.state != 'open'
+
+    @property
+    def outstanding(self) -> int:
+        return self.client.governor.in_flight + len(self.client.governor.waiters)
+
+
+class LangFlowBackendSet:
+    """Routes LangFlow calls across several nodes; a drop-in for a single LangFlowClient.
+
+    `strategy` is `least_outstanding` (fewest calls running or queued) or `ewma` (lowest moving average
+    latency, weighted by outstanding calls). Nodes leave the rotation after `unhealthy_after` failed
+    health checks or while their circuit breaker is open, and come back after `healthy_after` passed
+    checks. With `pin_sessions`, every session stays on the node that served its first message, because
+    that node holds the flow's memory of the conversation; it only moves if the node leaves the rotation.
+    """
+
+    def __init__(self, clients: List[LangFlowClient], strategy: str = 'least_outstanding',
+                 pin_sessions: bool = True, max_pinned: int = 10000, health_interval: float = 10.0,
+                 unhealthy_after: int = 2, healthy_after: int = 2, ewma_decay: float = 0.3):
+        if strategy not in ('least_outstanding', 'ewma'):
+            raise ValueError(f"Unknown LangFlow routing strategy: {strategy}")
+        self.backends = [Backend(client) for client in clients]
+        self.strategy = strategy
+        self.pin_sessions = pin_sessions
+        self.max_pinned = max_pinned
+        self.health_interval = health_interval
+        self.unhealthy_after = unhealthy_after
+        self.healthy_after = healthy_after
+        self.ewma_decay = ewma_decay
+        self.pinned: 'OrderedDict[str, Backend]' = OrderedDict()  # session_id -> backend, least recent first
+        self.repinned = metrics.counter('langflow_sessions_repinned_total')
+        metrics.gauge('langflow_backends_available', lambda: sum(backend.available for backend in self.backends))
+        for backend in self.backends:
+            metrics.gauge(f'langflow_backend_outstanding[{backend.client.base_url}]',
+                          lambda backend=backend: backend.outstanding)
+
+    def _score(self, backend: Backend) -> float:
+        if self.strategy == 'ewma':
+            return backend.ewma_latency * (backend.outstanding + 1)
+        return backend.outstanding
+
+    def choose(self, session_id: Optional[str] = None) -> Backend:
+        """The node for the next call of `session_id`."""
+        if self.pin_sessions and session_id:
+            backend = self.pinned.get(session_id)
+            if backend is not None:
+                self.pinned.move_to_end(session_id)
+                if backend.available:
+                    return backend
+                self.repinned.inc()
+        candidates = [backend for backend in self.backends if backend.available]
+        if not candidates:
+            raise BackendBusy('Lucy is not available right now. Please try again in a moment.', self.health_interval)
+        # Random tie-break, so idle nodes share the load instead of the first one taking it all
+        backend = min(candidates, key=lambda candidate: (self._score(candidate), random.random()))
+        if self.pin_sessions and session_id:
+            self.pinned[session_id] = backend
+            self.pinned.move_to_end(session_id)
+            while len(self.pinned) > self.max_pinned:
+                self.pinned.popitem(last=False)
+        return backend
+
+    def _observe(self, backend: Backend, elapsed: float):
+        if backend.ewma_latency == 0:
+            backend.ewma_latency = elapsed
+        else:
+            backend.ewma_latency += self.ewma_decay * (elapsed - backend.ewma_latency)
+
+    async def run(self, payload: dict) -> dict:
+        backend = self.choose(payload.get("session_id"))
+        start = time.perf_counter()
+        response = await backend.client.run(payload)
+        self._observe(backend, time.perf_counter() - start)
+        return response
+
+    async def stream(self, payload: dict, on_token: Callable[[str], None]) -> dict:
+        backend = self.choose(payload.get("session_id"))
+        start = time.perf_counter()
+        response = await backend.client.stream(payload, on_token)
+        self._observe(backend, time.perf_counter() - start)
+        return response
+
+    async def check_health(self):
+        """Health-check every node once and move nodes in or out of the rotation."""
+        results = await asyncio.gather(*(backend.client.check_health() for backend in self.backends))
+        for backend, passed in zip(self.backends, results):
+            if passed:
+                backend.check_failures = 0
+                backend.check_successes += 1
+                if not backend.healthy and backend.check_successes >= self.healthy_after:
+                    backend.healthy = True
+                    print(f"LangFlow backend {backend.client.base_url} is back in rotation")
+            else:
+                backend.check_successes = 0
+                backend.check_failures += 1
+                if backend.healthy and backend.check_failures >= self.unhealthy_after:
+                    backend.healthy = False
+                    print(f"LangFlow backend {backend.client.base_url} taken out of rotation")
+
+    async def check_health_periodically(self):
+        """Run the health checks every `health_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    @property
+    def busy(self) -> bool:
+        """Whether no node can take calls right now."""
+        return not any(backend.available and not backend.client.busy for backend in self.backends)
+
+    def has_headroom(self, target_latency: float) -> bool:
+        """Whether any node in rotation can take more chats."""
+        return any(backend.available and backend.client.has_headroom(target_latency) for backend in self.backends)
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.client.close()
+
+
+def create_langflow_backends() -> LangFlowBackendSet:
+    """Create the backend set for the comma-separated LANGFLOW_BACKENDS, or just BASE_API_URL."""
+    urls = [url.strip() for url in os.environ.get("LANGFLOW_BACKENDS", "").split(",") if url.strip()]
+    if urls:
+        clients = [create_langflow_client(url, label=url) for url in urls]
+    else:
+        clients = [create_langflow_client()]
+    return LangFlowBackendSet(
+        clients,
+        strategy=os.environ.get("LANGFLOW_ROUTING", "least_outstanding"),
+        pin_sessions=os.environ.get("LANGFLOW_PIN_SESSIONS", "true").lower() == "true",
+        health_interval=float(os.environ.get("LANGFLOW_HEALTH_INTERVAL", "10")),
+    )
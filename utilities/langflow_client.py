@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from utilities import metrics
+from utilities.governor import ConcurrencyGovernor, create_governor
+
+load_dotenv()
+
+latency = metrics.histogram('langflow_latency_seconds')
+time_to_first_token = metrics.histogram('langflow_ttft_seconds')
+
+# Observations needed before a latency histogram is trusted to set deadlines and hedge delays
+MIN_LATENCY_SAMPLES = 20
+
+
+class LangFlowTimeout(Exception):
+    """LangFlow did not answer within the deadline."""
+
+
+def response_from_text(text: str) -> dict:
+    """Wrap plain text in the shape of a LangFlow run response."""
+    return {"outputs": [{"outputs": [{"results": {"message": {"text": text}}}]}]}
+
+
+class LangFlowClient:
+    """Async client for the LangFlow run API sharing one pool of keep-alive connections.
+
+    Every call goes through `governor`, which caps concurrency and fails fast while LangFlow is unhealthy.
+
+    Deadlines adapt to this node's own latency: `timeout_multiplier` times its p99 (for streams, the
+    p99 time to first token), kept between `min_timeout` and `timeout`. With `hedge` on, a run still
+    pending after the node's p95 is sent a second time and the first answer wins; a stream still
+    waiting for its first token after the node's p95 time to first token is hedged the same way, and
+    the copy whose first token arrives first is the one streamed. Hedges are capped at `hedge_rate` of
+    all calls. LangFlow sees a hedged message twice, so hedging suits flows without server-side memory.
+    """
+
+    def __init__(self, base_url: str, endpoint: str, api_key: Optional[str] = None,
+                 max_connections: int = 100, max_keepalive_connections: int = 20,
+                 timeout: float = 60.0, governor: Optional[ConcurrencyGovernor] = None,
+                 min_timeout: float = 10.0, timeout_multiplier: float = 3.0,
+                 hedge: bool = False, hedge_rate: float = 0.05, label: str = ''):
+        # URL and headers never change, so build them once instead of on every call
+        self.base_url = base_url
+        self.url = f"{base_url}/api/v1/run/{endpoint}"
+        self.headers = {
+            "Content-Type": "application/json",
+            "x-api-key": api_key or "",
+        }
+        self.max_connections = max_connections
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections)
+        self.timeout = httpx.Timeout(timeout, connect=10.0)
+        self.max_timeout = timeout
+        self.min_timeout = min_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge
+        self.hedge_rate = hedge_rate
+        self.hedge_budget = 1.0  # hedges allowed right now, refilled by hedge_rate per run
+        # Every node has its own latency, so deadlines, hedge delays and headroom are judged per node
+        node = label or base_url
+        self.endpoint_latency = metrics.histogram(f'langflow_latency_seconds[{node}]')
+        self.endpoint_ttft = metrics.histogram(f'langflow_ttft_seconds[{node}]')
+        self.hedged = metrics.counter(f'langflow_hedged_total[{node}]')
+        self.hedge_wins = metrics.counter(f'langflow_hedge_wins_total[{node}]')
+        self.timeouts = metrics.counter(f'langflow_timeouts_total[{node}]')
+        self._client: Optional[httpx.AsyncClient] = None
+        self.governor = governor or ConcurrencyGovernor(initial_limit=max_connections, max_limit=max_connections,
+                                                        label=label)
+        self.in_flight = 0
+        metrics.gauge(f'langflow_in_flight[{label}]' if label else 'langflow_in_flight', lambda: self.in_flight)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared HTTP client, created on first use inside the running event loop."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(headers=self.headers, limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def deadline(self, histogram: metrics.Histogram) -> float:
+        """Adaptive timeout from this node's p99 latency; the configured timeout until it has enough samples."""
+        if len(histogram.values) < MIN_LATENCY_SAMPLES:
+            return self.max_timeout
+        return min(max(histogram.percentile(0.99) * self.timeout_multiplier, self.min_timeout), self.max_timeout)
+
+    async def _run_once(self, payload: dict) -> dict:
+        async with self.governor.slot():
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                with latency.time():
+                    response = await self.client.post(self.url, json=payload,
+                                                      timeout=httpx.Timeout(self.deadline(self.endpoint_latency), connect=10.0))
+                if response.status_code >= 500 or response.status_code == 429:
+                    response.raise_for_status()  # overloaded or failing, counts against the breaker
+                result = response.json()
+            except httpx.TimeoutException as e:
+                self.timeouts.inc()
+                raise LangFlowTimeout("Request timed out. Please try again.") from e
+            finally:
+                self.in_flight -= 1
+            self.endpoint_latency.observe(time.perf_counter() - start)
+            return result
+
+    async def _hedged(self, attempt: Callable[[int], Awaitable[dict]], histogram: metrics.Histogram,
+                      answered: Callable[[], bool]) -> dict:
+        """Run `attempt(0)`; if it has not `answered` after the p95 of `histogram`, race it against `attempt(1)`."""
+        self.hedge_budget = min(self.hedge_budget + self.hedge_rate, 10.0)
+        if not self.hedge or len(histogram.values) < MIN_LATENCY_SAMPLES:
+            return await attempt(0)
+
+        primary = asyncio.ensure_future(attempt(0))
+        backup = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=histogram.percentile(0.95))
+            if done or answered() or self.hedge_budget < 1 or self.governor.busy:
+                return await primary
+            self.hedge_budget -= 1
+            self.hedged.inc()
+            backup = asyncio.ensure_future(attempt(1))
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for copy in done:
+                    if not copy.cancelled() and copy.exception() is None:
+                        if copy is backup:
+                            self.hedge_wins.inc()
+                        return copy.result()
+            # Both failed (or the one that was streaming did), report its error or the primary's
+            return (backup if primary.cancelled() else primary).result()
+        finally:
+            for copy in (primary, backup):
+                if copy is None:
+                    continue
+                if not copy.done():
+                    copy.cancel()  # the slower copy, or both if the caller went away
+                elif not copy.cancelled():
+                    copy.exception()  # mark a failed copy's error as retrieved
+
+    async def run(self, payload: dict) -> dict:
+        """Post a payload to the flow and return the decoded JSON response, hedging slow runs if enabled."""
+        return await self._hedged(lambda _: self._run_once(payload), self.endpoint_latency, lambda: False)
+
+    async def stream(self, payload: dict, on_token: Callable[[str], None]) -> dict:
+        """Run the flow through the streaming endpoint, passing each token chunk to `on_token`.
+
+        With hedging, only the copy that sends the first token is passed on; the other one is cancelled.
+        """
+        copies = []
+        streaming = None
+
+        def relay(index: int) -> Callable[[str], None]:
+            def on_copy_token(chunk: str):
+                nonlocal streaming
+                if streaming is None:
+                    streaming = index
+                    for other, copy in enumerate(copies):
+                        if other != index:
+                            copy.cancel()
+                if streaming == index:
+                    on_token(chunk)
+            return on_copy_token
+
+        def attempt(index: int) -> Awaitable[dict]:
+            copy = asyncio.ensure_future(self._stream_once(payload, relay(index)))
+            copies.append(copy)
+            return copy
+
+        return await self._hedged(attempt, self.endpoint_ttft, lambda: streaming is not None)
+
+    async def _stream_once(self, payload: dict, on_token: Callable[[str], None]) -> dict:
+        """Run the flow through the streaming endpoint once, passing each token chunk to `on_token`.
+
+        LangFlow sends one JSON event per line: `token` events carry the partial text and
+        the final `end` event carries the same result a non-streaming run returns.
+        """
+        start = time.perf_counter()
+        chunks = []
+        result = None
+        async with self.governor.slot():
+            self.in_flight += 1
+            try:
+                # Between two reads the stream may be idle at most as long as the first token usually takes
+                timeout = httpx.Timeout(self.deadline(self.endpoint_ttft), connect=10.0)
+                async with self.client.stream('POST', self.url, params={"stream": "true"}, json=payload,
+                                              timeout=timeout) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        line = line.strip()
+                        if line.startswith('data:'):
+                            line = line[len('data:'):].strip()
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if event.get("event") == "token":
+                            chunk = event.get("data", {}).get("chunk", "")
+                            if not chunks:
+                                time_to_first_token.observe(time.perf_counter() - start)
+                                self.endpoint_ttft.observe(time.perf_counter() - start)
+                            chunks.append(chunk)
+                            on_token(chunk)
+                        elif event.get("event") == "end":
+                            result = event.get("data", {}).get("result")
+                        elif event.get("event") == "error":
+                            raise Exception(event.get("data", {}).get("error", "Streaming run failed"))
+            except httpx.TimeoutException as e:
+                self.timeouts.inc()
+                raise LangFlowTimeout("Request timed out. Please try again.") from e
+            finally:
+                self.in_flight -= 1
+        latency.observe(time.perf_counter() - start)
+
+        if chunks:
+            # The tokens are what the user saw, keep them as the committed answer
+            return response_from_text(''.join(chunks))
+        return result or {}
+
+    @property
+    def busy(self) -> bool:
+        """Whether LangFlow calls are being turned away."""
+        return self.governor.busy
+
+    async def check_health(self, timeout: float = 5.0) -> bool:
+        """Whether the LangFlow server answers its health endpoint."""
+        try:
+            response = await self.client.get(f"{self.base_url}/health", timeout=timeout)
+            return response.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def has_headroom(self, target_latency: float) -> bool:
+        """Whether LangFlow can take more chats: connections to spare, p95 latency within target, not shedding load."""
+        return (self.in_flight < 0.8 * self.max_connections and self.endpoint_latency.percentile(0.95) <= target_latency
+                and not self.governor.busy)
+
+    async def close(self):
+        """Close all pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_langflow_client(base_url: Optional[str] = None, label: str = '') -> LangFlowClient:
+    """Create a client from the LangFlow settings in the environment, for BASE_API_URL unless `base_url` is given."""
+    return LangFlowClient(
+        base_url=base_url or os.environ.get("BASE_API_URL", ""),
+        endpoint=os.environ.get("ENDPOINT", ""),
+        api_key=os.environ.get("APPLICATION_TOKEN"),
+        max_connections=int(os.environ.get("LANGFLOW_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("LANGFLOW_MAX_KEEPALIVE", "20")),
+        timeout=float(os.environ.get("LANGFLOW_TIMEOUT", "120")),
+        governor=create_governor(label),
+        min_timeout=float(os.environ.get("LANGFLOW_MIN_TIMEOUT", "10")),
+        timeout_multiplier=float(os.environ.get("LANGFLOW_TIMEOUT_MULTIPLIER", "3")),
+        hedge=os.environ.get("LANGFLOW_HEDGE", "false").lower() == "true",
+        hedge_rate=float(os.environ.get("LANGFLOW_HEDGE_RATE", "0.05")),
+        label=label,
+    )
@@ -0,0 +1,103 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Union
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback."""
+
+    def __init__(self, name: str, read: Callable[[], float] = None):
+        self.name = name
+        self.value = 0
+        self.read = read
+
+    def set(self, value: float):
+        self.value = value
+
+    def snapshot(self):
+        return self.read() if self.read else self.value
+
+
+class Histogram:
+    """Keeps a bounded window of recent observations and summarizes them as percentiles."""
+
+    def __init__(self, name: str, window: int = 2048):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.values = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.values.append(value)
+
+    @contextmanager
+    def time(self):
+        """Observe the wall time spent inside the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def percentile(self, q: float) -> float:
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+_registry: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+
+def counter(name: str) -> Counter:
+    """Get or create the counter called `name`."""
+    if name not in _registry:
+        _registry[name] = Counter(name)
+    return _registry[name]
+
+
+def gauge(name: str, read: Callable[[], float] = None) -> Gauge:
+    """Get or create the gauge called `name`."""
+    if name not in _registry:
+        _registry[name] = Gauge(name)
+    if read is not None:
+        _registry[name].read = read
+    return _registry[name]
+
+
+def histogram(name: str) -> Histogram:
+    """Get or create the histogram called `name`."""
+    if name not in _registry:
+        _registry[name] = Histogram(name)
+    return _registry[name]
+
+
+def snapshot() -> dict:
+    """Current value of every registered metric, keyed by name."""
+    return {name: metric.snapshot() for name, metric in sorted(_registry.items())}
@@ -0,0 +1,11 @@
+"""Re-encode the legacy conversation_history text of existing conversations with the history codec.
+
+Rows written by the old utilities.database.save_db hold a Python repr instead of JSON; both are converted.
+Run with: python -m utilities.migrate_history_format
+"""
+from utilities.database import user_db
+
+if __name__ == "__main__":
+    stats = user_db.migrate_history_format()
+    print(f"Converted {stats['json']} JSON and {stats['repr']} Python repr conversations, "
+          f"skipped {stats['skipped']} that are neither")
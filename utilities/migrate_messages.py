@@ -0,0 +1,9 @@
+"""Split the conversation_history blob of existing conversations into conversation_messages rows.
+
+Run with: python -m utilities.migrate_messages
+"""
+from utilities.database import user_db
+
+if __name__ == "__main__":
+    stats = user_db.migrate_conversations_to_messages()
+    print(f"Migrated {stats['migrated']} conversations, skipped {stats['skipped']} that are not valid JSON")
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utilities import metrics
+from utilities.async_database import async_user_db
+from utilities.schema import MessageBatch
+
+
+class WriteBehindQueue:
+    """Queue conversation saves in memory and write them to the database from a background worker.
+
+    Pending saves for the same session are coalesced into one batch of new messages. The worker
+    flushes up to `batch_size` sessions per transaction. Once `max_pending` sessions are waiting,
+    `enqueue` blocks new sessions until the worker catches up.
+    """
+
+    def __init__(self, save_batch: Callable[[List[MessageBatch]], Awaitable[None]], max_pending: int = 1000,
+                 batch_size: int = 50, flush_interval: float = 0.5, retry_delay: float = 1.0):
+        self.save_batch = save_batch
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.pending: 'OrderedDict[str, MessageBatch]' = OrderedDict()
+        self.in_flight: Dict[str, MessageBatch] = {}  # saves being written right now
+        self._worker: Optional[asyncio.Task] = None
+        self._has_work: Optional[asyncio.Event] = None
+        self._has_space: Optional[asyncio.Event] = None
+        self._stopping = False
+
+        metrics.gauge('write_behind_queue_depth', lambda: len(self.pending))
+        self.flush_latency = metrics.histogram('write_behind_flush_seconds')
+        self.saved = metrics.counter('write_behind_saved_messages_total')
+        self.coalesced = metrics.counter('write_behind_coalesced_total')
+        self.failures = metrics.counter('write_behind_flush_failures_total')
+
+    def start(self):
+        """Start the background worker (idempotent)."""
+        if self._worker is None:
+            self._has_work = asyncio.Event()
+            self._has_space = asyncio.Event()
+            self._has_space.set()
+            self._stopping = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(self, session_id: str, username: str, first_seq: int, messages: List[Dict[str, Any]]):
+        """Schedule saving `messages`, which start at position `first_seq` of the session's history.
+
+        Waits for space if too many sessions are already pending. A save of a session with one already
+        pending must continue right where that one ends; anything else raises ValueError, since coalescing
+        it would store messages under the wrong positions.
+        """
+        self.start()
+        while session_id not in self.pending and len(self.pending) >= self.max_pending:
+            self._has_space.clear()
+            await self._has_space.wait()
+        if session_id in self.pending:
+            _, _, pending_seq, pending_messages = self.pending[session_id]
+            if first_seq != pending_seq + len(pending_messages):
+                raise ValueError(f"Save of {session_id} starts at message {first_seq}, "
+                                 f"but its pending save ends at {pending_seq + len(pending_messages)}")
+            self.coalesced.inc()
+            self.pending[session_id] = (session_id, username, pending_seq, pending_messages + messages)
+        else:
+            self.pending[session_id] = (session_id, username, first_seq, list(messages))
+        self._has_work.set()
+
+    async def _run(self):
+        while not self._stopping:
+            await self._has_work.wait()
+            # Give further saves of the same sessions a moment to coalesce
+            await asyncio.sleep(self.flush_interval)
+            while self.pending and not self._stopping:
+                if not await self._flush_batch():
+                    await asyncio.sleep(self.retry_delay)
+            if not self.pending:
+                self._has_work.clear()
+
+    async def _flush_batch(self) -> bool:
+        """Write one batch of pending saves; on failure put them back in front of newer ones."""
+        batch = []
+        while self.pending and len(batch) < self.batch_size:
+            batch.append(self.pending.popitem(last=False)[1])
+        self._has_space.set()
+        self.in_flight = {save[0]: save for save in batch}
+
+        start = time.perf_counter()
+        try:
+            await self.save_batch(batch)
+        except Exception as e:
+            self.failures.inc()
+            print(f"Write-behind flush of {len(batch)} conversations failed: {e}")
+            for session_id, username, first_seq, messages in reversed(batch):
+                if session_id in self.pending:
+                    messages = messages + self.pending[session_id][3]
+                self.pending[session_id] = (session_id, username, first_seq, messages)
+                self.pending.move_to_end(session_id, last=False)
+            return False
+        finally:
+            self.in_flight = {}
+        self.flush_latency.observe(time.perf_counter() - start)
+        self.saved.inc(sum(len(messages) for _, _, _, messages in batch))
+        return True
+
+    def unsaved(self, session_id: str) -> List[MessageBatch]:
+        """Saves of `session_id` that may not be in the database yet, oldest first."""
+        return [save for save in (self.in_flight.get(session_id), self.pending.get(session_id)) if save]
+
+    async def stop(self, attempts: int = 3):
+        """Stop the worker and flush everything still pending."""
+        self._stopping = True
+        if self._worker is not None:
+            self._has_work.set()
+            await self._worker
+            self._worker = None
+        failures = 0
+        while self.pending and failures < attempts:
+            if not await self._flush_batch():
+                failures += 1
+                await asyncio.sleep(self.retry_delay)
+        if self.pending:
+            print(f"Write-behind queue stopped with {len(self.pending)} conversations not fully saved")
+
+
+# Shared queue used by the chat page
+conversation_writer = WriteBehindQueue(
+    async_user_db.append_messages_batch,
+    max_pending=int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "1000")),
+    batch_size=int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "50")),
+    flush_interval=float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", "0.5")),
+)
@@ -0,0 +1,107 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+# (operation, username, leased_at): 'add' and 'remove' a slot, 'lease' it (with the ISO lease time) or 'free' it
+Change = Tuple[str, str, Optional[str]]
+
+
+class PoolLog:
+    """Append-only change log of the user pool, compacted into a snapshot file from time to time.
+
+    Every change is one short JSON line appended to `<path>.log`, so persisting a status change costs
+    the same with a hundred slots or a hundred thousand. Once the log holds more lines than
+    `compact_ratio` times the number of slots (and at least `min_compact_lines`), the whole pool is
+    written to `<path>.json` through a temporary file and a rename, and the log starts over. Each
+    compaction starts a new generation; the log opens with its generation, so a log left over from
+    an interrupted compaction is never replayed on top of the newer snapshot.
+    """
+
+    def __init__(self, path: str, compact_ratio: float = 2.0, min_compact_lines: int = 10000):
+        self.snapshot_path = path + '.json'
+        self.log_path = path + '.log'
+        self.compact_ratio = compact_ratio
+        self.min_compact_lines = min_compact_lines
+        self.lines = 0  # changes in the log since the last compaction
+        self.generation = 0
+        self._file = None
+
+    def load(self) -> Optional[dict]:
+        """The pool as of the last persisted change, None if nothing was ever persisted."""
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = None
+        users = dict.fromkeys(snapshot["users"]) if snapshot else {}
+        leased = dict(snapshot["leased"]) if snapshot else {}
+        self.generation = snapshot.get("generation", 0) if snapshot else 0
+        self.lines = 0
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        operation, username, leased_at = json.loads(line)
+                    except ValueError:
+                        break  # torn last line of a crash
+                    if operation == 'generation':
+                        if username != self.generation:
+                            break  # written before the snapshot
+                        continue
+                    self.lines += 1
+                    if operation == 'add':
+                        users[username] = None
+                    elif operation == 'remove':
+                        users.pop(username, None)
+                        leased.pop(username, None)
+                    elif operation == 'lease':
+                        leased[username] = leased_at
+                    elif operation == 'free':
+                        leased.pop(username, None)
+        except FileNotFoundError:
+            if snapshot is None:
+                return None
+        return {"users": list(users), "leased": leased}
+
+    def should_compact(self, pending: int, capacity: int) -> bool:
+        """Whether appending `pending` more lines makes the log long enough to compact, for a pool of `capacity`."""
+        lines = self.lines + pending
+        return lines >= self.min_compact_lines and lines > self.compact_ratio * capacity
+
+    def append(self, changes: List[Change]):
+        """Append changes to the log and flush them to disk."""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            self._file = open(self.log_path, 'a', encoding='utf-8')
+            if self._file.tell() == 0:
+                self._file.write(json.dumps(['generation', self.generation, None]) + '\n')
+        self._file.write(''.join(json.dumps(change, separators=(',', ':')) + '\n' for change in changes))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.lines += len(changes)
+
+    def compact(self, snapshot: dict):
+        """Replace the snapshot file with `snapshot` and empty the log."""
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        temporary = self.snapshot_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({**snapshot, "generation": self.generation + 1}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+        self.generation += 1
+        self.close()
+        open(self.log_path, 'w').close()  # the next append starts it with the new generation
+        self.lines = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Change log of the shared user pool, next to NiceGUI's own storage
+user_pool_log = PoolLog(
+    os.environ.get("USER_POOL_PATH", os.path.join(os.environ.get("NICEGUI_STORAGE_PATH", ".nicegui"), "user_pool")),
+    compact_ratio=float(os.environ.get("USER_POOL_COMPACT_RATIO", "2")),
+)
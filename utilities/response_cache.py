@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from utilities import metrics
+from utilities.langflow_client import latency as langflow_latency
+
+
+class CacheBackend(ABC):
+    """Storage for cached responses. Subclass it to share the cache between processes."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: dict, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def clear(self):
+        ...
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Per-process LRU cache with a maximum number of entries and per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, Tuple[float, dict]]' = OrderedDict()  # key -> (expires at, value)
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: dict, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+    async def clear(self):
+        self.entries.clear()
+
+
+class PostgresCacheBackend(CacheBackend):
+    """Cache shared by all app processes, kept in the unlogged response_cache table."""
+
+    def __init__(self, db, max_entries: int = 10000):
+        self.db = db
+        self.max_entries = max_entries
+        self.writes = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        async with self.db.connection() as conn:
+            cursor = await conn.execute('''
+                UPDATE response_cache SET last_used = now()
+                WHERE key = %s AND expires_at > now()
+                RETURNING value
+            ''', (key,), prepare=True)
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def set(self, key: str, value: dict, ttl: float):
+        async with self.db.connection() as conn:
+            await conn.execute('''
+                INSERT INTO response_cache (key, value, expires_at, last_used)
+                VALUES (%s, %s, now() + make_interval(secs => %s), now())
+                ON CONFLICT (key) DO UPDATE
+                SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at, last_used = now()
+            ''', (key, json.dumps(value, ensure_ascii=False), ttl), prepare=True)
+            self.writes += 1
+            if self.writes % 100 == 0:
+                # Drop expired entries and the least recently used ones beyond the size limit
+                await conn.execute('''
+                    DELETE FROM response_cache
+                    WHERE expires_at <= now()
+                       OR key IN (SELECT key FROM response_cache ORDER BY last_used DESC OFFSET %s)
+                ''', (self.max_entries,))
+
+    async def delete(self, key: str):
+        async with self.db.connection() as conn:
+            await conn.execute('DELETE FROM response_cache WHERE key = %s', (key,))
+
+    async def clear(self):
+        async with self.db.connection() as conn:
+            await conn.execute('TRUNCATE response_cache')
+
+
+def normalize_message(message: str) -> str:
+    """Case-insensitive, whitespace-insensitive form of a chat message."""
+    return ' '.join(message.casefold().split())
+
+
+def history_fingerprint(history: Optional[List[dict]]) -> str:
+    """Digest of the roles and contents of a conversation history."""
+    turns = [(m.get("role"), m.get("content")) for m in history or []]
+    return hashlib.sha256(json.dumps(turns, ensure_ascii=False).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Cache of LangFlow responses keyed on the normalized message and a fingerprint of the history."""
+
+    def __init__(self, backend: CacheBackend, ttl: float = 3600.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = metrics.counter('response_cache_hits_total')
+        self.misses = metrics.counter('response_cache_misses_total')
+        self.latency_saved = metrics.counter('response_cache_latency_saved_seconds')
+        self.errors = metrics.counter('response_cache_errors_total')
+        metrics.gauge('response_cache_hit_ratio', self.hit_ratio)
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits.value + self.misses.value
+        return self.hits.value / lookups if lookups else 0.0
+
+    @staticmethod
+    def key(message: str, history: Optional[List[dict]] = None) -> str:
+        digest = hashlib.sha256(normalize_message(message).encode()).hexdigest()
+        return f"{digest}:{history_fingerprint(history)}"
+
+    async def get_or_run(self, message: str, history: Optional[List[dict]],
+                         run: Callable[[], Awaitable[dict]]) -> dict:
+        """Return the cached response for this message and history, or `run` the flow and cache its response.
+
+        Cached responses are returned with `"cached": True` added. The cache only saves time, so a failing
+        backend counts as a miss and the flow still answers.
+        """
+        key = self.key(message, history)
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            self.errors.inc()
+            print(f"Response cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            self.hits.inc()
+            self.latency_saved.inc(langflow_latency.snapshot()["mean"])
+            return {**cached, "cached": True}
+        self.misses.inc()
+        response = await run()
+        if response and response.get("outputs"):
+            try:
+                await self.backend.set(key, response, self.ttl)
+            except Exception as e:
+                self.errors.inc()
+                print(f"Response cache store failed: {e}")
+        return response
+
+    async def invalidate(self, message: str, history: Optional[List[dict]] = None):
+        """Forget the cached response for one message and history."""
+        await self.backend.delete(self.key(message, history))
+
+    async def clear(self):
+        """Forget every cached response."""
+        await self.backend.clear()
+
+
+def create_response_cache() -> ResponseCache:
+    """Create the cache configured by RESPONSE_CACHE_BACKEND (`memory` or `postgres`)."""
+    max_entries = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    if os.environ.get("RESPONSE_CACHE_BACKEND", "memory") == "postgres":
+        from utilities.async_database import async_user_db
+        backend = PostgresCacheBackend(async_user_db, max_entries)
+    else:
+        backend = InMemoryCacheBackend(max_entries)
+    return ResponseCache(backend, ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")))
+
+
+# Shared cache in front of run_flow
+response_cache = create_response_cache()
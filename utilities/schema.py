@@ -0,0 +1,140 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+# (session_id, username, first_seq, messages) -- `messages` hold the turns starting at position `first_seq`
+MessageBatch = Tuple[str, str, int, List[Dict[str, Any]]]
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Tables shared by the sync and async database layers. Statement N is schema version N and is applied once per
+# database, so append new statements and never edit or reorder the released ones.
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS conversations (
+        session_id VARCHAR(255) PRIMARY KEY,
+        username VARCHAR(255) NOT NULL,
+        save_time TIMESTAMP NOT NULL,
+        conversation_history TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS conversation_messages (
+        session_id VARCHAR(255) NOT NULL REFERENCES conversations(session_id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        role VARCHAR(32) NOT NULL,
+        agent VARCHAR(255),
+        content TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (session_id, seq)
+    )
+    ''',
+    '''
+    CREATE UNLOGGED TABLE IF NOT EXISTS response_cache (
+        key VARCHAR(255) PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL,
+        last_used TIMESTAMPTZ NOT NULL
+    )
+    ''',
+    # Indexes for the analytics queries: time ranges and per-user activity
+    'CREATE INDEX IF NOT EXISTS conversations_save_time_idx ON conversations (save_time)',
+    'CREATE INDEX IF NOT EXISTS conversations_username_idx ON conversations (username, save_time)',
+    'CREATE INDEX IF NOT EXISTS conversation_messages_created_at_idx ON conversation_messages (created_at)',
+    # Full-text search over message content: the Spanish tsvector is kept up to date by Postgres on every insert
+    '''
+    ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('spanish', content)) STORED
+    ''',
+    'CREATE INDEX IF NOT EXISTS conversation_messages_search_idx ON conversation_messages USING GIN (search_vector)',
+    # Re-encoded legacy history of conversations saved before the messages table, see utilities.history_codec
+    'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS history_format SMALLINT',
+    'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS history JSONB',
+    'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS history_packed BYTEA',
+    # Already compressed, so Postgres should store it out of line without trying to compress it again
+    'ALTER TABLE conversations ALTER COLUMN history_packed SET STORAGE EXTERNAL',
+    # Rollups maintained by utilities.analytics
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_hourly (
+        hour TIMESTAMP PRIMARY KEY,
+        sessions_started INTEGER NOT NULL,
+        active_sessions INTEGER NOT NULL,
+        active_users INTEGER NOT NULL,
+        user_messages INTEGER NOT NULL,
+        assistant_messages INTEGER NOT NULL,
+        user_chars BIGINT NOT NULL,
+        assistant_chars BIGINT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_sessions (
+        session_id VARCHAR(255) PRIMARY KEY,
+        username VARCHAR(255),
+        started_at TIMESTAMP NOT NULL,
+        last_message_at TIMESTAMP NOT NULL,
+        turns INTEGER NOT NULL,
+        messages INTEGER NOT NULL,
+        total_chars BIGINT NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS analytics_sessions_started_at_idx ON analytics_sessions (started_at)',
+    # User slots shared by several app processes, see utilities.shared_pool
+    '''
+    CREATE TABLE IF NOT EXISTS pool_slots (
+        username VARCHAR(255) PRIMARY KEY,
+        owner VARCHAR(255),
+        owner_expires_at TIMESTAMPTZ
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS pool_slots_owner_idx ON pool_slots (owner)',
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_state (
+        name VARCHAR(64) PRIMARY KEY,
+        watermark TIMESTAMP NOT NULL
+    )
+    ''',
+    # Answers served from utilities.response_cache, which LangFlow never saw
+    'ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS cached BOOLEAN NOT NULL DEFAULT false',
+    # The transaction that stored each message, so utilities.analytics finds the messages committed since its last
+    # refresh however late they arrive (xid8 needs Postgres 13). Rows stored before this column stay NULL.
+    'ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS inserted_xid xid8',
+    'ALTER TABLE conversation_messages ALTER COLUMN inserted_xid SET DEFAULT pg_current_xact_id()',
+    'CREATE INDEX IF NOT EXISTS conversation_messages_inserted_xid_idx ON conversation_messages (inserted_xid)',
+    'ALTER TABLE analytics_state ADD COLUMN IF NOT EXISTS snapshot_xmin xid8',
+]
+
+SCHEMA_VERSION = len(SCHEMA_STATEMENTS)
+
+CREATE_MIGRATIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+'''
+
+# Serializes migrations, so processes starting together apply every version once
+MIGRATION_LOCK_KEY = 0x736368656d61  # 'schema'
+
+
+def pending_migrations(version: int) -> List[Tuple[int, str]]:
+    """(version, statement) pairs a database at schema `version` is still missing."""
+    return list(enumerate(SCHEMA_STATEMENTS, start=1))[version:]
+
+
+def message_rows(session_id: str, first_seq: int, messages: List[Dict[str, Any]]) -> List[tuple]:
+    """Rows for the conversation_messages table."""
+    return [
+        (session_id, first_seq + offset, message.get("role", ""), message.get("agent"),
+         message.get("content", ""), message.get("timestamp") or datetime.now(), bool(message.get("cached")))
+        for offset, message in enumerate(messages)
+    ]
+
+
+def history_from_rows(rows: List[tuple]) -> List[Dict[str, Any]]:
+    """Rebuild history messages from (role, content, created_at, agent, cached) rows ordered by seq."""
+    history = []
+    for role, content, created_at, agent, cached in rows:
+        message = {"role": role, "content": content, "timestamp": created_at.strftime(TIMESTAMP_FORMAT), "agent": agent}
+        if cached:
+            message["cached"] = True
+        history.append(message)
+    return history
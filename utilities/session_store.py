@@ -0,0 +1,135 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utilities import metrics
+from utilities.async_database import async_user_db
+from utilities.persistence import WriteBehindQueue, conversation_writer
+
+# Bytes a message dict and its string objects take in memory besides their characters (CPython 3.11)
+MESSAGE_OVERHEAD = 300
+
+
+def message_size(message: Dict[str, Any]) -> int:
+    """Approximate memory taken by one history message."""
+    return MESSAGE_OVERHEAD + sum(len(value) for value in message.values() if isinstance(value, str))
+
+
+class ChatSession:
+    """A chat's username and history, held on the server instead of in browser storage."""
+    __slots__ = ('session_id', 'username', 'history', 'size')
+
+    def __init__(self, session_id: str, username: str, history: Optional[List[Dict[str, Any]]] = None):
+        self.session_id = session_id
+        self.username = username
+        self.history = history or []
+        self.size = sum(message_size(message) for message in self.history)
+
+
+class SessionStore:
+    """Chat sessions by session_id: hot ones in a bounded LRU, cold ones paged in from Postgres.
+
+    At most `max_sessions` sessions and about `max_bytes` of history stay in memory; beyond that the least
+    recently used sessions are dropped, and their history is read back from the database the next time they
+    are used. Messages go through the write-behind queue, so a page-in also replays the saves of that
+    session which are still queued or being written.
+    """
+
+    def __init__(self, load_history: Callable[[str], Awaitable[List[Dict[str, Any]]]], writer: WriteBehindQueue,
+                 max_sessions: int = 5000, max_bytes: int = 256 * 1024 * 1024):
+        self.load_history = load_history
+        self.writer = writer
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions: 'OrderedDict[str, ChatSession]' = OrderedDict()  # least recently used first
+        self.bytes = 0
+        self.hits = metrics.counter('session_store_hits_total')
+        self.page_ins = metrics.counter('session_store_page_ins_total')
+        self.evictions = metrics.counter('session_store_evictions_total')
+        self.appended_bytes = metrics.counter('session_store_appended_bytes_total')
+        self.page_in_latency = metrics.histogram('session_store_page_in_seconds')
+        metrics.gauge('session_store_sessions', lambda: len(self.sessions))
+        metrics.gauge('session_store_bytes', lambda: self.bytes)
+        metrics.gauge('session_store_bytes_per_session',
+                      lambda: self.bytes / len(self.sessions) if self.sessions else 0)
+
+    def _add(self, session: ChatSession):
+        self.sessions[session.session_id] = session
+        self.bytes += session.size
+        self._evict()
+
+    def _evict(self):
+        # Always keep the most recent session, however large
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.bytes > self.max_bytes):
+            _, session = self.sessions.popitem(last=False)
+            self.bytes -= session.size
+            self.evictions.inc()
+
+    def create(self, session_id: str, username: str) -> ChatSession:
+        """Start a new, empty session."""
+        self.discard(session_id)
+        session = ChatSession(session_id, username)
+        self._add(session)
+        return session
+
+    def peek(self, session_id: str) -> Optional[ChatSession]:
+        """The session if it is in memory, without paging it in or touching the LRU order."""
+        return self.sessions.get(session_id)
+
+    async def get(self, session_id: str, username: str) -> ChatSession:
+        """The session, paged in from the database if it is not in memory.
+
+        An unknown session comes back empty, owned by `username`.
+        """
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.hits.inc()
+            self.sessions.move_to_end(session_id)
+            return session
+        start = time.perf_counter()
+        # Taken before reading, so a save that commits in between is in one or the other
+        unsaved = self.writer.unsaved(session_id)
+        history = await self.load_history(session_id)
+        for _, _, first_seq, messages in unsaved:
+            history[first_seq:first_seq + len(messages)] = messages
+        self.page_in_latency.observe(time.perf_counter() - start)
+        self.page_ins.inc()
+        session = self.sessions.get(session_id)  # paged in by another call in the meantime
+        if session is None:
+            session = ChatSession(session_id, username, history)
+            self._add(session)
+        return session
+
+    def append(self, session: ChatSession, message: Dict[str, Any]):
+        """Add a message to the history of a session."""
+        session.history.append(message)
+        self.resized(session, message_size(message))
+        self.appended_bytes.inc(message_size(message))
+
+    def truncate(self, session: ChatSession, length: int):
+        """Drop the messages of a session from position `length` on, e.g. those of a failed turn."""
+        removed = sum(message_size(message) for message in session.history[length:])
+        del session.history[length:]
+        self.resized(session, -removed)
+
+    def resized(self, session: ChatSession, change: int):
+        session.size += change
+        if self.sessions.get(session.session_id) is session:
+            self.bytes += change
+            self._evict()
+
+    def discard(self, session_id: str):
+        """Drop a finished session from memory; its history stays in the database."""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.bytes -= session.size
+
+
+# Shared store of the chat sessions of this process
+session_store = SessionStore(
+    async_user_db.get_history,
+    conversation_writer,
+    max_sessions=int(os.environ.get("SESSION_STORE_MAX_SESSIONS", "5000")),
+    max_bytes=int(os.environ.get("SESSION_STORE_MAX_MB", "256")) * 1024 * 1024,
+)
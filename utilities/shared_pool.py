@@ -0,0 +1,173 @@
+import asyncio
+import os
+import socket
+from typing import List, Optional
+
+from utilities import metrics
+from utilities.admission import AdmissionQueue, admission_queue
+from utilities.async_database import AsyncUserDB, async_user_db
+
+# Free rows, or rows of a process whose ownership expired; locked rows are being claimed by another process
+CLAIM_SLOTS = '''
+    UPDATE pool_slots
+    SET owner = %(owner)s, owner_expires_at = now() + make_interval(secs => %(ttl)s)
+    WHERE username IN (
+        SELECT username FROM pool_slots
+        WHERE owner IS NULL OR owner_expires_at < now()
+        LIMIT %(count)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING username
+'''
+
+# Serializes adding rows, so concurrent processes cannot take the table past its maximum size
+GROW_LOCK_KEY = 0x706f6f6c  # 'pool'
+
+
+class SharedSlotPool:
+    """Shares the user slots of several app processes through the pool_slots table.
+
+    Every slot is a row owned by at most one process. A process leases and releases its own slots in
+    memory as before, since a visitor's page and websocket reach the same process anyway (see sticky
+    sessions in the README). It only goes to Postgres to claim slots when its admission queue wants to
+    grow, to give idle ones back, and to renew its ownership. Claims skip the rows other processes have
+    locked (FOR UPDATE SKIP LOCKED), so processes never wait on each other; only adding rows takes an
+    advisory lock, so the table stays within `max_size`. Ownership lapses `ownership_ttl` seconds after
+    the last heartbeat, which hands the slots of a crashed process to the others.
+    """
+
+    def __init__(self, db: AsyncUserDB, queue: AdmissionQueue, worker_id: str, max_size: int = 200,
+                 ownership_ttl: float = 60.0, heartbeat_interval: float = 10.0):
+        self.db = db
+        self.queue = queue
+        self.slots = queue.slots
+        self.worker_id = worker_id
+        self.max_size = max_size
+        self.ownership_ttl = ownership_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.claimed = metrics.counter('shared_pool_claimed_total')
+        self.given_back = metrics.counter('shared_pool_given_back_total')
+        self.lost = metrics.counter('shared_pool_lost_total')
+        self.taken_over = metrics.counter('shared_pool_leases_taken_over_total')
+        self.unreturned: List[str] = []  # removed from the local pool, but still owned by this process in Postgres
+
+    async def claim(self, count: int) -> List[str]:
+        """Take ownership of up to `count` slots, adding rows while the table is below `max_size`."""
+        async with self.db.connection() as conn:
+            cursor = await conn.execute(CLAIM_SLOTS, {"owner": self.worker_id, "ttl": self.ownership_ttl,
+                                                      "count": count}, prepare=True)
+            usernames = [row[0] for row in await cursor.fetchall()]
+        missing = count - len(usernames)
+        if missing > 0:
+            async with self.db.connection() as conn:
+                async with conn.transaction():
+                    await conn.execute('SELECT pg_advisory_xact_lock(%s)', (GROW_LOCK_KEY,))
+                    cursor = await conn.execute('SELECT count(*) FROM pool_slots')
+                    room = self.max_size - (await cursor.fetchone())[0]
+                    new_usernames = self.queue.new_usernames(min(missing, max(room, 0)))
+                    if new_usernames:
+                        async with conn.cursor() as cursor:
+                            await cursor.executemany('''
+                                INSERT INTO pool_slots (username, owner, owner_expires_at)
+                                VALUES (%s, %s, now() + make_interval(secs => %s))
+                            ''', [(username, self.worker_id, self.ownership_ttl) for username in new_usernames])
+            usernames.extend(new_usernames)
+        self.claimed.inc(len(usernames))
+        return usernames
+
+    async def give_back(self, usernames: List[str]):
+        """Give up ownership of slots this process no longer needs.
+
+        The slots must already be gone from the local pool. The ones a failed call could not give back are
+        retried by the next call, since the heartbeat would otherwise keep them owned by this process for good.
+        """
+        self.unreturned.extend(usernames)
+        if not self.unreturned:
+            return
+        async with self.db.connection() as conn:
+            await conn.execute('''
+                UPDATE pool_slots SET owner = NULL, owner_expires_at = NULL
+                WHERE owner = %s AND username = ANY(%s)
+            ''', (self.worker_id, self.unreturned), prepare=True)
+        self.given_back.inc(len(self.unreturned))
+        self.unreturned = []
+
+    async def heartbeat(self):
+        """Renew the ownership of this process's slots and drop the ones it lost while it was unreachable."""
+        async with self.db.connection() as conn:
+            cursor = await conn.execute('''
+                UPDATE pool_slots SET owner_expires_at = now() + make_interval(secs => %s)
+                WHERE owner = %s
+                RETURNING username
+            ''', (self.ownership_ttl, self.worker_id), prepare=True)
+            owned = {row[0] for row in await cursor.fetchall()}
+        lost = [username for username in self.slots.usernames() if username not in owned]
+        if lost:
+            self.lost.inc(len(lost))
+            # Another process may hand these usernames out now, so end the local leases too; their chat pages
+            # find out at their next lease heartbeat
+            self.taken_over.inc(sum(1 for username in lost if self.slots.lease_token(username) is not None))
+            self.slots.evict(lost)
+
+    async def resize(self):
+        """Claim or give back slots so the local pool matches what the admission queue needs."""
+        target = self.queue.target_size()
+        capacity = self.slots.capacity
+        if target > capacity:
+            usernames = await self.claim(target - capacity)
+            if usernames:
+                self.slots.grow(usernames)
+                self.queue.resized.inc()
+                self.queue.dispatch()
+        elif target < capacity:
+            # Out of the local pool first, so no visitor leases a slot that another process may claim next
+            usernames = self.slots.shrink(capacity - target)
+            if usernames:
+                self.queue.resized.inc()
+                await self.give_back(usernames)
+        if self.unreturned:
+            await self.give_back([])
+
+    async def run(self):
+        """Resize every `resize_interval` of the admission queue and send heartbeats in between.
+
+        Slots still owned by an earlier process with the same worker id are given back first.
+        """
+        until_heartbeat = 0.0
+        released = False
+        while True:
+            try:
+                if not released:
+                    await self.release_all()
+                    released = True
+                if until_heartbeat <= 0:
+                    await self.heartbeat()
+                    until_heartbeat = self.heartbeat_interval
+                await self.resize()
+            except Exception as e:
+                print(f"Shared pool sync of {self.worker_id} failed: {e}")
+            await asyncio.sleep(self.queue.resize_interval)
+            until_heartbeat -= self.queue.resize_interval
+
+    async def release_all(self):
+        """Give back every slot this worker id owns, e.g. on shutdown, when the chats of this process end."""
+        async with self.db.connection() as conn:
+            await conn.execute('UPDATE pool_slots SET owner = NULL, owner_expires_at = NULL WHERE owner = %s',
+                               (self.worker_id,))
+
+
+def create_shared_pool() -> Optional[SharedSlotPool]:
+    """The shared pool when POOL_SHARED is set, None for a single process with its own pool."""
+    if os.environ.get("POOL_SHARED", "false").lower() != "true":
+        return None
+    return SharedSlotPool(
+        async_user_db,
+        admission_queue,
+        worker_id=os.environ.get("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}",
+        max_size=int(os.environ.get("POOL_SHARED_MAX_SIZE", "200")),
+        ownership_ttl=float(os.environ.get("POOL_OWNERSHIP_TTL", "60")),
+        heartbeat_interval=float(os.environ.get("POOL_HEARTBEAT_INTERVAL", "10")),
+    )
+
+
+shared_pool = create_shared_pool()
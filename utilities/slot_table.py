@@ -0,0 +1,122 @@
+import json
+from typing import Optional, Set
+
+from nicegui import ui
+
+from utilities.slots import SlotAllocator
+
+COLUMNS = [
+    {'name': 'username', 'label': 'User Name', 'field': 'username', 'sortable': True},
+    {'name': 'time_logged', 'label': 'Date & Time', 'field': 'time_logged', 'sortable': True},
+    {'name': 'logged', 'label': 'Logged', 'field': 'logged', 'sortable': True},
+    {'name': 'lease_age', 'label': 'Lease Age (s)', 'field': 'lease_age', 'sortable': True},
+]
+
+STATUS_FILTERS = {'All': None, 'Logged': True, 'Free': False}
+
+# Replaces rows of the table on screen by username, without resending the rest of the page
+PATCH_ROWS = '''
+    const rows = mounted_app.elements["%s"]?.props.rows ?? [];
+    for (const row of %s) {
+        const index = rows.findIndex((old) => old.username === row.username);
+        if (index >= 0) rows[index] = row;
+    }
+'''
+
+
+class SlotTable:
+    """Admin table of user slots that pages, sorts and filters on the server.
+
+    The browser only ever holds one page of rows. Slot changes are collected from the allocator and
+    pushed every `refresh_interval` seconds, and only when they touch the page on screen: just the changed
+    rows, unless the change can move rows across pages.
+    """
+
+    def __init__(self, slots: SlotAllocator, rows_per_page: int = 25, refresh_interval: float = 0.5):
+        self.slots = slots
+        self.search = ''
+        self.logged: Optional[bool] = None
+        self.changed: Set[str] = set()  # usernames changed since the last push
+        self.reload_needed = False
+        self.visible: Set[str] = set()  # usernames on the current page
+
+        with ui.row().classes('w-full items-center gap-4'):
+            ui.input('Search user', on_change=lambda e: self.set_search(e.value)).props('clearable dense')
+            ui.select(list(STATUS_FILTERS), value='All',
+                      on_change=lambda e: self.set_status(STATUS_FILTERS[e.value])).props('dense')
+        self.table = ui.table(
+            columns=COLUMNS,
+            rows=[],
+            row_key='username',
+            pagination={'page': 1, 'rowsPerPage': rows_per_page, 'sortBy': 'username', 'descending': False,
+                        'rowsNumber': 0},
+        ).classes('w-full')
+        self.table.on('request', self._on_request)
+
+        slots.change_listeners.append(self._on_change)
+        ui.context.client.on_delete(lambda: slots.change_listeners.remove(self._on_change))
+        ui.timer(refresh_interval, self.push_changes)
+        self.load()
+
+    def load(self):
+        """Query the current page from the allocator and send it."""
+        pagination = dict(self.table.pagination)
+        rows_per_page = pagination.get('rowsPerPage') or 25
+        total, rows = self.slots.query(
+            offset=(pagination.get('page', 1) - 1) * rows_per_page,
+            limit=rows_per_page,
+            sort_by=pagination.get('sortBy') or 'username',
+            descending=bool(pagination.get('descending')),
+            search=self.search,
+            logged=self.logged,
+        )
+        pagination['rowsNumber'] = total
+        self.visible = {row['username'] for row in rows}
+        self.changed.clear()
+        self.reload_needed = False
+        self.table.pagination = pagination
+        self.table.rows = rows
+        self.table.update()
+
+    def set_search(self, search: Optional[str]):
+        self.search = search or ''
+        self.table.pagination = {**self.table.pagination, 'page': 1}
+        self.load()
+
+    def set_status(self, logged: Optional[bool]):
+        self.logged = logged
+        self.table.pagination = {**self.table.pagination, 'page': 1}
+        self.load()
+
+    def _on_request(self, e):
+        # Quasar asks for another page, page size or sort order
+        self.table.pagination = {**self.table.pagination, **e.args['pagination']}
+        self.load()
+
+    def _on_change(self, username: Optional[str]):
+        if username is None:
+            self.reload_needed = True  # slots added or removed
+        else:
+            self.changed.add(username)
+
+    def push_changes(self):
+        """Send the changes that affect the page on screen, if any."""
+        if not self.reload_needed and not self.changed:
+            return
+        sort_by = self.table.pagination.get('sortBy') or 'username'
+        if self.reload_needed or self.logged is not None or sort_by != 'username':
+            # Slots were added or removed, or a changed lease can move rows in or out of this page
+            self.load()
+            return
+        changed = self.changed & self.visible
+        self.changed.clear()
+        if not changed:
+            return
+        updated = []
+        # The server keeps the same rows as the browser, but an update of the element would resend all of them
+        with self.table._props.suspend_updates():
+            for index, row in enumerate(self.table.rows):
+                if row['username'] in changed:
+                    self.table.rows[index] = self.slots.row(row['username']) or row
+                    updated.append(self.table.rows[index])
+        self.table.client.run_javascript(PATCH_ROWS % (self.table.id, json.dumps(updated, default=str)))
@@ -0,0 +1,363 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from utilities import metrics
+from utilities.pool_log import Change, PoolLog
+
+
+class TimerWheel:
+    """Hashed timer wheel: scheduling is O(1) and each tick only touches the entries due in its bucket.
+
+    Deadlines further away than one turn of the wheel stay in their bucket until their round comes up.
+    """
+
+    def __init__(self, tick: float = 1.0, size: int = 512):
+        self.tick = tick
+        self.buckets: List[list] = [[] for _ in range(size)]
+        self.current = int(time.monotonic() / tick)
+
+    def schedule(self, item: Hashable, deadline: float):
+        """Schedule `item` to be returned by the first `advance` at or after monotonic time `deadline`."""
+        due_tick = max(int(deadline / self.tick), self.current + 1)
+        self.buckets[due_tick % len(self.buckets)].append((due_tick, item))
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Move the wheel to `now` and return the items that became due."""
+        target = int(now / self.tick)
+        due = []
+        for step in range(1, min(target - self.current, len(self.buckets)) + 1):
+            index = (self.current + step) % len(self.buckets)
+            waiting = []
+            for due_tick, item in self.buckets[index]:
+                if due_tick <= target:
+                    due.append(item)
+                else:
+                    waiting.append((due_tick, item))
+            self.buckets[index] = waiting
+        self.current = max(self.current, target)
+        return due
+
+
+class Lease:
+    __slots__ = ('leased_at', 'deadline', 'scheduled', 'generation')
+
+    def __init__(self, deadline: float, generation: int):
+        self.leased_at = datetime.now()
+        self.deadline = deadline  # monotonic time the lease expires
+        self.scheduled = deadline  # deadline of the lease's live timer wheel entry
+        self.generation = generation
+
+
+class SlotAllocator:
+    """Pool of user slots leased from an in-memory free list.
+
+    Leasing and releasing are O(1) and happen under a lock, so two concurrent page loads can never
+    get the same slot. Every lease expires `lease_ttl` seconds after its last renewal; a reaper driven
+    by a timer wheel reclaims expired leases without scanning the pool. Changes are recorded as they
+    happen and persisted by appending them to a PoolLog, so saving one status change costs the same
+    whatever the size of the pool.
+    """
+
+    def __init__(self, lease_ttl: float = 120.0, reap_interval: float = 1.0):
+        self.lease_ttl = lease_ttl
+        self.reap_interval = reap_interval
+        self._lock = threading.Lock()
+        self._slots: Dict[str, Optional[Lease]] = {}  # username -> lease, None while free
+        # Status indexes, ordered sets: free slots longest free first, leased slots
+        self._free: 'OrderedDict[str, None]' = OrderedDict()
+        self._leased: Dict[str, None] = {}
+        self._wheel = TimerWheel(tick=reap_interval)
+        self._generation = 0
+        self._changes: List[Change] = []  # not persisted yet
+        self._rebuilt = False  # the pool was replaced since the last persist
+        self.release_listeners: List[Callable[[str, float], None]] = []  # called with username and seconds held
+        self.change_listeners: List[Callable[[Optional[str]], None]] = []  # called with the username, None for all
+        self.rebuild_listeners: List[Callable[[], None]] = []  # called once the pool was replaced and every lease ended
+        self.reclaimed = metrics.counter('slot_leases_reclaimed_total')
+        metrics.gauge('slot_pool_capacity', lambda: self.capacity)
+        metrics.gauge('slot_pool_available', lambda: self.available)
+
+    def _notify_changed(self, username: Optional[str]):
+        for listener in self.change_listeners:
+            listener(username)
+
+    def rebuild(self, usernames: Iterable[str]):
+        """Replace the pool with new, free slots."""
+        with self._lock:
+            self._slots = {username: None for username in usernames}
+            self._free = OrderedDict.fromkeys(self._slots)
+            self._leased = {}
+            self._changes = []
+            self._rebuilt = True
+        self._notify_changed(None)
+        for listener in self.rebuild_listeners:
+            listener()
+
+    def restore(self, snapshot: dict):
+        """Load the slots of a snapshot. Leases are dropped, their sessions did not survive the restart."""
+        self.rebuild(snapshot.get("users", []))
+
+    def _start_lease(self, username: str):
+        self._generation += 1
+        lease = Lease(time.monotonic() + self.lease_ttl, self._generation)
+        self._slots[username] = lease
+        self._leased[username] = None
+        self._wheel.schedule((username, lease.generation, lease.scheduled), lease.deadline)
+        self._changes.append(('lease', username, lease.leased_at.isoformat()))
+
+    def lease(self) -> Optional[str]:
+        """Lease a free slot and return its username, or None if all slots are taken."""
+        with self._lock:
+            if not self._free:
+                return None
+            username, _ = self._free.popitem(last=False)
+            self._start_lease(username)
+        self._notify_changed(username)
+        return username
+
+    def acquire(self, username: str) -> bool:
+        """Lease a specific slot; False if it does not exist or is already leased."""
+        with self._lock:
+            if username not in self._slots or self._slots[username] is not None:
+                return False
+            del self._free[username]
+            self._start_lease(username)
+        self._notify_changed(username)
+        return True
+
+    def lease_token(self, username: str) -> Optional[int]:
+        """Token of the current lease of a slot, None while it is free.
+
+        Passed to `renew` and `release`, it keeps the holder of an earlier lease from touching a later one.
+        """
+        lease = self._slots.get(username)
+        return lease.generation if lease else None
+
+    def renew(self, username: str, ttl: Optional[float] = None, token: Optional[int] = None) -> bool:
+        """Heartbeat: push the expiry of a lease `ttl` seconds (default `lease_ttl`) into the future.
+
+        Returns False if the slot is not leased, or no longer under the lease of `token`.
+        """
+        with self._lock:
+            lease = self._slots.get(username)
+            if lease is None or (token is not None and lease.generation != token):
+                return False
+            lease.deadline = time.monotonic() + (self.lease_ttl if ttl is None else ttl)
+            # A later deadline leaves the wheel entry alone, the reaper reschedules it when it fires;
+            # an earlier one needs a new entry, which supersedes the old
+            if lease.deadline < lease.scheduled:
+                lease.scheduled = lease.deadline
+                self._wheel.schedule((username, lease.generation, lease.scheduled), lease.deadline)
+        return True
+
+    def release(self, username: str, token: Optional[int] = None):
+        """Return a leased slot to the free list; with a `token`, only if the slot is still under that lease."""
+        with self._lock:
+            released = self._release(username, token)
+        self._notify_released([released] if released else [])
+
+    def _release(self, username: str, token: Optional[int] = None) -> Optional[tuple]:
+        lease = self._slots.get(username)
+        if lease is None or (token is not None and lease.generation != token):
+            return None
+        self._slots[username] = None
+        del self._leased[username]
+        self._free[username] = None
+        self._changes.append(('free', username, None))
+        return username, (datetime.now() - lease.leased_at).total_seconds()
+
+    def _notify_released(self, released: List[tuple]):
+        # Outside the lock, so listeners may lease again
+        for username, held in released:
+            self._notify_changed(username)
+            for listener in self.release_listeners:
+                listener(username, held)
+
+    def reap(self) -> int:
+        """Reclaim the leases whose deadline has passed and return how many were reclaimed."""
+        now = time.monotonic()
+        released = []
+        with self._lock:
+            for username, generation, scheduled in self._wheel.advance(now):
+                lease = self._slots.get(username)
+                if lease is None or lease.generation != generation or lease.scheduled != scheduled:
+                    continue  # released, leased again or rescheduled since this entry was added
+                if lease.deadline <= now:
+                    released.append(self._release(username))
+                else:
+                    lease.scheduled = lease.deadline
+                    self._wheel.schedule((username, generation, lease.scheduled), lease.deadline)
+        self.reclaimed.inc(len(released))
+        self._notify_released(released)
+        return len(released)
+
+    def reset(self):
+        """Release every slot."""
+        self.rebuild(list(self._slots))
+
+    def grow(self, usernames: Iterable[str]):
+        """Add new, free slots to the pool."""
+        with self._lock:
+            for username in usernames:
+                if username not in self._slots:
+                    self._slots[username] = None
+                    self._free[username] = None
+                    self._changes.append(('add', username, None))
+        self._notify_changed(None)
+
+    def shrink(self, count: int) -> List[str]:
+        """Remove up to `count` free slots, newest first, and return their usernames; leased slots are never removed."""
+        with self._lock:
+            removed = []
+            while self._free and len(removed) < count:
+                username, _ = self._free.popitem()
+                removed.append(self._remove(username))
+        if removed:
+            self._notify_changed(None)
+        return removed
+
+    def remove(self, usernames: Iterable[str]) -> List[str]:
+        """Remove the given slots if they are free and return the usernames that were removed."""
+        with self._lock:
+            removed = [self._remove(username) for username in usernames if username in self._free]
+            for username in removed:
+                del self._free[username]
+        if removed:
+            self._notify_changed(None)
+        return removed
+
+    def evict(self, usernames: Iterable[str]) -> List[str]:
+        """Remove the given slots, ending their leases, and return the usernames that were removed."""
+        with self._lock:
+            released = [self._release(username) for username in usernames if self._slots.get(username)]
+            removed = [self._remove(username) for username in usernames if username in self._free]
+            for username in removed:
+                del self._free[username]
+        # Release listeners learn about the ended leases after the slots are gone, so they cannot lease them again
+        self._notify_released(released)
+        if removed:
+            self._notify_changed(None)
+        return removed
+
+    def _remove(self, username: str) -> str:
+        del self._slots[username]
+        self._changes.append(('remove', username, None))
+        return username
+
+    def usernames(self) -> List[str]:
+        return list(self._slots)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._slots)
+
+    @property
+    def available(self) -> int:
+        return len(self._free)
+
+    @property
+    def in_use(self) -> int:
+        return len(self._slots) - len(self._free)
+
+    @staticmethod
+    def _row(username: str, lease: Optional[Lease], now: datetime) -> Dict[str, Any]:
+        return {
+            "username": username,
+            "time_logged": lease.leased_at.isoformat() if lease else None,
+            "logged": lease is not None,
+            "lease_age": int((now - lease.leased_at).total_seconds()) if lease else None,
+        }
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row per slot, shaped like the old user_list entries plus the lease age in seconds."""
+        now = datetime.now()
+        return [self._row(username, lease, now) for username, lease in list(self._slots.items())]
+
+    def row(self, username: str) -> Optional[Dict[str, Any]]:
+        """The row of one slot, None if there is no such slot."""
+        if username not in self._slots:
+            return None
+        return self._row(username, self._slots.get(username), datetime.now())
+
+    def query(self, offset: int, limit: int, sort_by: str = 'username', descending: bool = False,
+              search: str = '', logged: Optional[bool] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """One page of rows, filtered by username substring and lease state, plus the number of matching slots.
+
+        Only the rows of the requested page are built.
+        """
+        if logged is None:
+            candidates = list(self._slots.items())
+        else:
+            # Only walk the slots with the requested status
+            candidates = [(username, self._slots.get(username))
+                          for username in list(self._leased if logged else self._free)]
+        slots = [(username, lease) for username, lease in candidates if not search or search in username]
+        if sort_by == 'username':
+            slots.sort(key=lambda slot: slot[0], reverse=descending)
+        elif sort_by == 'logged':
+            slots.sort(key=lambda slot: (slot[1] is not None, slot[0]), reverse=descending)
+        elif sort_by in ('time_logged', 'lease_age'):
+            # The oldest lease has the earliest time and the largest age; free slots go last either way
+            leased = sorted((slot for slot in slots if slot[1]), key=lambda slot: slot[1].leased_at,
+                            reverse=descending == (sort_by == 'time_logged'))
+            slots = leased + [slot for slot in slots if not slot[1]]
+        now = datetime.now()
+        return len(slots), [self._row(username, lease, now) for username, lease in slots[offset:offset + limit]]
+
+    def _snapshot(self) -> dict:
+        return {
+            "users": list(self._slots),
+            "leased": {username: self._slots[username].leased_at.isoformat() for username in self._leased},
+        }
+
+    def snapshot(self) -> dict:
+        """Compact, JSON-serializable state of the pool."""
+        with self._lock:
+            return self._snapshot()
+
+    def persist(self, log: PoolLog):
+        """Append the changes since the last call to `log`, or compact it if the pool was replaced or it grew long."""
+        with self._lock:
+            changes, self._changes = self._changes, []
+            snapshot = None
+            if self._rebuilt or log.should_compact(len(changes), len(self._slots)):
+                snapshot = self._snapshot()
+                self._rebuilt = False
+        try:
+            if snapshot is not None:
+                log.compact(snapshot)
+            elif changes:
+                log.append(changes)
+        except OSError:
+            # Keep them for the next attempt; replaying a change twice is harmless
+            with self._lock:
+                self._changes = changes + self._changes
+                self._rebuilt = self._rebuilt or snapshot is not None
+            raise
+
+    async def persist_periodically(self, log: PoolLog, interval: float = 2.0):
+        """Persist the changes of the pool every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.persist(log)
+            except OSError as e:
+                print(f"Persisting the user pool failed: {e}")
+
+    async def reap_periodically(self):
+        """Run the reaper once per wheel tick."""
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            self.reap()
+
+
+# Shared pool of user slots for the chat page
+user_slots = SlotAllocator(
+    lease_ttl=float(os.environ.get("LEASE_TTL", "120")),
+    reap_interval=float(os.environ.get("LEASE_REAP_INTERVAL", "1")),
+)
@@ -1,13 +1,20 @@
+import os
 import uuid
 import datetime
 import random
 from datetime import datetime, timedelta
 from nicegui import app, ui
-# Initialize list of 25 sample users with conversation histories
-def initialize_users():
+from utilities.slots import user_slots
+
+# How often a connected chat renews its lease, and how long a disconnected one keeps it
+LEASE_HEARTBEAT_INTERVAL = float(os.environ.get("LEASE_HEARTBEAT_INTERVAL", "30"))
+LEASE_DISCONNECT_GRACE = float(os.environ.get("LEASE_DISCONNECT_GRACE", "30"))
+
+# Initialize list of sample users with conversation histories
+def initialize_users(count=25):
     users = {}
     
-    for _ in range(25):    
+    for _ in range(count):    
         username = f"user_{str(uuid.uuid4())}"
         
         # Create user entry
@@ -21,20 +28,40 @@ def initialize_users():
 
 # get a user from the pool
 def find_user_from_pool():
-    for username, user_data in app.storage.general['user_list'].items():
-        if not user_data.get('logged', False):
-            user_data['logged'] = True
-            user_data['time_logged'] = datetime.now().isoformat()
-
-            # Update global storage
-            app.storage.general['user_list'][username] = user_data
-            return username
-    return None
+    return user_slots.lease()
 
 # update the status of a user
 def update_user_status(username, status):
-    app.storage.general['user_list'][username]['logged'] = status
     if status == True:
-        app.storage.general['user_list'][username]['time_logged'] = datetime.now().isoformat()
+        user_slots.acquire(username)
     else:
-        app.storage.general['user_list'][username]['time_logged'] = None
+        user_slots.release(username)
+
+# keep the lease of a user alive while the current browser stays connected, and return its token;
+# only this lease is renewed, so a stale tab cannot stretch or cut short the lease of the username's next holder
+def hold_user_lease(username):
+    token = user_slots.lease_token(username)
+    if token is None:
+        return None
+
+    def heartbeat():
+        if not user_slots.renew(username, token=token):
+            # Reaped, reset by an admin or taken over by another process: someone else may get this username now
+            timer.deactivate()
+            lease_ended_dialog()
+
+    timer = ui.timer(LEASE_HEARTBEAT_INTERVAL, heartbeat)
+    client = ui.context.client
+    client.on_connect(lambda: user_slots.renew(username, token=token))
+    client.on_disconnect(lambda: user_slots.renew(username, ttl=LEASE_DISCONNECT_GRACE, token=token))
+    return token
+
+# tell the visitor their user slot is gone and let them start over with a new one
+def lease_ended_dialog():
+    with ui.dialog().props('persistent') as dialog:
+        with ui.card():
+            ui.label('Your chat session has ended').classes('text-h6 q-mb-md')
+            with ui.row().classes('w-full justify-end gap-2'):
+                ui.button('Start a new chat', on_click=lambda: ui.navigate.to('/chat')) \
+                    .classes('bg-blue-500 text-white')
+    dialog.open()